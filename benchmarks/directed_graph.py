@@ -0,0 +1,53 @@
+import random
+import sys
+import time
+from uatu.core.directed_graph import DirectedGraph
+
+
+def random_dag(
+    num_nodes: int, degree: int, window: int = 100, seed: int = 0
+) -> DirectedGraph:
+    # Arcs only go from lower to higher ids, so the graph is acyclic. Keeping
+    # them within a window yields long, densely connected lineage chains.
+    rng = random.Random(seed)
+    graph = DirectedGraph()
+    graph.add_nodes(range(num_nodes))
+    for start in range(num_nodes - 1):
+        for _ in range(degree):
+            end = min(start + rng.randint(1, window), num_nodes - 1)
+            graph.add_arc(start, end)
+    return graph
+
+
+def timed(name: str, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{name:<28}{time.perf_counter() - start:>10.3f}s")
+    return result
+
+
+if __name__ == "__main__":
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    graph = timed("build", random_dag, num_nodes, 3)
+    first, last = 0, num_nodes - 1
+    timed("descendants", graph.descendants, first)
+    timed("ancestors", graph.ancestors, last)
+    timed("shortest_path", graph.shortest_path, first, last)
+    timed("topological_order", graph.topological_order)
+    timed("find_cycle", graph.find_cycle)
+    timed("find_path(max_paths=1000)", graph.find_path, first, last, max_paths=1000)
+    frozen = timed("freeze", graph.freeze)
+    size = sum(
+        len(arr) * arr.itemsize
+        for arr in (
+            frozen._offsets,
+            frozen._targets,
+            frozen._reverse_offsets,
+            frozen._sources,
+        )
+    )
+    print(f"frozen arrays: {len(frozen._targets)} arcs in {size / 2 ** 20:.1f} MiB")
+    timed("frozen descendants", frozen.descendants, first)
+    timed("frozen ancestors", frozen.ancestors, last)
+    timed("frozen topological_order", frozen.topological_order)
+    timed("delete_arcs", graph.delete_arcs, first, last)
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import subprocess
+from uatu.cli.client import NO_SERVER_ENV, SERVER_SOCKET
+
+# Run from an initialized project: python benchmarks/server.py <node id>
+UATU = [sys.executable, "-c", "from uatu.cli.client import main; main()"]
+
+
+def median_time(command, env=None, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        times.append(time.perf_counter() - start)
+    return sorted(times)[repeat // 2]
+
+
+if __name__ == "__main__":
+    node_id = sys.argv[1]
+    commands = [
+        ["node", "ls", node_id],
+        ["lineage", node_id],
+        ["lineage", node_id, "--depth", "3"],
+        ["lineage", node_id, "--upstream"],
+    ]
+    local_env = dict(os.environ, **{NO_SERVER_ENV: "1"})
+    print(f"{'python -c pass':<48}{median_time([sys.executable, '-c', 'pass']):>8.3f}s")
+    server = subprocess.Popen(UATU + ["server"], stdout=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        while not os.path.exists(SERVER_SOCKET):
+            time.sleep(0.01)
+        print(f"{'server start':<48}{time.perf_counter() - start:>8.3f}s")
+        for args in commands:
+            name = "uatu " + " ".join(args)
+            local = median_time(UATU + args, local_env)
+            forwarded = median_time(UATU + args)
+            print(f"{name:<48}{local:>8.3f}s{forwarded:>8.3f}s with server")
+    finally:
+        server.terminate()
+        server.wait()
@@ -8,8 +8,11 @@ setup(
     install_requires=[
         'Click',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     entry_points='''
         [console_scripts]
-        uatu=uatu.cli.base:cli
+        uatu=uatu.cli.client:main
     ''',
 )
\ No newline at end of file
@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import subprocess
+from .utils import repo, project
+
+# Uatu modules `uatu file ls` may load: the CLI entry, the file commands and
+# the database, which trims the lineage log when it opens, none of the other
+# commands or the run or sweep code
+FILE_LS_MODULES = {
+    "uatu",
+    "uatu.cli",
+    "uatu.cli.base",
+    "uatu.cli.diagrams",
+    "uatu.cli.file",
+    "uatu.core",
+    "uatu.core.database",
+    "uatu.core.directed_graph",
+    "uatu.core.git",
+    "uatu.core.init",
+    "uatu.core.lineage",
+    "uatu.core.logger",
+    "uatu.core.migrations",
+    "uatu.core.orm",
+    "uatu.core.utils",
+}
+
+DRIVER = """
+import sys, json
+from uatu.cli.base import cli
+try:
+    cli(sys.argv[1:], prog_name="uatu")
+except SystemExit:
+    pass
+heavy = ("sqlalchemy", "git", "tabulate", "numpy", "yaml")
+print(json.dumps([
+    sorted(name for name in heavy if name in sys.modules),
+    sorted(name for name in sys.modules if name.split(".")[0] == "uatu"),
+]))
+"""
+
+
+def run_cli(*args, cwd=None):
+    # Output of `uatu <args>`, the heavy packages and the uatu modules it loaded
+    process = subprocess.run(
+        [sys.executable, "-c", DRIVER, *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    *output, modules = process.stdout.splitlines()
+    heavy, uatu = json.loads(modules)
+    return output, heavy, set(uatu)
+
+
+def test_help_imports_nothing_heavy(tmp_path):
+    output, heavy, uatu = run_cli("--help", cwd=tmp_path)
+    assert "sweep" in "".join(output)
+    assert heavy == []
+    assert not any(name.startswith("uatu.cli.") for name in uatu - {"uatu.cli.base"})
+    # Neither the project check nor the database run for a subcommand's help
+    run_cli("lineage", "--help", cwd=tmp_path)
+    assert not os.path.exists(tmp_path / ".uatu")
+
+
+def test_file_ls_imports(project):
+    repo, _ = project
+    output, heavy, uatu = run_cli("file", "ls", cwd=repo.working_dir)
+    assert output == []
+    # SQLAlchemy and the config are the whole cost, GitPython is never loaded
+    assert heavy == ["sqlalchemy", "yaml"]
+    assert uatu <= FILE_LS_MODULES
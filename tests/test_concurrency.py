@@ -0,0 +1,123 @@
+import os
+import json
+import threading
+import multiprocessing
+from git import Repo
+from uatu.core.run import Run
+from uatu.core.utils import dump_json
+from uatu.core.orm import Experiment
+from uatu.core.database import (
+    initialize_db,
+    transaction,
+    get_pipeline,
+    get_node,
+    add_edge,
+    add_experiment_values,
+)
+from .utils import repo, commit_files
+
+NUM_WORKERS = 8
+NUM_EXPERIMENTS = 10
+
+
+def record_experiments(db_file: str, worker: int):
+    sess = initialize_db(db_file)
+    for i in range(NUM_EXPERIMENTS):
+        with transaction(sess):
+            file_lists = [["data.txt"], [f"train_{worker}.py"], [f"model_{worker}.bin"]]
+            pipeline = get_pipeline(sess, file_lists=file_lists)
+            nodes = [
+                get_node(sess, file_path=file_list[0], commit_id=f"{worker}-{i}")
+                for file_list in file_lists
+            ]
+            add_edge(sess, nodes[0], nodes[1])
+            add_edge(sess, nodes[1], nodes[2])
+            experiment_id = f"{worker}-{i}"
+            sess.add(
+                Experiment(id=experiment_id, description="d", pipeline_id=pipeline.id)
+            )
+            add_experiment_values(sess, experiment_id, metrics={"worker": worker})
+    sess.close()
+
+
+def test_parallel_writers(tmp_path):
+    db_file = str(tmp_path / "uatu.db")
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=record_experiments, args=(db_file, worker))
+        for worker in range(NUM_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * NUM_WORKERS
+
+    sess = initialize_db(db_file)
+    assert sess.query(Experiment).count() == NUM_WORKERS * NUM_EXPERIMENTS
+    sess.close()
+
+
+def test_threads_dump_same_file(tmp_path):
+    file_path = str(tmp_path / "state.json")
+    errors = []
+
+    def dump(value):
+        try:
+            for _ in range(200):
+                dump_json({"value": value, "padding": "x" * 10000}, file_path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=dump, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(file_path) as f:
+        assert json.load(f)["value"] in range(4)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["state.json"]
+
+
+def save_run(repo_dir: str, db_file: str, worker: int, start):
+    # Like a training script ending at the same time as the others
+    os.chdir(repo_dir)
+    repo, sess = Repo(repo_dir), initialize_db(db_file)
+    with open(f"model_{worker}.bin", "w") as f:
+        f.write(str(worker))
+    start.wait()
+    run = Run(["data.txt"], [f"model_{worker}.bin"])
+    run.save(
+        f"train_{worker}.py", {"worker": worker}, f"run {worker}", sess=sess, repo=repo
+    )
+    sess.close()
+
+
+def test_parallel_runs_commit(repo, tmp_path):
+    db_file = str(tmp_path / "uatu.db")
+    initialize_db(db_file).close()
+    commit_files(
+        repo,
+        {"data.txt": "x", **{f"train_{i}.py": "pass" for i in range(NUM_WORKERS)}},
+    )
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(NUM_WORKERS)
+    workers = [
+        context.Process(
+            target=save_run, args=(repo.working_dir, db_file, worker, start)
+        )
+        for worker in range(NUM_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * NUM_WORKERS
+
+    sess = initialize_db(db_file)
+    assert sess.query(Experiment).count() == NUM_WORKERS
+    sess.close()
+    # One commit of its model per run, after the initial one
+    assert len(list(repo.iter_commits())) == NUM_WORKERS + 1
+    assert repo.is_dirty(untracked_files=True) is False
@@ -0,0 +1,275 @@
+import os
+import sqlite3
+import pytest
+from sqlalchemy import event, text
+from uatu.core.orm import (
+    Edge,
+    Experiment,
+    File,
+    ExperimentNode,
+    Pipeline,
+    PipelineFile,
+    Record,
+    FILE_LEVEL,
+    RECORD_LEVEL,
+)
+from uatu.core.migrations import SCHEMA_VERSION
+from uatu.core.database import (
+    initialize_db,
+    get_file,
+    get_node,
+    add_edge,
+    delete_edge,
+    get_lineage,
+    delete_node,
+    delete_file,
+    get_pipeline,
+    add_experiment_values,
+    query_experiments,
+    get_experiment_values,
+    get_experiment,
+    delete_experiment,
+    transaction,
+    iter_pages,
+    query_files,
+    query_nodes,
+    query_pipelines,
+)
+from .utils import sess, repo, commit_files
+
+
+def test_add_and_delete_edge(sess):
+    data = get_file(sess, file_path="data.txt")
+    script = get_file(sess, file_path="train.py")
+    add_edge(sess, data, script)
+    add_edge(sess, data, script)
+    assert data.successor_ids == [script.id]
+    assert script.predecessor_ids == [data.id]
+    assert sess.query(Edge).count() == 1
+
+    delete_edge(sess, data, script)
+    assert data.successor_ids == []
+    assert script.predecessor_ids == []
+    assert sess.query(Edge).count() == 0
+
+
+def test_edge_levels_are_separate(sess):
+    data = get_node(sess, file_path="data.txt", commit_id="a" * 40)
+    script = get_node(sess, file_path="train.py", commit_id="a" * 40)
+    add_edge(sess, data, script)
+    assert data.successor_ids == [script.id]
+    assert data.file.successor_ids == []
+
+    delete_node(sess, node=data)
+    assert sess.query(Edge).filter_by(level=RECORD_LEVEL).count() == 0
+
+
+def test_get_lineage(sess):
+    files = [get_file(sess, file_path=f"{i}.txt") for i in range(5)]
+    for predecessor, successor in zip(files, files[1:]):
+        add_edge(sess, predecessor, successor)
+    add_edge(sess, files[4], files[1])
+    add_edge(sess, files[0], files[2])
+    ids = [file_.id for file_ in files]
+
+    assert set(get_lineage(sess, ids[0], FILE_LEVEL)) == set(ids[1:])
+    assert set(get_lineage(sess, ids[0], FILE_LEVEL, max_depth=1)) == set(ids[1:3])
+    assert set(get_lineage(sess, ids[2], FILE_LEVEL, upstream=True)) == set(ids) - {
+        ids[2]
+    }
+    assert set(get_lineage(sess, ids[2], FILE_LEVEL, True, 1)) == {ids[0], ids[1]}
+    assert list(get_lineage(sess, ids[0], RECORD_LEVEL)) == []
+
+
+def test_migrate_json_adjacency(tmp_path):
+    db_file = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_file)
+    conn.executescript("""
+        CREATE TABLE files (
+            id VARCHAR(8) PRIMARY KEY, path VARCHAR(64) NOT NULL UNIQUE,
+            predecessor_ids TEXT, successor_ids TEXT
+        );
+        CREATE TABLE "Records" (
+            id VARCHAR(16) PRIMARY KEY, file_id VARCHAR(8) REFERENCES files (id),
+            commit_id VARCHAR(40) NOT NULL, predecessor_ids TEXT, successor_ids TEXT
+        );
+        INSERT INTO files VALUES ('f1', 'data.txt', '[]', '["f2"]');
+        INSERT INTO files VALUES ('f2', 'train.py', '["f1"]', '[]');
+        INSERT INTO "Records" VALUES ('r1', 'f1', 'c1', '[]', '["r2"]');
+        INSERT INTO "Records" VALUES ('r2', 'f2', 'c1', '["r1"]', '[]');
+        """)
+    conn.commit()
+    conn.close()
+
+    session = initialize_db(db_file)
+    edges = {
+        (edge.level, edge.predecessor_id, edge.successor_id)
+        for edge in session.query(Edge)
+    }
+    assert edges == {(FILE_LEVEL, "f1", "f2"), (RECORD_LEVEL, "r1", "r2")}
+    assert get_file(session, file_id="f2", create=False).predecessor_ids == ["f1"]
+    version = session.execute(text("PRAGMA user_version")).scalar()
+    assert version == SCHEMA_VERSION
+    session.close()
+
+
+def test_transaction_commits_once(sess):
+    commits = []
+    event.listen(sess, "after_commit", lambda session: commits.append(session))
+    with transaction(sess):
+        data = get_file(sess, file_path="data.txt")
+        with transaction(sess):
+            script = get_file(sess, file_path="train.py")
+            add_edge(sess, data, script)
+        assert commits == []
+    assert len(commits) == 1
+    assert script.predecessor_ids == [data.id]
+
+
+def test_transaction_rolls_back(sess):
+    with pytest.raises(RuntimeError):
+        with transaction(sess):
+            get_file(sess, file_path="data.txt")
+            raise RuntimeError
+    assert get_file(sess, file_path="data.txt", create=False) is None
+
+
+def test_delete_file_cascades(sess):
+    file_lists = [["data.txt"], ["train.py"], ["model.bin"]]
+    pipeline_id = get_pipeline(sess, file_lists=file_lists).id
+    other_id = get_pipeline(sess, file_lists=[["train.py"], ["report.txt"]]).id
+    nodes = [get_node(sess, file_path=p[0], commit_id="c" * 40) for p in file_lists]
+    with transaction(sess):
+        sess.add(Experiment(id="e1", description="d", pipeline_id=pipeline_id))
+        for stage, node in enumerate(nodes):
+            sess.add(ExperimentNode(experiment_id="e1", stage=stage, node_id=node.id))
+        add_edge(sess, nodes[0], nodes[1])
+        add_edge(sess, nodes[1], nodes[2])
+
+    delete_file(sess, file_path="data.txt")
+    assert sess.query(Pipeline).filter_by(id=pipeline_id).first() is None
+    assert sess.query(Pipeline).filter_by(id=other_id).first() is not None
+    assert sess.query(Experiment).count() == 0
+    assert sess.query(ExperimentNode).count() == 0
+    assert sess.query(PipelineFile).filter_by(pipeline_id=pipeline_id).count() == 0
+    assert sess.query(Record).count() == 2
+    assert sess.query(Edge).filter_by(level=RECORD_LEVEL).count() == 0
+    file_edges = sess.query(Edge).filter_by(level=FILE_LEVEL).all()
+    assert [(e.predecessor_id, e.successor_id) for e in file_edges] == [
+        (
+            get_file(sess, file_path="train.py").id,
+            get_file(sess, file_path="report.txt").id,
+        )
+    ]
+
+
+def test_iter_pages_batches_relationships(sess):
+    nodes = [get_node(sess, file_path=f"{i}.txt", commit_id="c" * 40) for i in range(7)]
+    for predecessor, successor in zip(nodes, nodes[1:]):
+        add_edge(sess, predecessor, successor)
+    pipeline = get_pipeline(sess, file_lists=[["0.txt"], ["1.txt"]])
+    sess.add(Experiment(id="e1", description="d", pipeline_id=pipeline.id))
+    sess.commit()
+    sess.expire_all()
+
+    statements = []
+    event.listen(
+        sess.bind,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    pages = list(iter_pages(query_nodes(sess), Record.id, page_size=3))
+    rows = [
+        (node.id, node.file.path, node.predecessor_ids, node.successor_ids)
+        for page in pages
+        for node in page
+    ]
+    # One query per page and per relationship, none per row
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert len(statements) == 3 * 4
+    assert sorted(rows) == sorted(
+        (node.id, node.file.path, node.predecessor_ids, node.successor_ids)
+        for node in nodes
+    )
+
+    ids = sorted(node.id for node in nodes)
+    pages = iter_pages(query_nodes(sess), Record.id, limit=3, offset=2, page_size=2)
+    assert [[node.id for node in page] for page in pages] == [ids[2:4], ids[4:5]]
+    files = [file_ for page in iter_pages(query_files(sess), File.id) for file_ in page]
+    assert sorted(len(file_.records) for file_ in files) == [1] * 7
+    (pipelines,) = iter_pages(query_pipelines(sess, [pipeline.id]), Pipeline.id)
+    assert [experiment.id for experiment in pipelines[0].experiments] == ["e1"]
+
+
+def test_get_pipeline_by_fingerprint(sess):
+    pipeline = get_pipeline(sess, file_lists=[["a.txt", "b.txt"], ["train.py"]])
+    same = get_pipeline(sess, file_lists=[["b.txt", "a.txt"], ["train.py"]])
+    assert same.id == pipeline.id
+    assert len(pipeline.fingerprint) == 64
+    assert (
+        get_pipeline(sess, file_lists=[["a.txt"], ["train.py"]], create=False) is None
+    )
+    assert (
+        get_pipeline(sess, file_lists=[["c.txt"], ["train.py"]], create=False) is None
+    )
+    assert get_file(sess, file_path="c.txt", create=False) is None
+
+
+def test_query_experiments(sess):
+    pipeline_id = get_pipeline(sess, file_lists=[["train.py"]]).id
+    runs = {
+        "e1": ({"lr": 1e-2, "optim": "sgd"}, {"val_acc": 0.7}),
+        "e2": ({"lr": 1e-4, "optim": "adam"}, {"val_acc": 0.9}),
+        "e3": ({"lr": 5e-4, "optim": "sgd"}, {"val_acc": 0.8}),
+        "e4": ({"lr": 1e-5, "nested": {"depth": 3}}, {}),
+    }
+    with transaction(sess):
+        for experiment_id, (hparams, metrics) in runs.items():
+            sess.add(
+                Experiment(id=experiment_id, description="d", pipeline_id=pipeline_id)
+            )
+            add_experiment_values(sess, experiment_id, hparams=hparams, metrics=metrics)
+
+    experiments = query_experiments(
+        sess, [("hparams.lr", "<", 1e-3)], order_by="metrics.val_acc", descending=True
+    )
+    assert [experiment.id for experiment in experiments] == ["e2", "e3"]
+    experiments = query_experiments(
+        sess, [("hparams.optim", "=", "sgd")], order_by="hparams.lr", limit=1
+    )
+    assert [experiment.id for experiment in experiments] == ["e3"]
+    assert [
+        e.id for e in query_experiments(sess, [("hparams.nested.depth", ">=", 3)])
+    ] == ["e4"]
+    values = get_experiment_values(sess, ["e1", "e4"], ["hparams.optim"])
+    assert values == {"e1": {"hparams.optim": "sgd"}, "e4": {}}
+
+    delete_experiment(sess, expr_id="e1")
+    assert get_experiment_values(sess, ["e1"]) == {"e1": {}}
+
+
+def test_get_experiment_commits_once(sess, repo):
+    initial = commit_files(repo, {"data.txt": "data"}, "initial")
+    for path, content in {"train.py": "print()", "out.txt": "1"}.items():
+        with open(os.path.join(repo.working_dir, path), "w") as f:
+            f.write(content)
+    file_lists = [["data.txt"], ["train.py"], ["out.txt"]]
+
+    experiment = get_experiment(
+        sess, repo, description="first", file_lists=file_lists, metrics={"acc": 1}
+    )
+    head = repo.head.commit
+    assert head.message.strip() == "first"
+    assert sorted(head.stats.files) == ["out.txt", "train.py"]
+    nodes = sess.query(ExperimentNode).filter_by(experiment_id=experiment.id)
+    commit_ids = {
+        node.stage: get_node(sess, node_id=node.node_id).commit_id for node in nodes
+    }
+    assert commit_ids == {0: initial, 1: head.hexsha, 2: head.hexsha}
+
+    with open(os.path.join(repo.working_dir, "out.txt"), "w") as f:
+        f.write("2")
+    get_experiment(sess, repo, description="second", file_lists=file_lists)
+    assert list(repo.head.commit.stats.files) == ["out.txt"]
+    assert len(list(repo.iter_commits())) == 3
+    assert sess.query(Record).count() == 4
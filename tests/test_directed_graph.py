@@ -1,3 +1,4 @@
+import pytest
 from uatu.core.directed_graph import DirectedGraph
 from .utils import random_graph
 
@@ -6,6 +7,110 @@ def test_initialize(random_graph: DirectedGraph):
     print()
     print(random_graph._graph)
 
+
 def test_find_path(random_graph: DirectedGraph):
     print()
     print(random_graph.find_path(0, 9))
+
+
+def test_find_path_bounded():
+    # A chain of diamonds has 2 ** n simple paths
+    graph = DirectedGraph()
+    for i in range(30):
+        graph.add_arc(f"{i}", f"{i}a", True)
+        graph.add_arc(f"{i}", f"{i}b", True)
+        graph.add_arc(f"{i}a", f"{i + 1}", True)
+        graph.add_arc(f"{i}b", f"{i + 1}", True)
+    assert len(graph.find_path("0", "30", max_paths=100)) == 100
+    assert graph.find_path("0", "2", max_depth=3) == []
+    assert len(graph.find_path("0", "2")) == 4
+    assert len(graph.shortest_path("0", "30")) == 61
+    assert graph.is_reachable("0", "30") and not graph.is_reachable("30", "0")
+
+
+def test_deep_chain():
+    graph = DirectedGraph({i: {i + 1} for i in range(10000)})
+    assert graph.topological_order() == list(range(10001))
+    assert graph.find_path(0, 10000) == [list(range(10001))]
+    assert not graph.has_cycle()
+    graph.add_arc(10000, 5000)
+    assert graph.find_cycle() == list(range(5000, 10001))
+    with pytest.raises(ValueError):
+        graph.topological_order()
+
+
+def test_delete_arcs():
+    graph = DirectedGraph({"a": {"b", "c"}, "b": {"d"}, "c": {"d", "e"}, "d": {"a"}})
+    graph.delete_arcs("a", "d")
+    assert graph._graph == {
+        "a": set(),
+        "b": set(),
+        "c": {"e"},
+        "d": {"a"},
+        "e": set(),
+    }
+    graph.delete_nodes(["a", "e"])
+    assert graph._graph == {"b": set(), "c": set(), "d": set()}
+
+    # v -> u and u -> v only lie on the walk s -> v -> u -> v -> t, no simple path
+    graph = DirectedGraph({"s": {"v"}, "v": {"u", "t"}, "u": {"v"}})
+    graph.delete_arcs("s", "t")
+    assert graph._graph == {"s": set(), "v": {"u"}, "u": {"v"}, "t": set()}
+
+
+def test_delete_arcs_cyclic_fan_out():
+    # Fully connected layers with arcs back to the previous layer: far too many
+    # simple paths to enumerate, yet every arc lies on one
+    layers = [[f"{i}{j}" for j in range(8)] for i in range(6)]
+    graph = DirectedGraph()
+    for node in layers[0]:
+        graph.add_arc("s", node, True)
+    for node in layers[-1]:
+        graph.add_arc(node, "t", True)
+    for layer, next_layer in zip(layers, layers[1:]):
+        for node in layer:
+            for next_node in next_layer:
+                graph.add_arc(node, next_node, True)
+                graph.add_arc(next_node, node, True)
+    # Only on walks: a loop hanging off a predecessor of "t"
+    graph.add_arc("50", "x", True)
+    graph.add_arc("x", "50", True)
+    graph.add_arc("s", "y", True)
+    assert [len(c) for c in graph.strongly_connected_components()].count(49) == 1
+    graph.delete_arcs("s", "t")
+    assert {
+        node: successors for node, successors in graph._graph.items() if successors
+    } == {
+        "50": {"x"},
+        "x": {"50"},
+        "s": {"y"},
+    }
+
+
+def test_frozen_graph():
+    graph = DirectedGraph({"a": {"b", "c"}, "b": {"d"}, "c": {"d"}})
+    assert graph["d"] == {"predecessors": {"b", "c"}, "successors": set()}
+    frozen = graph.freeze()
+    assert len(frozen) == 4 and "d" in frozen
+    for node in graph.nodes():
+        assert frozen[node] == graph[node]
+    assert frozen.topological_order()[0] == "a"
+    assert frozen.ancestors("d") == {"a", "b", "c", "d"}
+    assert len(frozen.find_path("a", "d")) == 2
+    with pytest.raises(TypeError):
+        frozen.add_arc("d", "a")
+    thawed = frozen.thaw()
+    thawed.delete_node("b")
+    assert thawed["d"]["predecessors"] == {"c"}
+    assert graph["d"]["predecessors"] == {"b", "c"}
+
+    patched = frozen.patch([("d", "e", False), ("a", "b", True), ("x", "y", True)])
+    assert patched.is_patched() and not frozen.is_patched()
+    assert frozen.patch([]) is frozen
+    assert len(patched) == 5 and "x" not in patched
+    assert patched.descendants("a") == {"a", "c", "d", "e"}
+    assert frozen.descendants("a") == {"a", "b", "c", "d"}
+    compact = patched.freeze()
+    assert not compact.is_patched()
+    for node in patched.nodes():
+        assert compact[node] == patched[node]
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+import pytest
+from uatu.core import run as run_module
+from uatu.core.run import Run
+from uatu.core.metrics import MetricWriter, open_series
+from uatu.core.distributed import (
+    COORDINATOR_ENV,
+    RANK_ADDRESS_ENV,
+    LOCAL_RANK_ENVS,
+    RANK_ENVS,
+    RankCoordinator,
+    RankWorker,
+    get_local_rank,
+    get_rank,
+    get_user_dir,
+)
+
+
+def train_rank(rank, world_size, address, experiment_dir, results):
+    # Stands in for one process of a torchrun-style launch
+    os.environ.update(
+        {"RANK": str(rank), "WORLD_SIZE": str(world_size), RANK_ADDRESS_ENV: address}
+    )
+    run_module.get_uatu_config = lambda: {
+        "experiment_dir": experiment_dir,
+        "database_file": "uatu.db",
+    }
+    run = Run(description="ddp", instrument=True, rank_timeout=30)
+    saves = []
+    run.save = lambda *args, **kwargs: saves.append((args, kwargs))
+
+    @run
+    def train():
+        for step in range(5):
+            run.log(step, loss=rank + step)
+        return {"rank": rank}
+
+    assert train() == {"rank": rank}
+    if rank == 0:
+        (_, metrics, description, series_dir), kwargs = saves[0]
+        series = open_series(series_dir)
+        results.put(
+            (
+                metrics,
+                sorted(kwargs["resources"]["ranks"]),
+                {name: list(series[name].values) for name in series if "loss" in name},
+            )
+        )
+    results.put(len(saves))
+
+
+def test_single_recording(tmp_path):
+    world_size = 3
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=train_rank,
+            args=(
+                rank,
+                world_size,
+                str(tmp_path / "ranks.sock"),
+                str(tmp_path),
+                results,
+            ),
+        )
+        for rank in reversed(range(world_size))
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=60) for _ in range(world_size + 1)]
+    for process in processes:
+        process.join(10)
+        assert process.exitcode == 0
+
+    ((metrics, resource_ranks, series),) = [o for o in outcomes if isinstance(o, tuple)]
+    # Only rank 0 records, once
+    assert sorted(o for o in outcomes if isinstance(o, int)) == [0, 0, 1]
+    assert metrics == {"rank": 0, "ranks": {str(i): {"rank": i} for i in range(3)}}
+    assert resource_ranks == ["0", "1", "2"]
+    assert series == {
+        "loss": [0.0, 1.0, 2.0, 3.0, 4.0],
+        "rank1/loss": [1.0, 2.0, 3.0, 4.0, 5.0],
+        "rank2/loss": [2.0, 3.0, 4.0, 5.0, 6.0],
+    }
+
+
+def test_get_rank(monkeypatch):
+    for names in RANK_ENVS:
+        for name in names:
+            monkeypatch.delenv(name, raising=False)
+    assert get_rank() == (0, 1)
+    monkeypatch.setenv("OMPI_COMM_WORLD_RANK", "2")
+    monkeypatch.setenv("OMPI_COMM_WORLD_SIZE", "4")
+    assert get_rank() == (2, 4)
+
+
+def test_get_local_rank(monkeypatch):
+    for names in LOCAL_RANK_ENVS:
+        for name in filter(None, names):
+            monkeypatch.delenv(name, raising=False)
+    monkeypatch.delenv(COORDINATOR_ENV, raising=False)
+    assert get_local_rank(2, 4) == (2, 4)
+    # 2 nodes of 2 ranks, the second node does not report to rank 0
+    monkeypatch.setenv("LOCAL_WORLD_SIZE", "2")
+    monkeypatch.setenv("LOCAL_RANK", "1")
+    assert get_local_rank(1, 4) == (1, 2)
+    assert get_local_rank(3, 4) is None
+    monkeypatch.setenv("GROUP_RANK", "1")
+    assert get_local_rank(1, 4) is None
+    monkeypatch.setenv("GROUP_RANK", "0")
+    assert get_local_rank(2, 4) == (1, 2)
+    # Round-robin over 2 nodes: rank 2 is the second rank of node 0
+    monkeypatch.delenv("GROUP_RANK")
+    monkeypatch.setenv(COORDINATOR_ENV, "localhost")
+    assert get_local_rank(2, 4) == (1, 2)
+    monkeypatch.setenv(COORDINATOR_ENV, "192.0.2.1")
+    assert get_local_rank(2, 4) is None
+
+
+def test_coordinator_refuses_other_keys(tmp_path):
+    address = str(tmp_path / "ranks.sock")
+    coordinator = RankCoordinator(
+        address, 2, MetricWriter(str(tmp_path / "series")), b"launch"
+    )
+    coordinator.start()
+    try:
+        with pytest.raises(AuthenticationError):
+            Client(address, authkey=b"other")
+        assert not RankWorker(address, 1, authkey=b"other").connect(5)
+        worker = RankWorker(address, 1, authkey=b"launch")
+        assert worker.connect(5)
+        assert worker.finish(({"rank": 1}, None, None))
+        assert coordinator.gather(5) == []
+        assert coordinator.results == {1: ({"rank": 1}, None, None)}
+    finally:
+        coordinator.close()
+
+
+def test_coordinator_skips_unconnected_ranks(tmp_path):
+    # A rank of node 0 taken for one of another node never connects
+    address = str(tmp_path / "ranks.sock")
+    coordinator = RankCoordinator(
+        address, 3, MetricWriter(str(tmp_path / "series")), connect_timeout=0.5
+    )
+    coordinator.start()
+    try:
+        worker = RankWorker(address, 1)
+        assert worker.connect(5)
+        assert worker.finish(({"rank": 1}, None, None))
+        start = time.monotonic()
+        assert coordinator.gather(60) == [2]
+        assert time.monotonic() - start < 5
+    finally:
+        coordinator.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Unix permissions")
+def test_user_dir_must_be_private(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "gettempdir", lambda: str(tmp_path))
+    user_dir = get_user_dir()
+    assert os.stat(user_dir).st_mode & 0o777 == 0o700
+    os.chmod(user_dir, 0o755)
+    with pytest.raises(PermissionError):
+        get_user_dir()
+    os.rmdir(user_dir)
+    os.mkdir(tmp_path / "elsewhere", 0o700)
+    os.symlink(tmp_path / "elsewhere", user_dir)
+    with pytest.raises(PermissionError):
+        get_user_dir()
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import subprocess
+from uatu.core.database import get_pipeline
+from uatu.core.orm import Experiment
+from uatu.core.executor import (
+    get_pipeline_steps,
+    run_pipelines,
+    CACHED,
+    DONE,
+    FAILED,
+    SKIPPED,
+)
+from uatu.core.run import HPARAMS_ENV
+from .utils import sess, repo, project, commit_files
+
+SCRIPT = """
+with open("{source}") as f:
+    content = f.read()
+with open("{target}", "w") as f:
+    f.write(content + "{suffix}")
+with open("{log}", "a") as f:
+    f.write("{name} ")
+"""
+
+
+def write_scripts(repo, log, suffix=""):
+    chain = ["data.txt", "a.txt", "b.txt", "c.txt"]
+    for i, (source, target) in enumerate(zip(chain, chain[1:])):
+        with open(os.path.join(repo.working_dir, f"s{i}.py"), "w") as f:
+            f.write(
+                SCRIPT.format(
+                    source=source, target=target, suffix=f"{i}{suffix}", log=log, name=i
+                )
+            )
+
+
+def run(sess, repo, pipeline, log):
+    open(log, "w").close()
+    steps = [
+        (result.step.script, result.status == CACHED)
+        for result in run_pipelines(sess, repo, [pipeline])
+    ]
+    with open(log) as f:
+        return steps, f.read().split()
+
+
+def read(repo, path):
+    with open(os.path.join(repo.working_dir, path)) as f:
+        return f.read()
+
+
+def test_run_pipeline_memoizes_stages(sess, repo, tmp_path):
+    log = str(tmp_path / "runs.log")
+    commit_files(repo, {"data.txt": "x"})
+    write_scripts(repo, log)
+    pipeline = get_pipeline(
+        sess,
+        file_lists=[
+            ["data.txt"],
+            ["s0.py"],
+            ["a.txt"],
+            ["s1.py"],
+            ["b.txt"],
+            ["s2.py"],
+            ["c.txt"],
+        ],
+    )
+    steps = get_pipeline_steps(sess, pipeline)
+    assert [(step.inputs, step.script, step.outputs) for step in steps] == [
+        (["data.txt"], "s0.py", ["a.txt"]),
+        (["a.txt"], "s1.py", ["b.txt"]),
+        (["b.txt"], "s2.py", ["c.txt"]),
+    ]
+
+    assert run(sess, repo, pipeline, log) == (
+        [("s0.py", False), ("s1.py", False), ("s2.py", False)],
+        ["0", "1", "2"],
+    )
+    assert read(repo, "c.txt") == "x012"
+    assert run(sess, repo, pipeline, log)[1] == []
+
+    # Only the edited last script runs again
+    with open(os.path.join(repo.working_dir, "s2.py"), "a") as f:
+        f.write("\n")
+    assert run(sess, repo, pipeline, log)[1] == ["2"]
+
+    # Changing the data reruns everything, changing it back restores the outputs
+    commit_files(repo, {"data.txt": "y"})
+    assert run(sess, repo, pipeline, log)[1] == ["0", "1", "2"]
+    assert read(repo, "c.txt") == "y012"
+    commit_files(repo, {"data.txt": "x"})
+    assert run(sess, repo, pipeline, log)[1] == []
+    assert read(repo, "c.txt") == "x012"
+
+
+def test_run_pipelines_in_parallel(sess, repo, tmp_path):
+    marker = str(tmp_path / "b_started")
+    commit_files(repo, {"data.txt": "x"})
+    scripts = {
+        # a.py only finishes if b.py runs at the same time
+        "a.py": f"""
+import os, time
+for _ in range(200):
+    if os.path.exists({marker!r}):
+        break
+    time.sleep(0.05)
+open("a.txt", "w").write(str(os.path.exists({marker!r})))
+""",
+        "b.py": f"""
+open({marker!r}, "w").close()
+open("b.txt", "w").write("b")
+""",
+        "merge.py": """
+open("m.txt", "w").write(open("a.txt").read() + open("b.txt").read())
+""",
+        "bad.py": "print('broken')\nraise SystemExit(3)",
+        "after_bad.py": "open('x.txt', 'w').close()",
+    }
+    for path, content in scripts.items():
+        with open(os.path.join(repo.working_dir, path), "w") as f:
+            f.write(content)
+    pipelines = [
+        get_pipeline(sess, file_lists=file_lists)
+        for file_lists in (
+            [["data.txt"], ["a.py"], ["a.txt"]],
+            [["data.txt"], ["b.py"], ["b.txt"]],
+            [["a.txt", "b.txt"], ["merge.py"], ["m.txt"]],
+            [["data.txt"], ["bad.py"], ["bad.txt"], ["after_bad.py"], ["x.txt"]],
+        )
+    ]
+    log_dir = str(tmp_path / "logs")
+
+    results = {
+        result.step.script: result
+        for result in run_pipelines(sess, repo, pipelines, 3, log_dir)
+    }
+    statuses = {script: result.status for script, result in results.items()}
+    assert statuses == {
+        "a.py": DONE,
+        "b.py": DONE,
+        "merge.py": DONE,
+        "bad.py": FAILED,
+        "after_bad.py": SKIPPED,
+    }
+    assert read(repo, "m.txt") == "Trueb"
+    assert results["bad.py"].returncode == 3
+    with open(results["bad.py"].log_file) as f:
+        assert f.read() == "broken\n"
+
+
+def test_run_step_hands_result_over(sess, repo):
+    commit_files(repo, {"data.txt": "x"})
+    with open(os.path.join(repo.working_dir, "train.py"), "w") as f:
+        f.write("""
+from uatu.core.run import Run
+
+run = Run(["data.txt"], ["model.txt"], hparams={"lr": 0.1})
+
+
+@run
+def main():
+    open("model.txt", "w").write("model")
+    return {"score": 0.9}
+
+
+main()
+""")
+    pipeline = get_pipeline(
+        sess, file_lists=[["data.txt"], ["train.py"], ["model.txt"]]
+    )
+    (result,) = run_pipelines(sess, repo, [pipeline])
+    assert result.status == DONE
+    # Recorded once, by the executor, with what the script's Run measured
+    assert sess.query(Experiment).count() == 1
+    assert result.experiment.description == "uatu pipeline run: train.py"
+    assert json.loads(result.experiment.hparams) == {"lr": 0.1}
+    assert json.loads(result.experiment.metrics) == {"score": 0.9}
+    assert [r.status for r in run_pipelines(sess, repo, [pipeline])] == [CACHED]
+
+
+def test_step_key_follows_hparams(project, monkeypatch):
+    repo, sess = project
+    with open(os.path.join(repo.working_dir, "train.py"), "w") as f:
+        f.write("""
+from uatu.core.run import Run
+
+run = Run(["data.txt"], ["model.txt"], hparams={"lr": 0.1}, cache=True)
+
+
+@run
+def main():
+    open("model.txt", "w").write(str(run.hparams["lr"]))
+    return {"lr": run.hparams["lr"]}
+
+
+main()
+""")
+    pipeline = get_pipeline(
+        sess, file_lists=[["data.txt"], ["train.py"], ["model.txt"]]
+    )
+    (first,) = run_pipelines(sess, repo, [pipeline])
+    assert first.status == DONE
+    # Other hparams are another step, the same ones are reused
+    monkeypatch.setenv(HPARAMS_ENV, json.dumps({"lr": 0.2}))
+    (second,) = run_pipelines(sess, repo, [pipeline])
+    assert second.status == DONE
+    assert json.loads(second.experiment.metrics) == {"lr": 0.2}
+    (third,) = run_pipelines(sess, repo, [pipeline])
+    assert (third.status, third.experiment.id) == (CACHED, second.experiment.id)
+    assert read(repo, "model.txt") == "0.2"
+    # The script's own Run keys it the same way the executor recorded it
+    monkeypatch.delenv(HPARAMS_ENV)
+    process = subprocess.run(
+        [sys.executable, "train.py"],
+        cwd=repo.working_dir,
+        capture_output=True,
+        text=True,
+    )
+    assert f"Uatu reused experiment {first.experiment.id}" in process.stderr
+    assert sess.query(Experiment).count() == 2
+    assert read(repo, "model.txt") == "0.1"
+
+
+def test_fan_in_after_failure(sess, repo):
+    commit_files(repo, {"data.txt": "x"})
+    scripts = {
+        "a.py": "raise SystemExit(1)",
+        # Finishes after a.py failed and skipped merge.py
+        "b.py": "import time\ntime.sleep(0.5)\nopen('b.txt', 'w').write('b')",
+        "merge.py": "open('m.txt', 'w').write(open('a.txt').read())",
+    }
+    for path, content in scripts.items():
+        with open(os.path.join(repo.working_dir, path), "w") as f:
+            f.write(content)
+    pipelines = [
+        get_pipeline(sess, file_lists=file_lists)
+        for file_lists in (
+            [["data.txt"], ["a.py"], ["a.txt"]],
+            [["data.txt"], ["b.py"], ["b.txt"]],
+            [["a.txt", "b.txt"], ["merge.py"], ["m.txt"]],
+        )
+    ]
+    results = [
+        (result.step.script, result.status)
+        for result in run_pipelines(sess, repo, pipelines, 2)
+    ]
+    assert results == [("a.py", FAILED), ("merge.py", SKIPPED), ("b.py", DONE)]
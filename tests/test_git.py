@@ -0,0 +1,82 @@
+import os
+from git import Git
+from uatu.core.git import (
+    LAST_COMMITS_FILE,
+    _git_state,
+    _last_commits,
+    get_tracked_files,
+    get_staged_files,
+    need_commit,
+    get_last_commit,
+    get_last_commits,
+    add_files,
+)
+from .utils import repo, commit_files
+
+
+def test_get_last_commits(repo):
+    first = commit_files(repo, {"a.txt": "1", "b.txt": "1"})
+    second = commit_files(repo, {"a.txt": "2"})
+    paths = ["a.txt", "b.txt", "missing.txt"]
+    assert get_last_commits(repo, paths) == {
+        "a.txt": second,
+        "b.txt": first,
+        "missing.txt": None,
+    }
+    for path in paths:
+        expected = next(repo.iter_commits(paths=path), None)
+        assert get_last_commit(repo, path) == (expected and expected.hexsha)
+
+    third = commit_files(repo, {"b.txt": "2"})
+    assert get_last_commits(repo, paths)["b.txt"] == third
+    assert get_last_commit(repo) == third
+
+
+def test_last_commits_survive_restart(repo):
+    os.mkdir(os.path.join(repo.working_dir, ".uatu"))
+    first = commit_files(repo, {"a.txt": "1", "b.txt": "1"})
+    assert get_last_commits(repo, ["a.txt"]) == {"a.txt": first}
+    assert os.path.exists(os.path.join(repo.working_dir, LAST_COMMITS_FILE))
+
+    _last_commits.clear()
+    second = commit_files(repo, {"b.txt": "2"})
+    assert get_last_commits(repo, ["a.txt", "b.txt"]) == {
+        "a.txt": first,
+        "b.txt": second,
+    }
+
+
+def test_git_state_cache(repo, monkeypatch):
+    os.mkdir(os.path.join(repo.working_dir, ".uatu"))
+    commit_files(repo, {"a.txt": "1"})
+    assert get_tracked_files(repo) == ["a.txt"]
+    assert not need_commit(repo)
+
+    _git_state.clear()
+    with monkeypatch.context() as patch:
+        patch.setattr(Git, "execute", lambda *args, **kwargs: 1 / 0)
+        assert get_tracked_files(repo) == ["a.txt"]
+        assert not need_commit(repo)
+
+    with open(os.path.join(repo.working_dir, "b.txt"), "w") as f:
+        f.write("1")
+    repo.git.add("b.txt")
+    assert get_tracked_files(repo) == ["a.txt", "b.txt"]
+    assert get_staged_files(repo) == {"b.txt": "A"}
+    assert need_commit(repo)
+
+
+def test_last_commits_after_lost_head(repo):
+    first = commit_files(repo, {"a.txt": "1"})
+    # Cached at a commit that no longer exists, e.g. rebased away and gc'ed
+    _last_commits[repo.working_dir] = ("f" * 40, {"a.txt": "f" * 40})
+    assert get_last_commits(repo, ["a.txt"]) == {"a.txt": first}
+
+
+def test_add_files_stages_deletions(repo):
+    commit_files(repo, {"a.txt": "1", "b.txt": "1"})
+    os.remove(os.path.join(repo.working_dir, "a.txt"))
+    with open(os.path.join(repo.working_dir, "b.txt"), "w") as f:
+        f.write("2")
+    assert add_files(repo, ["a.txt", "b.txt"]) == ["a.txt", "b.txt"]
+    assert get_staged_files(repo) == {"a.txt": "D", "b.txt": "M"}
@@ -0,0 +1,121 @@
+from uatu.core.orm import EdgeLog, FILE_LEVEL
+from uatu.core.database import get_file, add_edge, delete_edge, delete_file
+from uatu.core.directed_graph import FrozenDirectedGraph
+from uatu.core import lineage
+from uatu.core.lineage import (
+    get_generation,
+    get_snapshot_path,
+    get_lineage_graph,
+    refresh_lineage_graph,
+    trim_edge_log,
+    update_lineage_graph,
+    load_lineage_snapshot,
+)
+from .utils import sess
+
+
+def test_edges_bump_generation(sess):
+    data = get_file(sess, file_path="data.txt")
+    script = get_file(sess, file_path="train.py")
+    assert get_generation(sess) == 0
+    add_edge(sess, data, script)
+    add_edge(sess, data, script)
+    assert get_generation(sess) == 1
+    delete_edge(sess, data, script)
+    assert get_generation(sess) == 2
+    assert [log.deleted for log in sess.query(EdgeLog)] == [False, True]
+
+
+def test_lineage_snapshot(sess):
+    files = [get_file(sess, file_path=f"{i}.txt") for i in range(4)]
+    for predecessor, successor in zip(files, files[1:]):
+        add_edge(sess, predecessor, successor)
+    ids = [file_.id for file_ in files]
+
+    generation, graph = get_lineage_graph(sess, FILE_LEVEL)
+    assert isinstance(graph, FrozenDirectedGraph)
+    assert generation == 3
+    assert graph.descendants(ids[0]) == set(ids)
+    assert graph[ids[1]] == {"predecessors": {ids[0]}, "successors": {ids[2]}}
+
+    snapshot_generation, snapshot = load_lineage_snapshot(
+        get_snapshot_path(sess, FILE_LEVEL)
+    )
+    assert snapshot_generation == generation
+    assert snapshot.topological_order() == graph.topological_order()
+
+    # Readers only replay what changed after their generation
+    delete_edge(sess, files[1], files[2])
+    add_edge(sess, files[3], files[0])
+    delete_file(sess, file=files[3])
+    generation, graph = update_lineage_graph(sess, generation, graph, FILE_LEVEL)
+    assert generation == 7
+    assert graph.descendants(ids[0]) == {ids[0], ids[1]}
+    assert isinstance(graph, FrozenDirectedGraph)  # Patched, not thawed
+    assert list(graph.predecessors(ids[0])) == []
+    assert get_lineage_graph(sess, FILE_LEVEL)[1].descendants(ids[0]) == {
+        ids[0],
+        ids[1],
+    }
+
+
+def test_snapshot_prunes_log(sess, monkeypatch):
+    monkeypatch.setattr(lineage, "SNAPSHOT_DELTAS", 2)
+    files = [get_file(sess, file_path=f"{i}.txt") for i in range(4)]
+    ids = [file_.id for file_ in files]
+    add_edge(sess, files[0], files[1])
+    old_generation, old_graph = get_lineage_graph(sess, FILE_LEVEL)
+    assert sess.query(EdgeLog).count() == 0
+
+    add_edge(sess, files[1], files[2])
+    generation, graph = get_lineage_graph(sess, FILE_LEVEL)
+    assert graph.is_patched() and sess.query(EdgeLog).count() == 1
+    # Enough deltas save a new snapshot and prune what it covers
+    add_edge(sess, files[2], files[3])
+    generation, graph = get_lineage_graph(sess, FILE_LEVEL)
+    assert generation == get_generation(sess) == 3
+    assert not graph.is_patched() and sess.query(EdgeLog).count() == 0
+    assert load_lineage_snapshot(get_snapshot_path(sess, FILE_LEVEL))[0] == 3
+
+    # A reader behind the pruned deltas reloads the snapshot
+    generation, graph = update_lineage_graph(
+        sess, old_generation, old_graph, FILE_LEVEL
+    )
+    assert generation == 3 and graph.descendants(ids[0]) == set(ids)
+
+
+def test_refresh_saves_snapshot(sess, monkeypatch):
+    monkeypatch.setattr(lineage, "SNAPSHOT_DELTAS", 2)
+    files = [get_file(sess, file_path=f"{i}.txt") for i in range(3)]
+    generation, graph = get_lineage_graph(sess, FILE_LEVEL)
+    # Nothing changed, nothing copied
+    assert refresh_lineage_graph(sess, generation, graph, FILE_LEVEL)[1] is graph
+
+    add_edge(sess, files[0], files[1])
+    generation, graph = refresh_lineage_graph(sess, generation, graph, FILE_LEVEL)
+    assert graph.is_patched() and sess.query(EdgeLog).count() == 1
+    add_edge(sess, files[1], files[2])
+    generation, graph = refresh_lineage_graph(sess, generation, graph, FILE_LEVEL)
+    assert not graph.is_patched() and sess.query(EdgeLog).count() == 0
+    assert load_lineage_snapshot(get_snapshot_path(sess, FILE_LEVEL))[0] == generation
+    assert graph.descendants(files[0].id) == {file_.id for file_ in files}
+
+
+def test_trim_edge_log(sess, monkeypatch):
+    monkeypatch.setattr(lineage, "MAX_SNAPSHOT_DELTAS", 2)
+    files = [get_file(sess, file_path=f"{i}.txt") for i in range(11)]
+    for predecessor, successor in zip(files[:5], files[1:6]):
+        add_edge(sess, predecessor, successor)
+    # Without a snapshot only the latest deltas are kept
+    trim_edge_log(sess)
+    assert [delta.generation for delta in sess.query(EdgeLog)] == [4, 5]
+
+    get_lineage_graph(sess, FILE_LEVEL)
+    for predecessor, successor in zip(files[5:], files[6:]):
+        add_edge(sess, predecessor, successor)
+    # With one they are folded into a new snapshot
+    trim_edge_log(sess)
+    assert sess.query(EdgeLog).count() == 0
+    generation, graph = load_lineage_snapshot(get_snapshot_path(sess, FILE_LEVEL))
+    assert generation == 10 and not graph.is_patched()
+    assert graph.descendants(files[0].id) == {file_.id for file_ in files}
@@ -0,0 +1,88 @@
+import time
+import pytest
+import uatu.core.metrics as metrics
+from uatu.core.metrics import (
+    MetricWriter,
+    MetricSeries,
+    open_series,
+    get_series_files,
+    lttb,
+    minmax,
+    TIME_SERIES,
+)
+
+
+def test_metric_writer_buffers(tmp_path):
+    series_dir = str(tmp_path / "run.series")
+    writer = MetricWriter(series_dir, buffer_size=3, flush_interval=60)
+    writer.log(0, loss=1.0)
+    writer.log(1, loss=0.5, acc=0.1)
+    assert not (tmp_path / "run.series").exists()
+    writer.log(2, loss=0.25)
+    series = open_series(series_dir)
+    assert sorted(series) == [TIME_SERIES, "acc", "loss"]
+    assert list(series["loss"].steps) == [0, 1, 2]
+    assert list(series["acc"].range()[1]) == [0.1]
+
+    # A crash may leave a torn value or one column longer than the other
+    writer.log(3, loss=0.125)
+    writer.close()
+    step_file, value_file = get_series_files(series_dir, "loss")
+    with open(step_file, "ab") as f:
+        f.write(b"\x05\x00\x00")
+    assert len(MetricSeries(series_dir, "loss")) == 4
+    with open(step_file, "ab") as f:
+        f.write(b"\x00" * 13)
+    assert len(MetricSeries(series_dir, "loss")) == 4
+
+
+def test_metric_writer_throughput(tmp_path):
+    writer = MetricWriter(str(tmp_path / "run.series"))
+    start = time.perf_counter()
+    for step in range(20000):
+        writer.log(step, loss=1 / (step + 1), acc=step / 20000)
+    writer.close()
+    assert time.perf_counter() - start < 1
+    assert len(open_series(writer.series_dir)["loss"]) == 20000
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_series_range_and_downsample(tmp_path, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(metrics, "np", None)
+    elif metrics.np is None:
+        pytest.skip("NumPy is not installed")
+    writer = MetricWriter(str(tmp_path / "run.series"))
+    for step in range(0, 2000, 2):
+        writer.log(step, value=1000 if step == 1000 else step % 10)
+    writer.close()
+    series = open_series(writer.series_dir)["value"]
+
+    steps, values = series.range(100, 110)
+    assert list(steps) == [100, 102, 104, 106, 108]
+    assert list(values) == [0, 2, 4, 6, 8]
+
+    steps, values = series.downsample(50)
+    assert len(steps) == 50 and steps[0] == 0 and steps[-1] == 1998
+    assert 1000 in list(steps)
+    starts, lows, highs = series.downsample(10, 0, 1000, method="minmax")
+    assert list(starts) == list(range(0, 1000, 100))
+    assert set(lows) == {0} and set(highs) == {8}
+    with pytest.raises(ValueError):
+        series.downsample(10, method="mean")
+
+
+def test_lttb_matches_without_numpy(monkeypatch):
+    if metrics.np is None:
+        pytest.skip("NumPy is not installed")
+    np = metrics.np
+    steps = np.arange(5000, dtype=np.int64)
+    values = np.sin(steps / 50.0) * np.cos(steps / 7.0)
+    vectorized = lttb(steps, values, 200)
+    plain = lttb(list(steps), list(values), 200)
+    assert list(vectorized[0]) == plain[0]
+    low, high = (
+        minmax(steps, values, 100)[1:],
+        minmax(list(steps), list(values), 100)[1:],
+    )
+    assert np.allclose(low, high)
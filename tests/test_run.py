@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import subprocess
+import threading
+from uatu.core import run as run_module
+from uatu.core.run import Run, DESCRIPTION_ENV
+from .utils import repo, commit_files
+
+
+def test_description_template(monkeypatch):
+    run = Run(hparams={"lr": 0.1}, description="{script} lr={hparams[lr]}")
+    assert run.get_description("/work/train.py") == "train.py lr=0.1"
+
+    monkeypatch.setenv(DESCRIPTION_ENV, "batch {config[name]}")
+    assert Run(config={"name": "a"}).get_description("train.py") == "batch a"
+
+
+def test_background_save(monkeypatch):
+    release = threading.Event()
+    saved = []
+
+    def save(script_path, metrics, description, series_dir, **kwargs):
+        release.wait(5)
+        saved.append((metrics, description))
+
+    run = Run(description="background", background=True)
+    monkeypatch.setattr(run, "save", save)
+
+    @run
+    def train():
+        return {"acc": 1}
+
+    assert train() == {"acc": 1}
+    assert saved == []
+    release.set()
+    Run.flush()
+    assert saved == [({"acc": 1}, "background")]
+
+
+def test_instrument_and_profile(monkeypatch, tmp_path):
+    saved = {}
+
+    def save(script_path, metrics, description, series_dir, **kwargs):
+        saved.update(kwargs)
+        with open(kwargs["profile_file"]) as f:
+            saved["profile"] = f.read()
+
+    monkeypatch.setattr(
+        run_module, "get_uatu_config", lambda: {"experiment_dir": str(tmp_path)}
+    )
+    run = Run(description="cost", instrument=True, profile=True, profile_interval=0.001)
+    monkeypatch.setattr(run, "save", save)
+
+    def busy_loop(seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    @run
+    def train():
+        for _ in range(2):
+            with run.section("step"):
+                busy_loop(0.05)
+        return {}
+
+    train()
+    resources = saved["resources"]
+    assert resources["wall_time"] >= 0.1
+    assert resources["cpu_time"] > 0
+    assert resources["peak_rss"] > 0
+    assert resources["sections"]["step"]["calls"] == 2
+    assert resources["sections"]["step"]["seconds"] >= 0.1
+    # Folded stacks: frames from the root joined by ";" and a sample count
+    lines = saved["profile"].splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(";train (test_run.py:" in line and "busy_loop" in line for line in lines)
+    # Sections are no-ops outside an instrumented call
+    with run.section("outside"):
+        pass
+
+
+CACHED_SCRIPT = """
+import sys
+from uatu.core.run import Run
+
+run = Run(
+    input_files=["data.txt"],
+    output_files=["out.txt"],
+    hparams={"n": int(sys.argv[1])},
+    description="cached",
+    cache=True,
+)
+
+
+@run
+def main():
+    with open("data.txt") as f:
+        data = f.read()
+    with open("out.txt", "w") as f:
+        f.write(data * run.hparams["n"])
+    print("ran")
+    return {"size": len(data) * run.hparams["n"]}
+
+
+print(main())
+"""
+
+
+def test_cache(repo, tmp_path):
+    os.makedirs(os.path.join(repo.working_dir, ".uatu"))
+    with open(os.path.join(repo.working_dir, ".uatu", "config.yaml"), "w") as f:
+        f.write(f"database_file: {tmp_path / 'uatu.db'}\nexperiment_dir: {tmp_path}\n")
+    commit_files(repo, {"data.txt": "x", "train.py": CACHED_SCRIPT})
+
+    def run(n):
+        process = subprocess.run(
+            [sys.executable, "train.py", str(n)],
+            cwd=repo.working_dir,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        with open(os.path.join(repo.working_dir, "out.txt")) as f:
+            return process.stdout.split(), f.read()
+
+    assert run(2) == (["ran", "{'size':", "2}"], "xx")
+    assert run(3) == (["ran", "{'size':", "3}"], "xxx")
+    # Recorded metrics are returned and the outputs of that run restored
+    assert run(2) == (["{'size':", "2}"], "xx")
+    commit_files(repo, {"data.txt": "y"})
+    assert run(2) == (["ran", "{'size':", "2}"], "yy")
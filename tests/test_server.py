@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+from uatu.cli.client import NO_SERVER_ENV, SERVER_SOCKET, is_forwarded
+from uatu.core.database import add_edge, get_file, get_node, get_all_nodes
+from .utils import repo, project, commit_files
+
+UATU = [sys.executable, "-c", "from uatu.cli.client import main; main()"]
+
+
+def uatu(cwd, *args, input=None, server=True):
+    env = dict(os.environ)
+    if not server:
+        env[NO_SERVER_ENV] = "1"
+    return subprocess.run(
+        UATU + list(args), cwd=cwd, env=env, input=input, capture_output=True, text=True
+    )
+
+
+@pytest.fixture
+def server(project):
+    repo, sess = project
+    process = subprocess.Popen(UATU + ["server"], cwd=repo.working_dir)
+    address = os.path.join(repo.working_dir, SERVER_SOCKET)
+    for _ in range(600):
+        if os.path.exists(address) or process.poll() is not None:
+            break
+        time.sleep(0.05)
+    assert os.path.exists(address)
+    yield repo, sess, process
+    process.terminate()
+    process.wait(10)
+
+
+def test_is_forwarded():
+    assert is_forwarded(["node", "ls"])
+    assert is_forwarded(["pipeline", "show"])
+    assert not is_forwarded([])
+    assert not is_forwarded(["--help"])
+    assert not is_forwarded(["pipeline", "run", "x"])
+    assert not is_forwarded(["server"])
+
+
+def test_server(server):
+    repo, sess, process = server
+    commit_id = commit_files(repo, {"a.txt": "a", "b.txt": "b"})
+    get_node(sess, file_path="a.txt", commit_id=commit_id)
+    sess.commit()
+
+    forwarded = uatu(repo.working_dir, "node", "ls")
+    local = uatu(repo.working_dir, "node", "ls", server=False)
+    assert forwarded.returncode == local.returncode == 0
+    assert forwarded.stdout == local.stdout and "a.txt" in forwarded.stdout
+
+    # Writes of other processes show up in the next command
+    get_node(sess, file_path="b.txt", commit_id=commit_id)
+    sess.commit()
+    assert "b.txt" in uatu(repo.working_dir, "node", "ls").stdout
+
+    # Prompts are answered by the client's stdin
+    result = uatu(repo.working_dir, "node", "del", input="n\n")
+    assert result.returncode == 1
+    assert "all 2 nodes" in result.stdout and "[y/N]" in result.stdout
+    assert "Aborted!" in result.stderr
+    assert uatu(repo.working_dir, "node", "bogus").returncode == 2
+    sess.expire_all()
+    assert len(get_all_nodes(sess)) == 2
+
+    process.terminate()
+    assert process.wait(10) == 0
+    assert not os.path.exists(os.path.join(repo.working_dir, SERVER_SOCKET))
+    # Runs in-process once the server is down
+    result = uatu(repo.working_dir, "node", "ls")
+    assert result.returncode == 0 and "b.txt" in result.stdout
+
+
+def test_server_lineage(server):
+    repo, sess, process = server
+    files = [get_file(sess, file_path=f"{i}.txt") for i in range(3)]
+    add_edge(sess, files[0], files[1])
+    sess.commit()
+
+    # Edges written after the server loaded the graph show up in the next command
+    forwarded = uatu(repo.working_dir, "lineage", "0.txt")
+    assert forwarded.stdout.split() == [files[1].id, "1.txt"]
+    add_edge(sess, files[1], files[2])
+    sess.commit()
+    for args in (["0.txt"], ["2.txt", "--upstream"], ["0.txt", "-n", "1"]):
+        forwarded = uatu(repo.working_dir, "lineage", *args)
+        local = uatu(repo.working_dir, "lineage", *args, server=False)
+        assert forwarded.returncode == local.returncode == 0
+        assert sorted(forwarded.stdout.splitlines()) == sorted(
+            local.stdout.splitlines()
+        )
+    assert "2.txt" in uatu(repo.working_dir, "lineage", "0.txt").stdout
@@ -0,0 +1,81 @@
+import os
+import json
+import pytest
+from uatu.core.executor import CACHED, DONE, FAILED
+from uatu.core.sweep import expand_sweep, run_sweep
+from .utils import sess, repo, commit_files
+
+SCRIPT = """
+import os
+from uatu.core.run import Run
+
+run = Run(hparams={{"lr": 0.0, "epochs": 1}})
+
+
+@run
+def main():
+    lr = run.hparams["lr"]
+    with open("{log}", "a") as f:
+        f.write(f"{{lr}} ")
+    if lr == 0.3 and os.path.exists("{crash}"):
+        raise SystemExit(1)
+    return {{"score": lr * run.hparams["epochs"]}}
+
+
+main()
+"""
+
+
+def test_expand_sweep():
+    grid = expand_sweep({"parameters": {"lr": [0.1, 0.2], "epochs": [1, 2], "a": 3}})
+    assert grid == [
+        {"lr": 0.1, "epochs": 1, "a": 3},
+        {"lr": 0.1, "epochs": 2, "a": 3},
+        {"lr": 0.2, "epochs": 1, "a": 3},
+        {"lr": 0.2, "epochs": 2, "a": 3},
+    ]
+    spec = {
+        "method": "random",
+        "num_trials": 20,
+        "parameters": {
+            "lr": {"min": 1e-4, "max": 1e-1, "log": True},
+            "layers": {"min": 1, "max": 3},
+            "act": ["relu", "gelu"],
+        },
+    }
+    trials = expand_sweep(spec)
+    assert trials == expand_sweep(spec)
+    assert all(1e-4 <= trial["lr"] <= 1e-1 for trial in trials)
+    assert {trial["layers"] for trial in trials} == {1, 2, 3}
+    assert {trial["act"] for trial in trials} == {"relu", "gelu"}
+    with pytest.raises(ValueError):
+        expand_sweep({"parameters": {"lr": {"min": 0, "max": 1}}})
+
+
+def test_resume_sweep(sess, repo, tmp_path):
+    log, crash = str(tmp_path / "trials.log"), str(tmp_path / "crash")
+    commit_files(repo, {"data.txt": "x"})
+    with open(os.path.join(repo.working_dir, "train.py"), "w") as f:
+        f.write(SCRIPT.format(log=log, crash=crash))
+    trials = expand_sweep({"parameters": {"lr": [0.1, 0.2, 0.3]}, "method": "grid"})
+
+    def sweep():
+        open(log, "w").close()
+        results = sorted(
+            run_sweep(sess, repo, "train.py", trials, ["data.txt"], max_workers=2),
+            key=lambda result: result.trial.index,
+        )
+        with open(log) as f:
+            return [result.status for result in results], sorted(f.read().split())
+
+    open(crash, "w").close()
+    assert sweep() == ([DONE, DONE, FAILED], ["0.1", "0.2", "0.3"])
+    # Rerunning after the crash only runs the unfinished trial
+    os.remove(crash)
+    assert sweep() == ([CACHED, CACHED, DONE], ["0.3"])
+    assert sweep() == ([CACHED, CACHED, CACHED], [])
+
+    results = list(run_sweep(sess, repo, "train.py", trials[:1], ["data.txt"]))
+    experiment = results[0].experiment
+    assert json.loads(experiment.hparams) == {"lr": 0.1, "epochs": 1}
+    assert json.loads(experiment.metrics) == {"score": 0.1}
@@ -1,6 +1,9 @@
+import os
 import pytest
 import random
+from git import Repo
 from uatu.core.directed_graph import DirectedGraph
+from uatu.core.database import initialize_db
 
 @pytest.fixture(scope='module')
 def random_graph():
@@ -12,3 +15,42 @@ def random_graph():
         graph_dict[node] = successors
     graph = DirectedGraph(graph_dict)
     return graph
+
+
+@pytest.fixture
+def sess(tmp_path):
+    session = initialize_db(str(tmp_path / "uatu.db"))
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = Repo.init(tmp_path / "repo")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "uatu")
+        config.set_value("user", "email", "uatu@example.com")
+    return repo
+
+
+@pytest.fixture
+def project(repo):
+    # A repo initialized for Uatu, with an empty database
+    for name in ('.gitignore', '.gitattributes'):
+        open(os.path.join(repo.working_dir, name), 'w').close()
+    os.makedirs(os.path.join(repo.working_dir, '.uatu'))
+    with open(os.path.join(repo.working_dir, '.uatu', 'config.yaml'), 'w') as f:
+        f.write('database_file: .uatu/uatu.db\n')
+    commit_files(repo, {'data.txt': 'x'})
+    session = initialize_db(os.path.join(repo.working_dir, '.uatu', 'uatu.db'))
+    yield repo, session
+    session.close()
+
+
+def commit_files(repo: Repo, contents: dict, message: str = "update") -> str:
+    for path, content in contents.items():
+        with open(os.path.join(repo.working_dir, path), "w") as f:
+            f.write(content)
+    repo.git.add(*contents)
+    repo.git.commit("-m", message)
+    return repo.head.commit.hexsha
@@ -1,10 +1,8 @@
 import click
+import importlib
 import subprocess
-import yaml
 from os import getcwd
-from typing import Tuple, Optional, NoReturn
-from sqlalchemy.orm import Session
-from git import Repo
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Optional, NoReturn
 from ..core.git import(
     check_git_initialized,
     initialize_git,
@@ -12,6 +10,7 @@ from ..core.git import(
     get_changed_files,
     add_file,
     get_last_commit,
+    get_last_commits,
     need_commit,
 )
 from ..core.init import (
@@ -20,24 +19,77 @@ from ..core.init import (
     get_uatu_config,
     clean_uatu,
 )
-from ..core.database import initialize_db, get_node, get_file
 from ..core.utils import get_relative_path
-from .node import node_cli
-from .file import file_cli
-from .pipeline import pipeline_cli
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from git import Repo
+
+# Subcommands are imported when they run, not at every start
+LAZY_COMMANDS = {
+    'file': 'uatu.cli.file:file_cli',
+    'node': 'uatu.cli.node:node_cli',
+    'pipeline': 'uatu.cli.pipeline:pipeline_cli',
+    'experiment': 'uatu.cli.experiment:experiment_cli',
+    'lineage': 'uatu.cli.lineage:lineage',
+    'sweep': 'uatu.cli.sweep:sweep',
+    'server': 'uatu.cli.server:server',
+}
+
+
+class LazyGroup(click.Group):
+    def __init__(
+        self, *args, lazy_commands: Optional[Dict[str, str]] = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        if name in self.lazy_commands and name not in self.commands:
+            module_name, command_name = self.lazy_commands[name].split(':')
+            module = importlib.import_module(module_name)
+            self.add_command(getattr(module, command_name), name)
+        return super().get_command(ctx, name)
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter):
+        # `uatu --help` lists the commands not imported yet by name only
+        rows = []
+        for name in self.list_commands(ctx):
+            command = self.commands.get(name)
+            if command is None:
+                rows.append((name, ''))
+            elif not command.hidden:
+                rows.append((name, command.get_short_help_str()))
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
+class ProjectObj(dict):
+    # ctx.obj of every command: the project is checked and the session and repo
+    # are opened the first time a command uses them, so `--help` or `init` do not
+    def __missing__(self, key: str) -> Any:
+        if key not in ('sess', 'repo'):
+            raise KeyError(key)
+        if not (check_git_initialized() and check_uatu_initialized()):
+            click.echo(
+                "This project has't been initialized yet. Please try `uatu init`."
+            )
+            click.get_current_context().abort()
+        if key == 'sess':
+            from ..core.database import initialize_db
+            self[key] = initialize_db(get_uatu_config()['database_file'])
+        else:
+            self[key] = get_repo()
+        return self[key]
 
 
-@click.group()
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
 @click.pass_context
 def cli(ctx: click.Context):
-    ctx.ensure_object(dict)
-    initialized = check_git_initialized() and check_uatu_initialized()
-    if not initialized:
-        click.echo("This project has't been initialized yet. Please try `uatu init`.")
-        click.get_current_context().abort()
-    else:
-        ctx.obj["sess"] = initialize_db(get_uatu_config()["database_file"])
-        ctx.obj["repo"] = get_repo()
+    ctx.obj = ProjectObj(ctx.obj or {})
 
 
 @cli.command()
@@ -67,6 +119,7 @@ def init(
             default=False,
             abort=True,
         )
+    import yaml
     user_config = {}
     if config_file:
         user_config = yaml.safe_load(config_file)
@@ -95,14 +148,18 @@ def clean(dir_path):
 @click.option("--amend", "-a", is_flag=True, default=False)
 @click.pass_context
 def watch(ctx: click.Context, files: Tuple[str], message: str, amend: bool):
+    from ..core.database import get_node, get_file
     repo: Repo = ctx.obj["repo"]
     sess: Session = ctx.obj["sess"]
-    all_changed_files = get_changed_files(repo)
+    all_changed_files = get_changed_files(
+        repo, [get_relative_path(file_path, repo.working_dir) for file_path in files]
+    )
 
     files2watch = set()
+    last_commit_ids = get_last_commits(repo, files)
     for file_path in files:
         rel_path = get_relative_path(file_path, repo.working_dir)
-        last_commit_id = get_last_commit(repo, file_path)
+        last_commit_id = last_commit_ids[file_path]
         if not last_commit_id:
             files2watch.add(rel_path)
         elif rel_path in all_changed_files:
@@ -151,7 +208,3 @@ def run(script, args, module):
             print("running python script")
             subprocess.run("python " + " ".join([script] + list(args)), shell=True)
 
-
-cli.add_command(file_cli)
-cli.add_command(node_cli)
-cli.add_command(pipeline_cli)
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import socket
+from os.path import exists, join
+from typing import List, Optional
+
+# Socket of `uatu server`, relative to the project root so the path never
+# exceeds the length limit of Unix domain socket addresses
+SERVER_SOCKET = join(".uatu", "server.sock")
+# Set to run every command in this process even if a server is up
+NO_SERVER_ENV = "UATU_NO_SERVER"
+# Commands run in this process, they spawn processes writing to the terminal or
+# manage the project and its server
+LOCAL_COMMANDS = {
+    ("init",),
+    ("clean",),
+    ("server",),
+    ("run",),
+    ("sweep",),
+    ("pipeline", "run"),
+}
+
+# The entry point stays this module and its standard library imports when a
+# server is up: messages are JSON lines, {"cwd", "args"} to the server, then
+# {"out"}, {"err"}, {"read"} (answered with {"line"}) and one {"exit"} back.
+# An exit of None means the server does not serve this directory.
+
+
+def send_message(sock: socket.socket, message: dict):
+    sock.sendall(json.dumps(message).encode() + b"\n")
+
+
+def is_forwarded(args: List[str]) -> bool:
+    if not args or args[0].startswith("-"):
+        return False
+    return tuple(args[:1]) not in LOCAL_COMMANDS and (
+        tuple(args[:2]) not in LOCAL_COMMANDS
+    )
+
+
+def forward(address: str, args: List[str]) -> Optional[int]:
+    # Runs `uatu <args>` on the server, returns its exit code or None if no
+    # server took the command
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except OSError:  # Left behind by a server that did not stop cleanly
+        sock.close()
+        return None
+    with sock, sock.makefile("rb") as reader:
+        send_message(sock, {"cwd": os.getcwd(), "args": args})
+        for line in reader:
+            message = json.loads(line)
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "err" in message:
+                sys.stderr.write(message["err"])
+                sys.stderr.flush()
+            elif "read" in message:
+                send_message(sock, {"line": sys.stdin.readline()})
+            elif "exit" in message:
+                return message["exit"]
+    sys.stderr.write("Uatu server stopped before the command finished\n")
+    return 1
+
+
+def main():
+    # Entry point of `uatu`: hands the command to the server of the project if
+    # one is up, runs it in this process otherwise
+    args = sys.argv[1:]
+    if (
+        hasattr(socket, "AF_UNIX")
+        and not os.environ.get(NO_SERVER_ENV)
+        and is_forwarded(args)
+        and exists(SERVER_SOCKET)
+    ):
+        code = forward(SERVER_SOCKET, args)
+        if code is not None:
+            sys.exit(code)
+    from .base import cli
+
+    cli(prog_name="uatu")
@@ -1,14 +1,31 @@
 import json
+import click
 from collections import defaultdict
 from functools import reduce
-from typing import List, Union
+from typing import Any, Callable, Dict, List, Union
 from uatu.core.orm import File, Record, Pipeline, Experiment
-from tabulate import tabulate
+
+
+def grid(table: Dict[str, list], **kwargs) -> str:
+    # tabulate is only imported by the commands printing tables
+    from tabulate import tabulate
+
+    return tabulate(table, headers="keys", tablefmt="grid", **kwargs)
+
+
+def paging_options(command: Callable) -> Callable:
+    # --limit/--offset of listings, which print a page of rows at a time
+    command = click.option(
+        "--offset", type=int, default=0, help="Rows to skip when listing all"
+    )(command)
+    return click.option(
+        "--limit", "-n", type=int, help="Rows to list at most when listing all"
+    )(command)
 
 
 def file_summary(file: File) -> str:
-    pred_ids = json.loads(file.predecessor_ids)
-    succ_ids = json.loads(file.successor_ids)
+    pred_ids = file.predecessor_ids
+    succ_ids = file.successor_ids
     num_rows = max(len(pred_ids), len(succ_ids), 1)
     summary = f"[ ID: {file.id} PATH: {file.path} ]"
     header_length = len(summary)
@@ -61,20 +78,20 @@ def file_details(files: List[File]):
     for file in files:
         table["ID"].append(file.id)
         table["PATH"].append(file.path)
-        table["NODES"].append("\n".join(node.id for node in file.nodes))
+        table["NODES"].append("\n".join(node.id for node in file.records))
         table["PREDECESSORS"].append(
-            "\n".join(pred_id for pred_id in json.loads(file.predecessor_ids))
+            "\n".join(pred_id for pred_id in file.predecessor_ids)
         )
         table["SUCCESSORS"].append(
-            "\n".join(succ_id for succ_id in json.loads(file.successor_ids))
+            "\n".join(succ_id for succ_id in file.successor_ids)
         )
 
-    return tabulate(table, headers="keys", tablefmt="grid")
+    return grid(table)
 
 
 def node_summary(node: Record):
-    pred_ids = json.loads(node.predecessor_ids)
-    succ_ids = json.loads(node.successor_ids)
+    pred_ids = node.predecessor_ids
+    succ_ids = node.successor_ids
     num_rows = max(len(pred_ids), len(succ_ids), 1)
     summary = f"[ ID: {node.id} PATH: {node.file.path} COMMIT_ID: {node.commit_id[:3]}...{node.commit_id[-3:]}]"
     header_length = len(summary)
@@ -130,12 +147,12 @@ def node_details(nodes: List[Record]) -> str:
         table["FILE_ID"].append(node.file_id)
         table["COMMIT_ID"].append(node.commit_id)
         table["PREDECESSORS"].append(
-            "\n".join(pred_id for pred_id in json.loads(node.predecessor_ids))
+            "\n".join(pred_id for pred_id in node.predecessor_ids)
         )
         table["SUCCESSORS"].append(
-            "\n".join(succ_id for succ_id in json.loads(node.successor_ids))
+            "\n".join(succ_id for succ_id in node.successor_ids)
         )
-    return tabulate(table, headers="keys", tablefmt="grid")
+    return grid(table)
 
 
 def pipeline_summary(pipeline: Pipeline) -> str:
@@ -197,5 +214,19 @@ def pipeline_details(pipelines: List[Pipeline]):
             "\n".join([expr.id for expr in pipeline.experiments])
         )
 
-    return tabulate(table, headers="keys", tablefmt="grid", stralign="center")
+    return grid(table, stralign="center")
+
 
+def experiment_details(
+    experiments: List[Experiment],
+    values: Dict[str, Dict[str, Any]],
+    names: List[str],
+) -> str:
+    table = defaultdict(list)
+    for experiment in experiments:
+        table["ID"].append(experiment.id)
+        table["DESCRIPTION"].append(experiment.description)
+        table["PIPELINE_ID"].append(experiment.pipeline_id)
+        for name in names:
+            table[name.upper()].append(values[experiment.id].get(name, ""))
+    return grid(table)
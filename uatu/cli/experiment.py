@@ -0,0 +1,69 @@
+import re
+import click
+from typing import Tuple, Optional, NoReturn
+from .diagrams import experiment_details
+from uatu.core.database import (
+    QUERY_OPERATORS,
+    query_experiments,
+    get_experiment_values,
+)
+
+CONDITION_PATTERN = re.compile(
+    r"^\s*([\w.\-]+)\s*("
+    + "|".join(sorted(QUERY_OPERATORS, key=len, reverse=True))
+    + r")\s*(.+?)\s*$"
+)
+
+
+def parse_condition(condition: str) -> Tuple[str, str, object]:
+    match = CONDITION_PATTERN.match(condition)
+    if not match:
+        raise click.BadParameter(f"Can not parse condition '{condition}'")
+    name, op, value = match.groups()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"":
+        return name, op, value[1:-1]
+    try:
+        return name, op, float(value)
+    except ValueError:
+        return name, op, value
+
+
+@click.group("experiment")
+@click.pass_context
+def experiment_cli(ctx: click.Context):
+    pass
+
+
+@experiment_cli.command("query")
+@click.option(
+    "--where", "-w", "conditions", multiple=True, help="e.g. 'hparams.lr<1e-3'"
+)
+@click.option("--sort", "-s", "order_by", help="e.g. 'metrics.val_acc'")
+@click.option("--desc", "-d", "descending", is_flag=True, default=False)
+@click.option("--limit", "-n", type=int)
+@click.option("--column", "-c", "columns", multiple=True)
+@click.pass_context
+def experiment_query(
+    ctx: click.Context,
+    conditions: Tuple[str],
+    order_by: Optional[str],
+    descending: bool,
+    limit: Optional[int],
+    columns: Tuple[str],
+) -> NoReturn:
+    filters = [parse_condition(condition) for condition in conditions]
+    try:
+        experiments = query_experiments(
+            ctx.obj["sess"], filters, order_by, descending, limit
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    names = []
+    for name in [name for name, _, _ in filters] + [order_by] + list(columns):
+        if name and name not in names:
+            names.append(name)
+    values = get_experiment_values(
+        ctx.obj["sess"], [experiment.id for experiment in experiments], names
+    )
+    click.echo(experiment_details(experiments, values, names))
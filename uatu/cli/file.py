@@ -1,9 +1,11 @@
 import json
 import click
-from typing import Tuple
+from typing import Tuple, Optional
 from collections import defaultdict
-from .diagrams import file_details, file_summary
-from uatu.core.database import get_file, get_all_files, delete_file
+from .diagrams import file_details, file_summary, paging_options
+from uatu.core.orm import File
+from uatu.core.utils import get_relative_path
+from uatu.core.database import delete_files, query_files, iter_pages
 
 
 @click.group("file")
@@ -14,38 +16,51 @@ def file_cli(ctx: click.Context):
 
 @file_cli.command("ls")
 @click.argument("files", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@paging_options
 @click.pass_context
-def file_ls(ctx: click.Context, files: Tuple[str]):
+def file_ls(ctx: click.Context, files: Tuple[str], limit: Optional[int], offset: int):
     if files:
+        found = {
+            file_.path: file_
+            for file_ in query_files(ctx.obj["sess"], file_paths=files)
+        }
         for file_path in files:
-            file_ = get_file(ctx.obj["sess"], file_path=file_path, create=False)
-            if file_:
-                click.echo(file_summary(file_))
+            rel_path = get_relative_path(file_path)
+            if rel_path in found:
+                click.echo(file_summary(found[rel_path]))
             else:
                 click.echo(f"{file_path} is not under Uatu's watch!")
 
     else:
-        files = get_all_files(ctx.obj["sess"])
-        for file_ in files:
-            click.echo(file_summary(file_))
+        pages = iter_pages(query_files(ctx.obj["sess"]), File.id, limit, offset)
+        for files in pages:
+            for file_ in files:
+                click.echo(file_summary(file_))
 
 
 @file_cli.command("show")
 @click.argument("file_ids", nargs=-1, type=str)
+@paging_options
 @click.pass_context
-def file_show(ctx: click.Context, file_ids: Tuple[str]):
+def file_show(
+    ctx: click.Context, file_ids: Tuple[str], limit: Optional[int], offset: int
+):
     if file_ids:
+        found = {
+            file_.id: file_ for file_ in query_files(ctx.obj["sess"], file_ids=file_ids)
+        }
         files = []
         for file_id in file_ids:
-            file_ = get_file(ctx.obj["sess"], file_id=file_id)
-            if file_:
-                files.append(file_)
+            if file_id in found:
+                files.append(found[file_id])
             else:
                 click.echo(f"{file_id} is not a Uatu's file id")
+        click.echo(file_details(files))
 
     else:
-        files = get_all_files(sess=ctx.obj["sess"])
-    click.echo(file_details(files))
+        pages = iter_pages(query_files(ctx.obj["sess"]), File.id, limit, offset)
+        for files in pages:
+            click.echo(file_details(files))
 
 
 @file_cli.command("del")
@@ -54,23 +69,15 @@ def file_show(ctx: click.Context, file_ids: Tuple[str]):
 @click.pass_context
 def file_delete(ctx: click.Context, file_ids: Tuple[str], yes: bool):
     if file_ids:
-        for file_id in file_ids:
-            if not yes:
-                click.confirm(
-                    f"Are you sure you want to delete file {file_id}?\nThis will "
-                    "delete every node, pipeline and experiment attached to it!",
-                    default=False,
-                    abort=True,
-                )
-            delete_file(ctx.obj["sess"], file_id=file_id)
+        targets = f"file {', '.join(file_ids)}"
     else:
-        files = get_all_files(ctx.obj["sess"])
-        for file_ in files:
-            if not yes:
-                click.confirm(
-                    f"Are you sure you want to delete file {file_.id}?\nThis will "
-                    "delete every node, pipeline and experiment attached to it!",
-                    default=False,
-                    abort=True,
-                )
-            delete_file(ctx.obj["sess"], file=file_)
+        file_ids = [file_id for (file_id,) in ctx.obj["sess"].query(File.id)]
+        targets = f"all {len(file_ids)} files"
+    if not yes:
+        click.confirm(
+            f"Are you sure you want to delete {targets}?\nThis will "
+            "delete every node, pipeline and experiment attached to it!",
+            default=False,
+            abort=True,
+        )
+    delete_files(ctx.obj["sess"], list(file_ids))
@@ -0,0 +1,69 @@
+import click
+from itertools import islice
+from typing import Optional, NoReturn
+from uatu.core.database import get_file, get_node, get_lineage
+from uatu.core.orm import File, Record, FILE_LEVEL, RECORD_LEVEL
+
+
+@click.command("lineage")
+@click.argument("target", type=str)
+@click.option(
+    "--commit", "-c", "commit_id", help="Use the node of file TARGET at this commit"
+)
+@click.option("--upstream/--downstream", "-u/-d", default=False)
+@click.option("--depth", "-n", "max_depth", type=int)
+@click.pass_context
+def lineage(
+    ctx: click.Context,
+    target: str,
+    commit_id: Optional[str],
+    upstream: bool,
+    max_depth: Optional[int],
+) -> NoReturn:
+    sess = ctx.obj["sess"]
+    node = None if commit_id else get_node(sess, node_id=target, create=False)
+    if node:
+        level, node_id = RECORD_LEVEL, node.id
+    else:
+        file_ = get_file(sess, file_id=target, create=False) or get_file(
+            sess, file_path=target, create=False
+        )
+        if not file_:
+            click.echo(f"{target} is neither a node nor a file under Uatu's watch!")
+            ctx.abort()
+        if commit_id:
+            commit_id = ctx.obj["repo"].rev_parse(commit_id).hexsha
+            node = get_node(
+                sess, file_path=file_.path, commit_id=commit_id, create=False
+            )
+            if not node:
+                click.echo(f"{file_.path} has no node at commit {commit_id}")
+                ctx.abort()
+            level, node_id = RECORD_LEVEL, node.id
+        else:
+            level, node_id = FILE_LEVEL, file_.id
+
+    # Results are streamed and resolved in batches. `uatu server` keeps the
+    # lineage graphs in memory, elsewhere the database walks the edges.
+    graphs = ctx.obj.get("lineage_graphs")
+    if graphs:
+        graph = graphs[level][1]
+        walk = graph.ancestors if upstream else graph.descendants
+        ids = iter(
+            sorted(walk(node_id, max_depth) - {node_id}) if node_id in graph else []
+        )
+    else:
+        ids = get_lineage(sess, node_id, level, upstream, max_depth)
+    while True:
+        batch = list(islice(ids, 500))
+        if not batch:
+            break
+        if level == RECORD_LEVEL:
+            rows = sess.query(Record.id, File.path, Record.commit_id).join(File)
+            rows = {row.id: row for row in rows.filter(Record.id.in_(batch))}
+        else:
+            rows = sess.query(File.id, File.path)
+            rows = {row.id: row for row in rows.filter(File.id.in_(batch))}
+        for id_ in batch:
+            if id_ in rows:
+                click.echo("  ".join(value or "" for value in rows[id_]))
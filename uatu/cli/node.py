@@ -1,9 +1,10 @@
 import json
 import click
-from typing import Tuple
+from typing import Tuple, Optional
 from collections import defaultdict
-from .diagrams import node_summary, node_details
-from uatu.core.database import get_node, get_all_nodes, delete_node
+from .diagrams import node_summary, node_details, paging_options
+from uatu.core.orm import Record
+from uatu.core.database import delete_nodes, query_nodes, iter_pages
 from uatu.core.utils import get_relative_path
 
 
@@ -15,38 +16,47 @@ def node_cli(ctx: click.Context):
 
 @node_cli.command("ls")
 @click.argument("node_ids", nargs=-1, type=str)
+@paging_options
 @click.pass_context
-def node_ls(ctx: click.Context, node_ids: Tuple[str]):
+def node_ls(
+    ctx: click.Context, node_ids: Tuple[str], limit: Optional[int], offset: int
+):
     if node_ids:
+        nodes = {node.id: node for node in query_nodes(ctx.obj["sess"], node_ids)}
         for node_id in node_ids:
-            node = get_node(ctx.obj["sess"], node_id=node_id)
-            if node:
-                click.echo(node_summary(node))
+            if node_id in nodes:
+                click.echo(node_summary(nodes[node_id]))
             else:
                 click.echo(f'Record {node_id} not exists!')
 
     else:
-        nodes = get_all_nodes(ctx.obj["sess"])
-        for node in nodes:
-            click.echo(node_summary(node))
+        pages = iter_pages(query_nodes(ctx.obj["sess"]), Record.id, limit, offset)
+        for nodes in pages:
+            for node in nodes:
+                click.echo(node_summary(node))
 
 
 @node_cli.command("show")
 @click.argument("node_ids", nargs=-1, type=str)
+@paging_options
 @click.pass_context
-def node_show(ctx: click.Context, node_ids: Tuple[str]):
+def node_show(
+    ctx: click.Context, node_ids: Tuple[str], limit: Optional[int], offset: int
+):
     if node_ids:
+        found = {node.id: node for node in query_nodes(ctx.obj["sess"], node_ids)}
         nodes = []
         for node_id in node_ids:
-            node = get_node(ctx.obj["sess"], node_id=node_id, create=False)
-            if node:
-                nodes.append(node)
+            if node_id in found:
+                nodes.append(found[node_id])
             else:
                 click.echo(f'Record {node_id} not exists!')
+        click.echo(node_details(nodes))
 
     else:
-        nodes = get_all_nodes(sess=ctx.obj["sess"])
-    click.echo(node_details(nodes))
+        pages = iter_pages(query_nodes(ctx.obj["sess"]), Record.id, limit, offset)
+        for nodes in pages:
+            click.echo(node_details(nodes))
 
 
 @node_cli.command("del")
@@ -55,23 +65,15 @@ def node_show(ctx: click.Context, node_ids: Tuple[str]):
 @click.pass_context
 def node_delete(ctx: click.Context, node_ids: Tuple[str], yes: bool):
     if node_ids:
-        for node_id in node_ids:
-            if not yes:
-                click.confirm(
-                    f"Are you sure you want to delete node {node_id}?\n"
-                    "This will delete every experiment attached to it!",
-                    default=False,
-                    abort=True,
-                )
-            delete_node(ctx.obj["sess"], node_id=node_id)
+        targets = f"node {', '.join(node_ids)}"
     else:
-        nodes = get_all_nodes(ctx.obj["sess"])
-        for node in nodes:
-            if not yes:
-                click.confirm(
-                    f"Are you sure you want to delete node {node_id}?\n"
-                    "This will delete every experiment attached to it!",
-                    default=False,
-                    abort=True,
-                )
-            delete_node(ctx.obj["sess"], node=node)
+        node_ids = [node_id for (node_id,) in ctx.obj["sess"].query(Record.id)]
+        targets = f"all {len(node_ids)} nodes"
+    if not yes:
+        click.confirm(
+            f"Are you sure you want to delete {targets}?\n"
+            "This will delete every experiment attached to it!",
+            default=False,
+            abort=True,
+        )
+    delete_nodes(ctx.obj["sess"], list(node_ids))
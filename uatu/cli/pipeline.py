@@ -1,10 +1,12 @@
 import json
 import click
-from typing import Tuple, NoReturn
+from typing import Tuple, Optional, NoReturn
 from functools import reduce
-from .diagrams import pipeline_summary, pipeline_details
+from os.path import join
+from .diagrams import pipeline_summary, pipeline_details, paging_options
 from uatu.core.orm import Pipeline
-from uatu.core.database import get_pipeline, get_all_pipelines
+from uatu.core.database import get_pipeline, query_pipelines, iter_pages
+from uatu.core.executor import run_pipelines, FAILED
 
 
 @click.group("pipeline")
@@ -15,38 +17,93 @@ def pipeline_cli(ctx: click.Context):
 
 @pipeline_cli.command("ls")
 @click.argument("pipeline_ids", nargs=-1, type=str)
+@paging_options
 @click.pass_context
-def pipeline_ls(ctx: click.Context, pipeline_ids: Tuple[str]) -> NoReturn:
+def pipeline_ls(
+    ctx: click.Context, pipeline_ids: Tuple[str], limit: Optional[int], offset: int
+) -> NoReturn:
     if pipeline_ids:
+        found = {
+            pipeline.id: pipeline
+            for pipeline in query_pipelines(ctx.obj["sess"], pipeline_ids)
+        }
         for pipeline_id in pipeline_ids:
-            pipeline = get_pipeline(
-                ctx.obj["sess"], pipeline_id=pipeline_id, create=False
-            )
-            if pipeline:
-                click.echo(pipeline_summary(pipeline))
+            if pipeline_id in found:
+                click.echo(pipeline_summary(found[pipeline_id]))
             else:
                 click.echo(f"Pipeline '{pipeline_id}' not exists!")
     else:
-        pipelines = get_all_pipelines(ctx.obj["sess"])
-        for pipeline in pipelines:
-            click.echo(pipeline_summary(pipeline))
+        pages = iter_pages(query_pipelines(ctx.obj["sess"]), Pipeline.id, limit, offset)
+        for pipelines in pages:
+            for pipeline in pipelines:
+                click.echo(pipeline_summary(pipeline))
 
 
 @pipeline_cli.command("show")
 @click.argument("pipeline_ids", nargs=-1, type=str)
+@paging_options
 @click.pass_context
-def pipeline_show(ctx: click.Context, pipeline_ids: Tuple[str]) -> NoReturn:
+def pipeline_show(
+    ctx: click.Context, pipeline_ids: Tuple[str], limit: Optional[int], offset: int
+) -> NoReturn:
     if pipeline_ids:
+        found = {
+            pipeline.id: pipeline
+            for pipeline in query_pipelines(ctx.obj["sess"], pipeline_ids)
+        }
         pipelines = []
         for pipeline_id in pipeline_ids:
-            pipeline = get_pipeline(ctx.obj["sess"], pipeline_id=pipeline_id)
-            if pipeline:
-                pipelines.append(pipeline)
+            if pipeline_id in found:
+                pipelines.append(found[pipeline_id])
             else:
                 click.echo(f"Pipeline '{pipeline_id}' not exists!")
-
         click.echo(pipeline_details(pipelines))
     else:
-        pipelines = get_all_pipelines(ctx.obj["sess"])
-    click.echo(pipeline_details(pipelines))
+        pages = iter_pages(query_pipelines(ctx.obj["sess"]), Pipeline.id, limit, offset)
+        for pipelines in pages:
+            click.echo(pipeline_details(pipelines))
 
+
+@pipeline_cli.command("run")
+@click.argument("pipeline_ids", nargs=-1, type=str, required=True)
+@click.option("--jobs", "-j", type=int, default=1, help="Scripts to run at once")
+@click.option(
+    "--log_dir",
+    "-l",
+    type=click.Path(file_okay=False),
+    default=join(".uatu", "logs"),
+    help="Directory of the per-stage log files",
+)
+@click.option(
+    "--force", "-f", is_flag=True, default=False, help="Ignore memoized stages"
+)
+@click.pass_context
+def pipeline_run(
+    ctx: click.Context, pipeline_ids: Tuple[str], jobs: int, log_dir: str, force: bool
+) -> NoReturn:
+    pipelines = []
+    for pipeline_id in pipeline_ids:
+        pipeline = get_pipeline(ctx.obj["sess"], pipeline_id=pipeline_id, create=False)
+        if not pipeline:
+            click.echo(f"Pipeline '{pipeline_id}' not exists!")
+            ctx.abort()
+        pipelines.append(pipeline)
+    try:
+        results = run_pipelines(
+            ctx.obj["sess"], ctx.obj["repo"], pipelines, jobs, log_dir, force
+        )
+        failed = 0
+        for result in results:
+            message = f"[{result.status}] {result.step.script}"
+            if result.experiment:
+                message += f" -> experiment {result.experiment.id}"
+            if result.status == FAILED:
+                failed += 1
+                message += f" exited with code {result.returncode}"
+                if result.log_file:
+                    message += f", see {result.log_file}"
+            click.echo(message)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if failed:
+        ctx.exit(1)
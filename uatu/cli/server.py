@@ -0,0 +1,225 @@
+import io
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import traceback
+from os.path import realpath
+from typing import List, NoReturn
+import click
+from .client import SERVER_SOCKET, send_message
+
+# Output is sent to the client by chunks of this many characters, or sooner
+# when a command flushes this long after the last chunk
+CHUNK_SIZE = 1 << 16
+FLUSH_INTERVAL = 0.05
+
+
+class ServerStopped(BaseException):
+    # Raised by SIGINT and SIGTERM, through any command being run
+    pass
+
+
+class ClientOutput(io.TextIOBase):
+    # sys.stdout or sys.stderr of a forwarded command
+    def __init__(self, sock: socket.socket, kind: str):
+        self.sock = sock
+        self.kind = kind
+        self._chunks: List[str] = []
+        self._size = 0
+        self._sent = time.monotonic()
+
+    @property
+    def encoding(self) -> str:
+        return "utf-8"
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if not isinstance(text, str):  # How click tells text from binary streams
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= CHUNK_SIZE:
+            self.drain()
+        return len(text)
+
+    def flush(self):
+        if time.monotonic() - self._sent >= FLUSH_INTERVAL:
+            self.drain()
+
+    def drain(self):
+        if self._chunks:
+            send_message(self.sock, {self.kind: "".join(self._chunks)})
+            self._chunks, self._size = [], 0
+        self._sent = time.monotonic()
+
+
+class ClientInput(io.TextIOBase):
+    # sys.stdin of a forwarded command, lines are read by the client on demand
+    def __init__(
+        self,
+        sock: socket.socket,
+        reader: io.BufferedReader,
+        outputs: List[ClientOutput],
+    ):
+        self.sock = sock
+        self.reader = reader
+        self.outputs = outputs
+
+    @property
+    def encoding(self) -> str:
+        return "utf-8"
+
+    def readable(self) -> bool:
+        return True
+
+    def readline(self, size: int = -1) -> str:
+        for output in self.outputs:  # e.g. the question of a confirm
+            output.drain()
+        send_message(self.sock, {"read": True})
+        return json.loads(self.reader.readline() or b'{"line": ""}')["line"]
+
+
+def run_command(args: List[str], obj: dict) -> int:
+    # Like `uatu <args>` in standalone mode, but never exits
+    from .base import cli
+
+    try:
+        code = cli.main(args, prog_name="uatu", obj=obj, standalone_mode=False)
+        return code if isinstance(code, int) else 0
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+def handle(conn: socket.socket, root: str, obj: dict):
+    with conn.makefile("rb") as reader:
+        request = json.loads(reader.readline())
+        if realpath(request["cwd"]) != root:
+            send_message(conn, {"exit": None})
+            return
+        stdout, stderr = ClientOutput(conn, "out"), ClientOutput(conn, "err")
+        streams = sys.stdin, sys.stdout, sys.stderr
+        sys.stdin = ClientInput(conn, reader, [stdout, stderr])
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            refresh_lineage_graphs(obj)
+            code = run_command(request["args"], obj)
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = streams
+            # Ends the command's transaction so the next one sees the writes
+            # of other processes, and expires every loaded object
+            obj["sess"].rollback()
+        stdout.drain()
+        stderr.drain()
+        send_message(conn, {"exit": code})
+
+
+def open_server_socket(address: str) -> socket.socket:
+    if os.path.exists(address):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(address)
+        except OSError:
+            os.remove(address)  # Left behind by a server that did not stop cleanly
+        else:
+            raise click.ClickException(
+                f"A Uatu server is already listening on {address}"
+            )
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the user may connect, commands run with their rights
+    umask = os.umask(0o177)
+    try:
+        sock.bind(address)
+    finally:
+        os.umask(umask)
+    sock.listen()
+    return sock
+
+
+def warm_up(obj: dict):
+    # Everything a command would load on its first run: the subcommands, the
+    # mappers, a database connection, the repo and the lineage graphs
+    from sqlalchemy import text
+    from sqlalchemy.orm import configure_mappers
+    from ..core.lineage import get_lineage_graph
+    from ..core.orm import FILE_LEVEL, RECORD_LEVEL
+    from .base import cli
+
+    ctx = click.Context(cli)
+    for name in cli.list_commands(ctx):
+        cli.get_command(ctx, name)
+    configure_mappers()
+    obj["sess"].execute(text("SELECT 1"))
+    obj["sess"].rollback()
+    if obj["repo"].head.is_valid():  # A repo without commits yet has no HEAD
+        obj["repo"].head.commit
+    obj["lineage_graphs"] = {
+        level: get_lineage_graph(obj["sess"], level)
+        for level in (FILE_LEVEL, RECORD_LEVEL)
+    }
+    obj["sess"].rollback()
+
+
+def refresh_lineage_graphs(obj: dict):
+    # Replays the edges other processes changed since the last command, most
+    # often one query returning nothing, and saves a new snapshot once enough
+    # piled up
+    from ..core.lineage import refresh_lineage_graph
+
+    graphs = obj["lineage_graphs"]
+    for level, (generation, graph) in graphs.items():
+        graphs[level] = refresh_lineage_graph(obj["sess"], generation, graph, level)
+
+
+def stop_server(signum: int, frame):
+    raise ServerStopped()
+
+
+def serve(sock: socket.socket, obj: dict) -> NoReturn:
+    # Commands run one at a time, in the order clients connect
+    root = realpath(os.getcwd())
+    while True:
+        conn, _ = sock.accept()
+        with conn:
+            try:
+                handle(conn, root, obj)
+            except Exception:  # Client gone or bad request, the server goes on
+                traceback.print_exc()
+
+
+@click.command("server")
+@click.pass_context
+def server(ctx: click.Context) -> NoReturn:
+    # Keeps the session, repo and imports of this project loaded and runs the
+    # `uatu` commands of clients in this directory until Ctrl-C or SIGTERM.
+    # Commands fall back to running in their own process when it is down.
+    if not hasattr(socket, "AF_UNIX"):
+        raise click.ClickException("Uatu server needs Unix domain sockets")
+    obj = {"sess": ctx.obj["sess"], "repo": ctx.obj["repo"]}
+    warm_up(obj)
+    sock = open_server_socket(SERVER_SOCKET)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, stop_server)
+    click.echo(f"Uatu server listening on {SERVER_SOCKET}")
+    try:
+        serve(sock, obj)
+    except ServerStopped:
+        pass
+    finally:
+        sock.close()
+        os.remove(SERVER_SOCKET)
@@ -0,0 +1,70 @@
+import click
+import yaml
+from os.path import join
+from typing import Tuple, NoReturn
+from uatu.core.executor import FAILED
+from uatu.core.sweep import expand_sweep, run_sweep
+
+
+@click.command("sweep")
+@click.argument("script", type=click.Path(exists=True, dir_okay=False))
+@click.argument("spec_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--input", "-i", "inputs", multiple=True, help="File the script reads")
+@click.option("--output", "-o", "outputs", multiple=True, help="File the script writes")
+@click.option("--jobs", "-j", type=int, default=1, help="Trials to run at once")
+@click.option(
+    "--log_dir",
+    "-l",
+    type=click.Path(file_okay=False),
+    default=join(".uatu", "logs"),
+    help="Directory of the per-trial log files",
+)
+@click.option(
+    "--force", "-f", is_flag=True, default=False, help="Rerun recorded trials"
+)
+@click.pass_context
+def sweep(
+    ctx: click.Context,
+    script: str,
+    spec_file: str,
+    inputs: Tuple[str],
+    outputs: Tuple[str],
+    jobs: int,
+    log_dir: str,
+    force: bool,
+) -> NoReturn:
+    # SPEC_FILE is YAML, e.g. {method: random, num_trials: 20, parameters:
+    # {lr: {min: 1.0e-5, max: 1.0e-1, log: true}, batch_size: [32, 64]}}.
+    # The script gets the hparams of its trial through Run(hparams=...).
+    with open(spec_file) as f:
+        spec = yaml.safe_load(f) or {}
+    try:
+        trials = expand_sweep(spec)
+        results = run_sweep(
+            ctx.obj["sess"],
+            ctx.obj["repo"],
+            script,
+            trials,
+            list(inputs),
+            list(outputs),
+            jobs,
+            log_dir,
+            force,
+        )
+        failed = 0
+        for result in results:
+            message = (
+                f"[{result.status}] trial {result.trial.index} {result.trial.hparams}"
+            )
+            if result.experiment:
+                message += f" -> experiment {result.experiment.id}"
+            if result.status == FAILED:
+                failed += 1
+                message += f" exited with code {result.returncode}"
+                if result.log_file:
+                    message += f", see {result.log_file}"
+            click.echo(message)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if failed:
+        ctx.exit(1)
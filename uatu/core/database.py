@@ -1,22 +1,198 @@
+from __future__ import annotations  # GitPython is only imported to open a repo
+import os
 import json
+import time
+import random
+import operator
 import click
-from typing import Union, List, Optional, NoReturn
-from copy import deepcopy
-from git import Repo
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Union,
+    List,
+    Dict,
+    Optional,
+    NoReturn,
+    Iterator,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
+from sqlalchemy import create_engine, event, text, and_, tuple_, select, literal
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, Session, aliased, Query, selectinload
 from sqlalchemy.ext.declarative import declarative_base
-from .orm import Base, File, Pipeline, Record, Experiment
-from .utils import id_generator, get_relative_path
-from .git import get_last_commit, get_tracked_files, add_file, get_repo
+from .orm import (
+    Base,
+    File,
+    Pipeline,
+    Record,
+    Experiment,
+    Edge,
+    PipelineFile,
+    ExperimentNode,
+    ExperimentValue,
+    FILE_LEVEL,
+    RECORD_LEVEL,
+    VALUE_KINDS,
+)
+from .migrations import upgrade
+from .utils import (
+    id_generator,
+    get_relative_path,
+    get_fingerprint,
+    flatten_dict,
+    split_typed_value,
+    chunks,
+    file_lock,
+)
+from .git import (
+    get_last_commit,
+    get_last_commits,
+    add_files,
+    get_repo,
+)
+
+if TYPE_CHECKING:
+    from git import Repo
+
+# Seconds SQLite itself waits on a locked database before giving up
+BUSY_TIMEOUT = 30
+# Extra attempts, with jittered exponential backoff, once the busy timeout expired
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.1
+# In the git dir: experiments of every process stage and commit one at a time,
+# git itself fails on a concurrent index.lock instead of waiting
+GIT_LOCK_FILE = "uatu.lock"
+# Rows a listing loads at a time, see iter_pages
+PAGE_SIZE = 500
+
+_session_factories: Dict[str, sessionmaker] = {}
+
+
+def configure_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT * 1000}")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+
+def is_lock_error(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+def retry_on_lock(func: Callable, *args, **kwargs):
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if attempt == LOCK_RETRIES or not is_lock_error(e):
+                raise
+            time.sleep(random.uniform(0, LOCK_BACKOFF * 2**attempt))
+
+
+def get_engine(db_file: str) -> Engine:
+    return get_session_factory(db_file).kw["bind"]
+
+
+def get_session_factory(db_file: str) -> sessionmaker:
+    # One engine (and one schema check) per database file and process
+    db_file = os.path.abspath(db_file)
+    if db_file not in _session_factories:
+        engine = create_engine(
+            f"sqlite:///{db_file}",
+            connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT},
+            echo=False,
+        )
+        event.listen(engine, "connect", configure_connection)
+        retry_on_lock(upgrade, engine)
+        _session_factories[db_file] = sessionmaker(bind=engine)
+    return _session_factories[db_file]
 
 
 def initialize_db(db_file: str) -> Session:
-    engine = create_engine(f"sqlite:///{db_file}?check_same_thread=False", echo=False)
-    Base.metadata.create_all(engine, checkfirst=True)
-    Session_cls = sessionmaker(bind=engine)
-    session = Session_cls()
-    return session
+    from .lineage import trim_edge_log  # lineage.py imports this module
+
+    sess = get_session_factory(db_file)()
+    trim_edge_log(sess)
+    return sess
+
+
+def begin_immediate(sess: Session) -> NoReturn:
+    # Take SQLite's write lock up front: a deferred transaction that reads
+    # before writing can not wait for a concurrent writer and fails instead.
+    dbapi_connection = sess.connection().connection
+    if not dbapi_connection.in_transaction:
+        sess.connection().execute(text("BEGIN IMMEDIATE"))
+
+
+def start_transaction(sess: Session) -> NoReturn:
+    try:
+        begin_immediate(sess)
+    except OperationalError:
+        sess.rollback()
+        raise
+
+
+@contextmanager
+def transaction(sess: Session) -> Iterator[Session]:
+    # Helpers called inside this block only flush their changes, the outermost
+    # block holds the write lock, commits once on success and rolls everything
+    # back on failure.
+    depth = sess.info.get("transaction_depth", 0)
+    if depth == 0:
+        retry_on_lock(start_transaction, sess)
+    sess.info["transaction_depth"] = depth + 1
+    try:
+        yield sess
+    except BaseException:
+        sess.info["transaction_depth"] = depth
+        if depth == 0:
+            sess.rollback()
+        raise
+    sess.info["transaction_depth"] = depth
+    if depth == 0:
+        sess.commit()
+
+
+def commit(sess: Session) -> NoReturn:
+    if sess.info.get("transaction_depth", 0) > 0:
+        sess.flush()
+    else:
+        sess.commit()
+
+
+def iter_pages(
+    query: Query,
+    key: Any,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[list]:
+    # Yields the rows of `query` ordered by the unique column `key`, one page
+    # at a time: each page is a query of its own (after `key` of the last row,
+    # so skipping pages costs nothing) and runs the selectinload options of
+    # `query` once, so only one page of rows and relatives is held at a time
+    last = None
+    while limit is None or limit > 0:
+        size = page_size if limit is None else min(page_size, limit)
+        page = query.order_by(key)
+        if last is None:
+            page = page.offset(offset)
+        else:
+            page = page.filter(key > last)
+        rows = page.limit(size).all()
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        if limit is not None:
+            limit -= len(rows)
+        last = getattr(rows[-1], key.key)
 
 
 def get_file(
@@ -36,10 +212,27 @@ def get_file(
     if (not file_) and create:
         file_ = File(id=id_generator(salt="file"), path=rel_path)
         sess.add(file_)
-        sess.commit()
+        commit(sess)
     return file_
 
 
+def get_files(
+    sess: Session, file_paths: List[str], create: bool = True
+) -> Dict[str, File]:
+    rel_paths = sorted(set(get_relative_path(file_path) for file_path in file_paths))
+    files = {}
+    for chunk in chunks(rel_paths):
+        for file_ in sess.query(File).filter(File.path.in_(chunk)):
+            files[file_.path] = file_
+    missing = [rel_path for rel_path in rel_paths if rel_path not in files]
+    if missing and create:
+        for rel_path in missing:
+            files[rel_path] = File(id=id_generator(salt="file"), path=rel_path)
+            sess.add(files[rel_path])
+        commit(sess)
+    return files
+
+
 def delete_file(
     sess: Session,
     file: Optional[File] = None,
@@ -48,47 +241,143 @@ def delete_file(
 ) -> NoReturn:
     assert (not file is None) or (not file_path is None) or (not file_id is None)
     if not file:
-        file = get_file(sess, file_path=file_path, file_id=file_id)
+        file = get_file(sess, file_path=file_path, file_id=file_id, create=False)
+    if file:
+        delete_files(sess, [file.id])
 
-    pipelines = get_all_pipelines(sess)
-    for pipeline in pipelines:
-        for file_id_list in pipeline.file_id_lists:
-            if file.id in file_id_list:
-                delete_pipeline(sess, pipeline)
-                break
-    for node in file.nodes:
-        delete_node(sess, node=node)
 
-    sess.delete(file)
-    sess.commit()
+def delete_files(sess: Session, file_ids: List[str]) -> NoReturn:
+    with transaction(sess):
+        for chunk in chunks(file_ids):
+            pipeline_ids = sess.query(PipelineFile.pipeline_id).filter(
+                PipelineFile.file_id.in_(chunk)
+            )
+            delete_pipelines(sess, [row.pipeline_id for row in pipeline_ids.distinct()])
+            node_ids = sess.query(Record.id).filter(Record.file_id.in_(chunk))
+            delete_nodes(sess, [row.id for row in node_ids])
+            delete_incident_edges(sess, FILE_LEVEL, chunk)
+            sess.query(File).filter(File.id.in_(chunk)).delete(
+                synchronize_session=False
+            )
 
 
 def get_all_files(sess: Session) -> List[File]:
     return sess.query(File).all()
 
 
+def query_files(
+    sess: Session,
+    file_ids: Optional[List[str]] = None,
+    file_paths: Optional[List[str]] = None,
+) -> Query:
+    # Files with their records and edges, for iter_pages
+    query = sess.query(File).options(
+        selectinload(File.records),
+        selectinload(File.predecessor_edges),
+        selectinload(File.successor_edges),
+    )
+    if file_ids is not None:
+        query = query.filter(File.id.in_(file_ids))
+    if file_paths is not None:
+        query = query.filter(
+            File.path.in_([get_relative_path(file_path) for file_path in file_paths])
+        )
+    return query
+
+
+def get_edge_level(node: Union[File, Record]) -> str:
+    return FILE_LEVEL if isinstance(node, File) else RECORD_LEVEL
+
+
 def add_edge(
     sess: Session, predecessor: Union[File, Record], successor: Union[File, Record]
 ) -> NoReturn:
-    preds_successor_ids = deepcopy(set(json.loads(predecessor.successor_ids)))
-    preds_successor_ids.add(successor.id)
-    predecessor.successor_ids = json.dumps(sorted(list(preds_successor_ids)))
-    sucs_predecessor_ids = deepcopy(set(json.loads(successor.predecessor_ids)))
-    sucs_predecessor_ids.add(predecessor.id)
-    successor.predecessor_ids = json.dumps(sorted(list(sucs_predecessor_ids)))
-    sess.commit()
+    sess.execute(
+        Edge.__table__.insert().prefix_with("OR IGNORE"),
+        {
+            "level": get_edge_level(predecessor),
+            "predecessor_id": predecessor.id,
+            "successor_id": successor.id,
+        },
+    )
+    sess.expire(predecessor, ["successor_edges"])
+    sess.expire(successor, ["predecessor_edges"])
+    commit(sess)
 
 
 def delete_edge(
     sess: Session, predecessor: Union[File, Record], successor: Union[File, Record]
 ) -> NoReturn:
-    preds_successor_ids = deepcopy(set(json.loads(predecessor.successor_ids)))
-    preds_successor_ids.remove(successor.id)
-    predecessor.successor_ids = json.dumps(sorted(list(preds_successor_ids)))
-    sucs_predecessor_ids = deepcopy(set(json.loads(successor.predecessor_ids)))
-    sucs_predecessor_ids.remove(predecessor.id)
-    successor.predecessor_ids = json.dumps(sorted(list(sucs_predecessor_ids)))
-    sess.commit()
+    sess.query(Edge).filter_by(
+        level=get_edge_level(predecessor),
+        predecessor_id=predecessor.id,
+        successor_id=successor.id,
+    ).delete(synchronize_session=False)
+    sess.expire(predecessor, ["successor_edges"])
+    sess.expire(successor, ["predecessor_edges"])
+    commit(sess)
+
+
+def delete_incident_edges(sess: Session, level: str, node_ids: List[str]) -> NoReturn:
+    sess.query(Edge).filter(
+        Edge.level == level,
+        Edge.predecessor_id.in_(node_ids) | Edge.successor_id.in_(node_ids),
+    ).delete(synchronize_session=False)
+
+
+def delete_stage_edges(
+    sess: Session, level: str, memberships: Query, owner_column, member_column
+) -> NoReturn:
+    # Drop the edges joining consecutive stages of the selected memberships
+    pred, succ = aliased(memberships.subquery()), aliased(memberships.subquery())
+    pairs = sess.query(getattr(pred.c, member_column), getattr(succ.c, member_column))
+    pairs = pairs.join(
+        succ,
+        and_(
+            getattr(succ.c, owner_column) == getattr(pred.c, owner_column),
+            succ.c.stage == pred.c.stage + 1,
+        ),
+    )
+    sess.query(Edge).filter(
+        Edge.level == level,
+        tuple_(Edge.predecessor_id, Edge.successor_id).in_(pairs.subquery().select()),
+    ).delete(synchronize_session=False)
+
+
+def get_lineage(
+    sess: Session,
+    node_id: str,
+    level: str = RECORD_LEVEL,
+    upstream: bool = False,
+    max_depth: Optional[int] = None,
+) -> Iterator[str]:
+    # Streams the ids reachable from `node_id` through `level` edges with a
+    # recursive CTE, walking predecessors instead of successors if `upstream`.
+    # UNION (not UNION ALL) visits every id once, so cycles terminate.
+    if upstream:
+        source, target = Edge.successor_id, Edge.predecessor_id
+    else:
+        source, target = Edge.predecessor_id, Edge.successor_id
+    if max_depth is None:
+        lineage = select(literal(node_id).label("id")).cte("lineage", recursive=True)
+        lineage = lineage.union(
+            select(target).where(Edge.level == level, source == lineage.c.id)
+        )
+    else:
+        # The depth column makes rows distinct per depth, bounded by max_depth
+        lineage = select(literal(node_id).label("id"), literal(0).label("depth")).cte(
+            "lineage", recursive=True
+        )
+        lineage = lineage.union(
+            select(target, lineage.c.depth + 1).where(
+                Edge.level == level,
+                source == lineage.c.id,
+                lineage.c.depth < max_depth,
+            )
+        )
+    query = select(lineage.c.id).where(lineage.c.id != node_id).distinct()
+    for row in sess.connection().execute(query):
+        yield row.id
 
 
 def get_pipeline(
@@ -98,37 +387,50 @@ def get_pipeline(
     create: bool = True,
 ) -> Union[Pipeline, None]:
     assert (not pipeline_id is None) or (not file_lists is None)
-    file_id_lists = []
 
     if pipeline_id:
-        pipeline = sess.query(Pipeline).filter_by(id=pipeline_id).first()
-    elif file_lists:
-        for file_path_list in file_lists:
-            file_id_list = []
-            for file_path in file_path_list:
-                file_id_list.append(get_file(sess, file_path=file_path).id)
-            file_id_lists.append(sorted(file_id_list))
-        pipeline = (
-            sess.query(Pipeline)
-            .filter_by(file_id_lists=json.dumps(file_id_lists))
-            .first()
-        )
+        return sess.query(Pipeline).filter_by(id=pipeline_id).first()
 
-    if (not pipeline) and (not file_lists) and create:
-        for i in range(len(file_lists) - 1):
-            if len(file_lists[i]) > 1 and len(file_lists[i + 1]) > 1:
-                raise ValueError("There should be no consecutive multiple files")
-            for pred_file_path in file_lists[i]:
-                predecessor = get_file(sess, pred_file_path)
-                for succ_file_path in file_lists[i + 1]:
-                    successor = get_file(sess, succ_file_path)
-                    add_edge(sess, predecessor, successor)
-
-        pipeline = Pipeline(
-            id=id_generator(salt="pipeline"), file_id_lists=json.dumps(file_id_lists)
+    with transaction(sess):
+        files = get_files(
+            sess,
+            [file_path for file_list in file_lists for file_path in file_list],
+            create,
         )
-        sess.add(pipeline)
-        sess.commit()
+        file_lists = [
+            [files.get(get_relative_path(file_path)) for file_path in file_list]
+            for file_list in file_lists
+        ]
+        if any(file_ is None for file_list in file_lists for file_ in file_list):
+            return None
+        file_id_lists = [
+            sorted(set(file_.id for file_ in file_list)) for file_list in file_lists
+        ]
+        fingerprint = get_fingerprint(file_id_lists)
+        pipeline = sess.query(Pipeline).filter_by(fingerprint=fingerprint).first()
+
+        if (not pipeline) and create:
+            for i in range(len(file_lists) - 1):
+                if len(file_lists[i]) > 1 and len(file_lists[i + 1]) > 1:
+                    raise ValueError("There should be no consecutive multiple files")
+                for predecessor in file_lists[i]:
+                    for successor in file_lists[i + 1]:
+                        add_edge(sess, predecessor, successor)
+
+            pipeline = Pipeline(
+                id=id_generator(salt="pipeline"),
+                file_id_lists=json.dumps(file_id_lists),
+                fingerprint=fingerprint,
+            )
+            sess.add(pipeline)
+            for stage, file_id_list in enumerate(file_id_lists):
+                for file_id in file_id_list:
+                    sess.add(
+                        PipelineFile(
+                            pipeline_id=pipeline.id, stage=stage, file_id=file_id
+                        )
+                    )
+            commit(sess)
     return pipeline
 
 
@@ -139,27 +441,42 @@ def delete_pipeline(
 ) -> NoReturn:
     assert (not pipeline is None) or (not pipeline_id is None)
     if not pipeline:
-        pipeline = get_pipeline(sess, pipeline_id)
+        pipeline = get_pipeline(sess, pipeline_id, create=False)
+    if pipeline:
+        delete_pipelines(sess, [pipeline.id])
 
-    for experiment in pipeline.experiments:
-        delete_experiment(sess, experiment=experiment)
 
-    file_id_lists = json.loads(pipeline.file_id_lists)
-    for i in range(len(file_id_lists) - 1):
-        for pred_file_id in file_id_lists[i]:
-            pred_file = get_file(sess, file_id=pred_file_id)
-            for succ_file_id in file_id_lists[i + 1]:
-                succ_file = get_file(sess, file_id=succ_file_id)
-                delete_edge(sess, pred_file, succ_file)
-
-    sess.delete(pipeline)
-    sess.commit()
+def delete_pipelines(sess: Session, pipeline_ids: List[str]) -> NoReturn:
+    with transaction(sess):
+        for chunk in chunks(pipeline_ids):
+            experiment_ids = sess.query(Experiment.id).filter(
+                Experiment.pipeline_id.in_(chunk)
+            )
+            delete_experiments(sess, [row.id for row in experiment_ids])
+            memberships = sess.query(PipelineFile).filter(
+                PipelineFile.pipeline_id.in_(chunk)
+            )
+            delete_stage_edges(sess, FILE_LEVEL, memberships, "pipeline_id", "file_id")
+            memberships.delete(synchronize_session=False)
+            sess.query(Pipeline).filter(Pipeline.id.in_(chunk)).delete(
+                synchronize_session=False
+            )
 
 
 def get_all_pipelines(sess: Session) -> List[Pipeline]:
     return sess.query(Pipeline).all()
 
 
+def query_pipelines(sess: Session, pipeline_ids: Optional[List[str]] = None) -> Query:
+    # Pipelines with the ids of their experiments, for iter_pages
+    query = sess.query(Pipeline).options(
+        selectinload(Pipeline.experiments).load_only(Experiment.id)
+    )
+    if pipeline_ids is not None:
+        query = query.filter(Pipeline.id.in_(pipeline_ids))
+    return query
+
+
 def get_node(
     sess: Session,
     node_id: Optional[str] = None,
@@ -192,7 +509,7 @@ def get_node(
             id=id_generator(salt="node"), file_id=node_file.id, commit_id=commit_id
         )
         sess.add(node)
-        sess.commit()
+        commit(sess)
     return node
 
 
@@ -201,21 +518,42 @@ def delete_node(
 ) -> NoReturn:
     assert (not node is None) or (not node_id is None)
     if not node:
-        node = get_node(sess, node_id)
-    experiments = get_all_experiments(sess)
-    for experiment in experiments:
-        for node_id_list in experiment.node_id_lists:
-            if node.id in node_id_list:
-                delete_experiment(sess, experiment)
-                break
-    sess.delete(node)
-    sess.commit()
+        node = get_node(sess, node_id, create=False)
+    if node:
+        delete_nodes(sess, [node.id])
+
+
+def delete_nodes(sess: Session, node_ids: List[str]) -> NoReturn:
+    with transaction(sess):
+        for chunk in chunks(node_ids):
+            experiment_ids = sess.query(ExperimentNode.experiment_id).filter(
+                ExperimentNode.node_id.in_(chunk)
+            )
+            delete_experiments(
+                sess, [row.experiment_id for row in experiment_ids.distinct()]
+            )
+            delete_incident_edges(sess, RECORD_LEVEL, chunk)
+            sess.query(Record).filter(Record.id.in_(chunk)).delete(
+                synchronize_session=False
+            )
 
 
 def get_all_nodes(sess: Session) -> List[Record]:
     return sess.query(Record).all()
 
 
+def query_nodes(sess: Session, node_ids: Optional[List[str]] = None) -> Query:
+    # Nodes with their file and edges, for iter_pages
+    query = sess.query(Record).options(
+        selectinload(Record.file),
+        selectinload(Record.predecessor_edges),
+        selectinload(Record.successor_edges),
+    )
+    if node_ids is not None:
+        query = query.filter(Record.id.in_(node_ids))
+    return query
+
+
 def get_experiment(
     sess: Session,
     repo: Optional[Repo] = None,
@@ -225,6 +563,8 @@ def get_experiment(
     config: Optional[dict] = None,
     hparams: Optional[dict] = None,
     metrics: Optional[dict] = None,
+    memo_key: Optional[str] = None,
+    resources: Optional[dict] = None,
 ) -> Experiment:
     assert (not experiment_id is None) or (not file_lists is None)
 
@@ -236,55 +576,75 @@ def get_experiment(
             raise ValueError(
                 "Description should be provided when creating a new experiment"
             )
-        pipeline = get_pipeline(sess, file_lists=file_lists)
-        config = "{}" if config is None else json.dumps(config)
-        hparams = "{}" if hparams is None else json.dumps(hparams)
-        metrics = "{}" if metrics is None else json.dumps(metrics)
-
-        node_id_lists = [[] for _ in range(len(file_lists))]
-        tracked_files = get_tracked_files(repo)
-        first_add = True
-        for i in range(len(file_lists) - 1):
-            if len(file_lists[i]) > 1 and len(file_lists[i + 1]) > 1:
-                raise ValueError("There should be no consecutive multiple files")
-            for pred_file_path in file_lists[i]:
-                pred_rel_path = get_relative_path(pred_file_path, repo.working_dir)
-                if pred_rel_path not in tracked_files:
-                    add_file(repo, pred_rel_path)
-                    if first_add:
-                        repo.git.commit("-m", description)
-                        first_add = False
-                    else:
-                        repo.git.commit("-m", description, "--amend")
-                pred_commit_id = get_last_commit(repo, pred_rel_path)
-                predecessor = get_node(sess, pred_commit_id, pred_file_path)
-                node_id_lists[i].append(predecessor.id)
-
-                for succ_file_path in file_lists[i + 1]:
-                    succ_rel_path = get_relative_path(succ_file_path, repo.working_dir)
-                    if succ_rel_path not in tracked_files:
-                        add_file(repo, succ_rel_path)
-                        if first_add:
-                            repo.git.commit("-m", description)
-                            first_add = False
-                        else:
-                            repo.git.commit("-m", description, "--amend")
-                    succ_commit_id = get_last_commit(repo, succ_rel_path)
-                    successor = get_node(sess, succ_commit_id, succ_file_path)
-                    node_id_lists[i + 1].append(successor.id)
-                    add_edge(sess, predecessor, successor)
-
-        experiment = Experiment(
-            id=id_generator(salt="experiment"),
-            description=description,
-            pipeline_id=pipeline.id,
-            node_id_lists=json.dumps(node_id_lists),
-            config=config,
-            hparams=hparams,
-            metrics=metrics,
-        )
-        sess.add(experiment)
-        sess.commit()
+        file_paths = [file_path for file_list in file_lists for file_path in file_list]
+        # The commit and the experiment are recorded under one lock, so commits
+        # follow the order of experiments
+        with file_lock(os.path.join(repo.git_dir, GIT_LOCK_FILE)):
+            staged_files = add_files(repo, file_paths)
+            if staged_files:
+                repo.git.commit("-m", description, "--", *staged_files)
+            commit_ids = get_last_commits(repo, file_paths)
+
+            with transaction(sess):
+                pipeline = get_pipeline(sess, file_lists=file_lists)
+                values = {
+                    "config": config,
+                    "hparams": hparams,
+                    "metrics": metrics,
+                    "resources": resources,
+                }
+                config = "{}" if config is None else json.dumps(config)
+                hparams = "{}" if hparams is None else json.dumps(hparams)
+                metrics = "{}" if metrics is None else json.dumps(metrics)
+                resources = "{}" if resources is None else json.dumps(resources)
+
+                node_lists = [
+                    [
+                        get_node(
+                            sess, file_path=file_path, commit_id=commit_ids[file_path]
+                        )
+                        for file_path in file_list
+                    ]
+                    for file_list in file_lists
+                ]
+                for i in range(len(node_lists) - 1):
+                    if len(node_lists[i]) > 1 and len(node_lists[i + 1]) > 1:
+                        raise ValueError(
+                            "There should be no consecutive multiple files"
+                        )
+                    for predecessor in node_lists[i]:
+                        for successor in node_lists[i + 1]:
+                            add_edge(sess, predecessor, successor)
+                node_id_lists = [
+                    [node.id for node in node_list] for node_list in node_lists
+                ]
+
+                experiment = Experiment(
+                    id=id_generator(salt="experiment"),
+                    description=description,
+                    pipeline_id=pipeline.id,
+                    node_id_lists=json.dumps(node_id_lists),
+                    config=config,
+                    hparams=hparams,
+                    metrics=metrics,
+                    resources=resources,
+                    memo_key=memo_key,
+                )
+                sess.add(experiment)
+                for stage, node_id_list in enumerate(node_id_lists):
+                    for node_id in set(node_id_list):
+                        sess.add(
+                            ExperimentNode(
+                                experiment_id=experiment.id,
+                                stage=stage,
+                                node_id=node_id,
+                            )
+                        )
+                add_experiment_values(sess, experiment.id, **values)
+                commit(sess)
+        from .lineage import trim_edge_log
+
+        trim_edge_log(sess)
     return experiment
 
 
@@ -296,17 +656,149 @@ def delete_experiment(
     assert (not experiment is None) or (not expr_id is None)
     if not experiment:
         experiment = get_experiment(sess, experiment_id=expr_id)
-    node_id_lists = json.loads(experiment.node_id_lists)
-    for i in range(len(node_id_lists) - 1):
-        for pred_node_id in node_id_lists[i]:
-            pred_node = get_node(sess, node_id=pred_node_id)
-            for succ_node_id in node_id_lists[i + 1]:
-                succ_node = get_node(sess, node_id=succ_node_id)
-                delete_edge(sess, pred_node, succ_node)
+    if experiment:
+        delete_experiments(sess, [experiment.id])
 
-    sess.delete(experiment)
-    sess.commit()
+
+def delete_experiments(sess: Session, experiment_ids: List[str]) -> NoReturn:
+    with transaction(sess):
+        for chunk in chunks(experiment_ids):
+            memberships = sess.query(ExperimentNode).filter(
+                ExperimentNode.experiment_id.in_(chunk)
+            )
+            delete_stage_edges(
+                sess, RECORD_LEVEL, memberships, "experiment_id", "node_id"
+            )
+            memberships.delete(synchronize_session=False)
+            sess.query(ExperimentValue).filter(
+                ExperimentValue.experiment_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            sess.query(Experiment).filter(Experiment.id.in_(chunk)).delete(
+                synchronize_session=False
+            )
 
 
 def get_all_experiments(sess: Session) -> List[Experiment]:
     return sess.query(Experiment).all()
+
+
+QUERY_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+def get_value_row(experiment_id: str, kind: str, key: str, value: Any) -> dict:
+    number, string = split_typed_value(value)
+    return {
+        "experiment_id": experiment_id,
+        "kind": kind,
+        "key": key,
+        "number": number,
+        "string": string,
+    }
+
+
+def add_experiment_values(
+    sess: Session, experiment_id: str, **values: Optional[dict]
+) -> NoReturn:
+    rows = []
+    for kind in VALUE_KINDS:
+        for key, value in flatten_dict(values.get(kind) or {}):
+            rows.append(get_value_row(experiment_id, kind, key, value))
+    if rows:
+        sess.execute(ExperimentValue.__table__.insert(), rows)
+    commit(sess)
+
+
+def split_value_name(name: str) -> Tuple[str, str]:
+    kind, _, key = name.partition(".")
+    if kind not in VALUE_KINDS or not key:
+        raise ValueError(
+            f"'{name}' should be one of "
+            + ", ".join(f"'{kind}.<key>'" for kind in VALUE_KINDS)
+        )
+    return kind, key
+
+
+def query_experiments(
+    sess: Session,
+    filters: Sequence[Tuple[str, str, Any]] = (),
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> List[Experiment]:
+    # filters are (name, operator, value) triples such as ("hparams.lr", "<", 1e-3)
+    query = sess.query(Experiment)
+    aliases = {}
+    for name in [name for name, _, _ in filters] + [order_by]:
+        if name is None or name in aliases:
+            continue
+        kind, key = split_value_name(name)
+        aliases[name] = aliased(ExperimentValue)
+        query = query.join(
+            aliases[name],
+            and_(
+                aliases[name].experiment_id == Experiment.id,
+                aliases[name].kind == kind,
+                aliases[name].key == key,
+            ),
+        )
+
+    # For top-k queries let the index on the sort key drive the scan: wrapping
+    # the filtered columns in a no-op expression keeps SQLite from starting at
+    # the filter index and sorting every match in a temporary B-tree.
+    top_k = bool(order_by and limit)
+    for name, op, value in filters:
+        if op not in QUERY_OPERATORS:
+            raise ValueError(f"Unsupported operator '{op}'")
+        number, string = split_typed_value(value)
+        if number is None:
+            column, value = aliases[name].string, string
+            if top_k and name != order_by:
+                column = column.concat("")
+        else:
+            column, value = aliases[name].number, number
+            if top_k and name != order_by:
+                column = column + 0
+        query = query.filter(QUERY_OPERATORS[op](column, value))
+
+    if order_by:
+        kind, key = split_value_name(order_by)
+        numeric = (
+            sess.query(ExperimentValue.number)
+            .filter_by(kind=kind, key=key)
+            .filter(ExperimentValue.number.isnot(None))
+            .first()
+        )
+        column = (
+            aliases[order_by].string if numeric is None else aliases[order_by].number
+        )
+        query = query.order_by(column.desc() if descending else column)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_experiment_values(
+    sess: Session, experiment_ids: List[str], names: Optional[List[str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    values = {experiment_id: {} for experiment_id in experiment_ids}
+    for chunk in chunks(experiment_ids):
+        query = sess.query(ExperimentValue).filter(
+            ExperimentValue.experiment_id.in_(chunk)
+        )
+        if names:
+            query = query.filter(
+                tuple_(ExperimentValue.kind, ExperimentValue.key).in_(
+                    [split_value_name(name) for name in names]
+                )
+            )
+        for row in query:
+            values[row.experiment_id][f"{row.kind}.{row.key}"] = row.value
+    return values
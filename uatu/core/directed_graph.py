@@ -1,12 +1,14 @@
-from typing import Optional, Iterable, Dict, Set, DefaultDict, List
-from collections import defaultdict
-from copy import copy
+import copy
+from typing import Optional, Iterable, Dict, Set, List, Tuple
+from array import array
+from collections import deque
 
 
 class DirectedGraph(object):
     def __init__(self, graph_dict: Optional[Dict[str, Set[str]]] = None):
         self._graph = dict()
-        for node, successors in graph_dict.items():
+        self._predecessors = dict()
+        for node, successors in (graph_dict or {}).items():
             if node not in self:
                 self.add_node(node)
             for successor in successors:
@@ -17,19 +19,21 @@ class DirectedGraph(object):
             raise KeyError(f"Record {node} already exists in graph")
         else:
             self._graph[node] = set()
+            self._predecessors[node] = set()
 
     def add_nodes(self, nodes: Iterable[str]):
         for node in nodes:
             self.add_node(node)
 
     def delete_node(self, node: str):
-        self._graph.pop(node)
-        for values in self._graph.values():
-            values.discard(node)
+        for successor in self._graph.pop(node):
+            self._predecessors[successor].discard(node)
+        for predecessor in self._predecessors.pop(node):
+            self._graph[predecessor].discard(node)
 
     def delete_nodes(self, nodes: Iterable[str]):
-        for node in nodes:
-            self.delete_nodes(node)
+        for node in set(nodes):
+            self.delete_node(node)
 
     def add_arc(self, start: str, end: str, create_nodes=False):
         if create_nodes:
@@ -41,6 +45,7 @@ class DirectedGraph(object):
             if start not in self or end not in self:
                 raise KeyError("Specified nodes don't exists in graph")
         self._graph[start].add(end)
+        self._predecessors[end].add(start)
 
     def delete_arc(self, start: str, end: str):
         if start not in self or end not in self:
@@ -48,50 +53,394 @@ class DirectedGraph(object):
         if end not in self._graph[start]:
             raise KeyError(f"There is no arc between {start} and {end}")
         self._graph[start].remove(end)
+        self._predecessors[end].remove(start)
+
+    def delete_arcs(self, start: str, end: str, max_paths: Optional[int] = 1000):
+        # Deletes every arc lying on a simple start -> end path. An arc u -> v
+        # between two strongly connected components lies on one iff u is
+        # reachable from start and end is reachable from v, the two paths can
+        # not meet without u and v sharing a component. An arc inside a
+        # component may only lie on walks, e.g. v -> u in start -> v -> u -> v
+        # -> end, and lies on a simple path iff some simple v -> end path
+        # leaves start a way to u. Deciding that is NP-hard: the shortest paths
+        # are tried, then at most `max_paths` others per arc, and the arc is
+        # kept when none of them does.
+        if start not in self or end not in self:
+            raise KeyError("Specified nodes don't exists in graph")
+        if start == end:
+            return
+        forward = self.descendants(start)
+        between = forward & self.ancestors(end, within=forward)
+        component = dict()
+        for i, nodes in enumerate(self.strongly_connected_components(between)):
+            for node in nodes:
+                component[node] = i
+        arcs = []
+        for node in between:
+            if node == end:
+                continue
+            for successor in self._graph[node]:
+                if successor not in between:
+                    continue
+                if component[node] != component[successor] or self._on_simple_path(
+                    start, end, node, successor, between, max_paths
+                ):
+                    arcs.append((node, successor))
+        for node, successor in arcs:
+            self.delete_arc(node, successor)
+
+    def _on_simple_path(self, start, end, node, successor, within, max_paths):
+        # Whether a successor -> end path and a start -> node path through
+        # `within` do not meet. The shortest path of either side is tried
+        # first, then at most `max_paths` successor -> end paths.
+        if successor == start:
+            return False
+        exit_path = self.shortest_path(successor, end, within - {start, node})
+        if exit_path and node in self._traverse(
+            start, self.successors, within=within.difference(exit_path)
+        ):
+            return True
+        entry_path = self.shortest_path(start, node, within - {successor, end})
+        if entry_path and end in self._traverse(
+            successor, self.successors, within=within.difference(entry_path)
+        ):
+            return True
+        for path in self.find_path(successor, end, max_paths=max_paths):
+            if start in path:
+                continue
+            rest = within.difference(path)
+            if node in self._traverse(start, self.successors, within=rest):
+                return True
+        return False
 
-    def delete_arcs(self, start: str, end: str):
-        possible_paths = self.find_path(start, end)
-        for path in possible_paths:
-            for i in range(len(path) - 1):
-                self.delete_arc(path[i], path[i + 1])
+    def nodes(self) -> Iterable[str]:
+        return self._graph.keys()
 
-    def find_path_util(
+    def successors(self, node: str) -> Iterable[str]:
+        return self._graph[node]
+
+    def predecessors(self, node: str) -> Iterable[str]:
+        return self._predecessors[node]
+
+    def descendants(self, node: str, max_depth: Optional[int] = None) -> Set[str]:
+        # Every node reachable from `node` (itself included) within `max_depth` arcs
+        return self._traverse(node, self.successors, max_depth)
+
+    def ancestors(
         self,
         node: str,
+        max_depth: Optional[int] = None,
+        within: Optional[Set[str]] = None,
+    ) -> Set[str]:
+        # Every node that reaches `node` (itself included), optionally only
+        # walking through the nodes in `within`
+        return self._traverse(node, self.predecessors, max_depth, within)
+
+    def _traverse(self, node, neighbours, max_depth=None, within=None) -> Set[str]:
+        if node not in self:
+            raise KeyError(f"Record {node} does not exists in graph")
+        visited = {node}
+        frontier = [node]
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            next_frontier = []
+            for current in frontier:
+                for neighbour in neighbours(current):
+                    if neighbour not in visited and (
+                        within is None or neighbour in within
+                    ):
+                        visited.add(neighbour)
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+            depth += 1
+        return visited
+
+    def is_reachable(self, start: str, end: str) -> bool:
+        return end in self.descendants(start)
+
+    def shortest_path(
+        self, start: str, end: str, within: Optional[Set[str]] = None
+    ) -> Optional[List[str]]:
+        # Breadth first search, optionally only walking through the nodes in
+        # `within`, returns None when end is unreachable
+        if start not in self or end not in self:
+            raise KeyError("Specified nodes don't exists in graph")
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if node == end:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+            for successor in self.successors(node):
+                if successor not in parents and (within is None or successor in within):
+                    parents[successor] = node
+                    queue.append(successor)
+        return None
+
+    def topological_order(self) -> List[str]:
+        # Kahn's algorithm, raises ValueError when the graph has a cycle
+        in_degrees = {node: len(self.predecessors(node)) for node in self.nodes()}
+        queue = deque(node for node, degree in in_degrees.items() if degree == 0)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for successor in self.successors(node):
+                in_degrees[successor] -= 1
+                if in_degrees[successor] == 0:
+                    queue.append(successor)
+        if len(order) < len(self):
+            raise ValueError("Graph contains a cycle")
+        return order
+
+    def find_cycle(self, within: Optional[Set[str]] = None) -> Optional[List[str]]:
+        # Iterative depth first search, returns the nodes of one cycle if any,
+        # optionally only among the nodes in `within`
+        state = dict()
+        for root in self.nodes() if within is None else within:
+            if root in state:
+                continue
+            state[root] = True
+            path = [root]
+            stack = [iter(self.successors(root))]
+            while stack:
+                for successor in stack[-1]:
+                    if within is not None and successor not in within:
+                        continue
+                    if successor not in state:
+                        state[successor] = True
+                        path.append(successor)
+                        stack.append(iter(self.successors(successor)))
+                        break
+                    if state[successor]:
+                        return path[path.index(successor) :]
+                else:
+                    state[path.pop()] = False
+                    stack.pop()
+        return None
+
+    def strongly_connected_components(
+        self, within: Optional[Set[str]] = None
+    ) -> List[Set[str]]:
+        # Iterative Tarjan, optionally only among the nodes in `within`, each
+        # component listed after the components it reaches
+        index = dict()
+        low = dict()
+        stack = []
+        on_stack = set()
+        components = []
+        for root in self.nodes() if within is None else within:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            path = [root]
+            iterators = [iter(self.successors(root))]
+            while iterators:
+                node = path[-1]
+                for successor in iterators[-1]:
+                    if within is not None and successor not in within:
+                        continue
+                    if successor not in index:
+                        index[successor] = low[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        path.append(successor)
+                        iterators.append(iter(self.successors(successor)))
+                        break
+                    if successor in on_stack:
+                        low[node] = min(low[node], index[successor])
+                else:
+                    path.pop()
+                    iterators.pop()
+                    if path:
+                        low[path[-1]] = min(low[path[-1]], low[node])
+                    if low[node] == index[node]:
+                        nodes = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            nodes.add(member)
+                            if member == node:
+                                break
+                        components.append(nodes)
+        return components
+
+    def has_cycle(self) -> bool:
+        return self.find_cycle() is not None
+
+    def find_path(
+        self,
+        start: str,
         end: str,
-        visited: DefaultDict,
-        path: List[str],
-        paths: List[List[str]],
-    ):
-        visited[node] = True
-        path.append(node)
-        if node == end:
-            paths.append(copy(path))
-        else:
-            for successor in self._graph[node]:
-                if visited[successor] == False:
-                    self.find_path_util(successor, end, visited, path, paths)
-        path.pop()
-        visited[node] = False
-
-    def find_path(self, start: str, end: str):
-        visited = defaultdict(lambda: False)
-        path, paths = [], []
-        self.find_path_util(start, end, visited, path, paths)
+        max_paths: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> List[List[str]]:
+        # Enumerates simple paths iteratively, only walking nodes that can still
+        # reach end. The number of paths may be exponential, so callers should
+        # bound it with `max_paths` and/or `max_depth` (in arcs).
+        if start not in self or end not in self:
+            raise KeyError("Specified nodes don't exists in graph")
+        reaching = self.ancestors(end, within=self.descendants(start))
+        paths = []
+        if start not in reaching:
+            return paths
+        path = [start]
+        on_path = {start}
+        stack = [iter(self.successors(start))]
+        while stack:
+            if max_paths is not None and len(paths) >= max_paths:
+                break
+            if path[-1] == end or (max_depth is not None and len(path) > max_depth):
+                if path[-1] == end:
+                    paths.append(list(path))
+                on_path.discard(path.pop())
+                stack.pop()
+                continue
+            for successor in stack[-1]:
+                if successor in reaching and successor not in on_path:
+                    path.append(successor)
+                    on_path.add(successor)
+                    stack.append(iter(self.successors(successor)))
+                    break
+            else:
+                on_path.discard(path.pop())
+                stack.pop()
         return paths
 
+    def freeze(self) -> "FrozenDirectedGraph":
+        return FrozenDirectedGraph(self)
+
     def __contains__(self, node: str):
         return node in self._graph
 
     def __getitem__(self, node):
         if not node in self:
             raise KeyError(f"Record {node} does not exists in graph")
-        successors = self._graph[node]
-        predecessors = set()
-        for key, values in self._graph.items():
-            if node in values:
-                predecessors.add(key)
-        return {"predecessors": predecessors, "successors": successors}
+        return {
+            "predecessors": set(self.predecessors(node)),
+            "successors": set(self.successors(node)),
+        }
 
     def __len__(self):
         return len(self._graph)
+
+
+class FrozenDirectedGraph(DirectedGraph):
+    # Read-only, compact snapshot of a DirectedGraph. Nodes are interned to
+    # integers and both adjacencies are stored in CSR form: the neighbours of
+    # node i are targets[offsets[i]:offsets[i + 1]], 4 bytes per arc and direction.
+    # patch() overlays changes on top, only for the nodes they touch.
+    def __init__(self, graph: DirectedGraph):
+        self._nodes = list(graph.nodes())
+        self._index = {node: i for i, node in enumerate(self._nodes)}
+        self._offsets, self._targets = self._compress(graph.successors)
+        self._reverse_offsets, self._sources = self._compress(graph.predecessors)
+        self._added_nodes: Dict[str, None] = {}
+        self._patched: Dict[str, Dict[str, Set[str]]] = {
+            "successors": {},
+            "predecessors": {},
+        }
+
+    @classmethod
+    def from_csr(
+        cls, nodes: List[str], offsets, targets, reverse_offsets, sources
+    ) -> "FrozenDirectedGraph":
+        # Accepts any integer sequences, e.g. memoryviews over a mapped file
+        graph = cls.__new__(cls)
+        graph._nodes = nodes
+        graph._index = {node: i for i, node in enumerate(nodes)}
+        graph._offsets, graph._targets = offsets, targets
+        graph._reverse_offsets, graph._sources = reverse_offsets, sources
+        graph._added_nodes = {}
+        graph._patched = {"successors": {}, "predecessors": {}}
+        return graph
+
+    def _compress(self, neighbours):
+        offsets, targets = array("Q", [0]), array("I")
+        for node in self._nodes:
+            targets.extend(sorted(self._index[other] for other in neighbours(node)))
+            offsets.append(len(targets))
+        return offsets, targets
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("FrozenDirectedGraph is read-only, thaw() it first")
+
+    add_node = add_nodes = delete_node = delete_nodes = _read_only
+    add_arc = delete_arc = delete_arcs = _read_only
+
+    def patch(self, changes: Iterable[Tuple[str, str, bool]]) -> "FrozenDirectedGraph":
+        # A copy sharing the CSR arrays, with the arc changes (start, end,
+        # deleted) applied in order like add_arc(..., True) and delete_arc would.
+        # Costs the degree of the touched nodes, not the size of the graph.
+        changes = list(changes)
+        if not changes:
+            return self
+        graph = copy.copy(self)
+        graph._added_nodes = dict(self._added_nodes)
+        graph._patched = {kind: dict(nodes) for kind, nodes in self._patched.items()}
+        owned = set()
+
+        def neighbours(kind: str, node: str) -> Set[str]:
+            # Copied from `self` the first time `graph` changes them
+            if (kind, node) not in owned:
+                owned.add((kind, node))
+                current = getattr(self, kind)(node) if node in self else ()
+                graph._patched[kind][node] = set(current)
+            return graph._patched[kind][node]
+
+        for start, end, deleted in changes:
+            if not deleted:
+                for node in (start, end):
+                    if node not in graph:
+                        graph._added_nodes[node] = None
+                neighbours("successors", start).add(end)
+                neighbours("predecessors", end).add(start)
+            elif start in graph and end in graph:
+                neighbours("successors", start).discard(end)
+                neighbours("predecessors", end).discard(start)
+        return graph
+
+    def is_patched(self) -> bool:
+        return bool(self._added_nodes or any(self._patched.values()))
+
+    def nodes(self) -> Iterable[str]:
+        if self._added_nodes:
+            return self._nodes + list(self._added_nodes)
+        return self._nodes
+
+    def successors(self, node: str) -> List[str]:
+        if node in self._patched["successors"]:
+            return list(self._patched["successors"][node])
+        if node in self._added_nodes:
+            return []
+        i = self._index[node]
+        targets = self._targets[self._offsets[i] : self._offsets[i + 1]]
+        return [self._nodes[target] for target in targets]
+
+    def predecessors(self, node: str) -> List[str]:
+        if node in self._patched["predecessors"]:
+            return list(self._patched["predecessors"][node])
+        if node in self._added_nodes:
+            return []
+        i = self._index[node]
+        sources = self._sources[self._reverse_offsets[i] : self._reverse_offsets[i + 1]]
+        return [self._nodes[source] for source in sources]
+
+    def freeze(self) -> "FrozenDirectedGraph":
+        # Folds the patches into new arrays
+        return FrozenDirectedGraph(self) if self.is_patched() else self
+
+    def thaw(self) -> DirectedGraph:
+        return DirectedGraph({node: self.successors(node) for node in self.nodes()})
+
+    def __contains__(self, node: str):
+        return node in self._index or node in self._added_nodes
+
+    def __len__(self):
+        return len(self._nodes) + len(self._added_nodes)
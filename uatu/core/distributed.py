@@ -0,0 +1,363 @@
+import os
+import sys
+import stat
+import socket
+import time
+import tempfile
+import threading
+from collections import Counter
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from os.path import exists, join
+from typing import Dict, List, Optional, Set, Tuple
+from .metrics import BUFFER_SIZE, FLUSH_INTERVAL, TIME_SERIES, MetricWriter
+from .utils import get_fingerprint
+
+# (rank, world size) variables of torchrun/torch.distributed, Open MPI, MPICH
+# and Slurm, the first pair found wins
+RANK_ENVS = (
+    ("RANK", "WORLD_SIZE"),
+    ("OMPI_COMM_WORLD_RANK", "OMPI_COMM_WORLD_SIZE"),
+    ("PMI_RANK", "PMI_SIZE"),
+    ("SLURM_PROCID", "SLURM_NTASKS"),
+)
+# (local rank, local size, node) variables of the same launchers. The socket
+# of rank 0 is only reachable on its node, told by the node variable, else by
+# the coordinator address, else guessed from ranks numbered from 0 as in the
+# world.
+LOCAL_RANK_ENVS = (
+    ("LOCAL_RANK", "LOCAL_WORLD_SIZE", "GROUP_RANK"),
+    ("OMPI_COMM_WORLD_LOCAL_RANK", "OMPI_COMM_WORLD_LOCAL_SIZE", None),
+    ("MPI_LOCALRANKID", "MPI_LOCALNRANKS", None),
+    ("SLURM_LOCALID", "SLURM_NTASKS_PER_NODE", "SLURM_NODEID"),
+)
+# Host of rank 0 set by torchrun and most other launchers
+COORDINATOR_ENV = "MASTER_ADDR"
+# Overrides the address derived from the launcher variables
+RANK_ADDRESS_ENV = "UATU_RANK_ADDRESS"
+# Variables identifying one launch, shared by all its ranks
+LAUNCH_ENVS = ("MASTER_ADDR", "MASTER_PORT", "TORCHELASTIC_RUN_ID", "SLURM_JOB_ID")
+# Seconds a worker keeps retrying to reach the coordinator
+CONNECT_TIMEOUT = 60.0
+# Seconds the coordinator waits for the other ranks once its own run is over,
+# for ranks that never connected only until CONNECT_TIMEOUT after its start
+RANK_TIMEOUT = 300.0
+
+# What a worker rank reports when its run is over: metrics, resources and
+# profile samples
+RankResult = Tuple[Optional[dict], Optional[dict], Optional[Counter]]
+
+
+def get_rank() -> Tuple[int, int]:
+    for rank_env, size_env in RANK_ENVS:
+        if rank_env in os.environ and size_env in os.environ:
+            return int(os.environ[rank_env]), int(os.environ[size_env])
+    return 0, 1
+
+
+def get_local_rank(rank: int, world_size: int) -> Optional[Tuple[int, int]]:
+    # (rank, size) among the ranks on the node of rank 0, which report to it,
+    # or None on the other nodes. Without local variables every rank is taken
+    # for one on the same node.
+    for rank_env, size_env, node_env in LOCAL_RANK_ENVS:
+        if rank_env in os.environ and size_env in os.environ:
+            local_rank, local_size = int(os.environ[rank_env]), int(
+                os.environ[size_env]
+            )
+            if rank == 0:
+                first_node = True
+            elif node_env and node_env in os.environ:
+                first_node = int(os.environ[node_env]) == 0
+            elif os.environ.get(COORDINATOR_ENV):
+                first_node = is_local_host(os.environ[COORDINATOR_ENV])
+            else:  # Right for block mappings, RankCoordinator copes otherwise
+                first_node = rank == local_rank
+            return (local_rank, local_size) if first_node else None
+    return rank, world_size
+
+
+def is_local_host(host: str) -> bool:
+    # Whether `host` names this machine, by name or by address
+    names = {"localhost", socket.gethostname(), socket.getfqdn()}
+    if host in names or host.startswith("127.") or host == "::1":
+        return True
+    try:
+        addresses = set(socket.gethostbyname_ex(host)[2])
+        local_addresses = set(socket.gethostbyname_ex(socket.gethostname())[2])
+    except OSError:
+        return False
+    return bool(addresses & local_addresses)
+
+
+def get_user_dir() -> str:
+    # Directory of the user's sockets and secret. Connections exchange pickles,
+    # so an existing one must be a real directory of the user nobody else can
+    # enter, not one planted in the shared temp dir.
+    if sys.platform == "win32":
+        user_dir = join(tempfile.gettempdir(), "uatu")  # The temp dir is per user
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+    user_dir = join(tempfile.gettempdir(), f"uatu-{os.getuid()}")
+    try:
+        os.mkdir(user_dir, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(user_dir)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(f"{user_dir} is not a private directory of this user")
+    return user_dir
+
+
+def get_user_secret() -> bytes:
+    # Random bytes only the user's processes can read, created by the first
+    # rank ever started and kept for the next launches
+    secret_file = join(get_user_dir(), "secret")
+    if not exists(secret_file):
+        fd, temp_file = tempfile.mkstemp(dir=get_user_dir())
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32))
+        try:
+            os.link(temp_file, secret_file)  # Ranks starting together keep one
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_file)
+    with open(secret_file, "rb") as f:
+        return f.read()
+
+
+def get_rank_address(*keys: str) -> str:
+    # Every rank of a launch derives the same address from `keys` and the
+    # launcher variables
+    address = os.environ.get(RANK_ADDRESS_ENV)
+    if address:
+        return address
+    key = get_fingerprint(
+        list(keys) + [os.environ.get(name, "") for name in LAUNCH_ENVS]
+    )[:16]
+    if sys.platform == "win32":
+        return rf"\\.\pipe\uatu-{key}"
+    return join(get_user_dir(), f"{key}.sock")
+
+
+def get_rank_authkey() -> bytes:
+    # Shared by the ranks of one launch of the user: processes of other users
+    # or launches are refused before any pickle is read
+    launch = [os.environ.get(name, "") for name in LAUNCH_ENVS]
+    return get_fingerprint([get_user_secret().hex()] + launch).encode()
+
+
+def get_rank_prefix(rank: int) -> str:
+    return f"rank{rank}/"
+
+
+class RankCoordinator(object):
+    # Rank 0 side: accepts one connection per other rank, writes the points
+    # they stream into `writer` under "rank<i>/<name>" and collects their
+    # results. Ranks may connect in any order and finish at any time, clients
+    # without `authkey` are turned away. Ranks that did not connect within
+    # `connect_timeout` are taken for ranks of other nodes and not waited for.
+    def __init__(
+        self,
+        address: str,
+        world_size: int,
+        writer: MetricWriter,
+        authkey: Optional[bytes] = None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+    ):
+        self.address = address
+        self.world_size = world_size
+        self.writer = writer
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self.results: Dict[int, RankResult] = {}
+        self.connected: Set[int] = set()
+        self.lost: Set[int] = set()
+        self._started = time.monotonic()
+        self._condition = threading.Condition()
+        self._listener: Optional[Listener] = None
+
+    def start(self):
+        if not self.address.startswith("\\\\") and os.path.exists(self.address):
+            os.remove(self.address)  # Left behind by a crashed launch
+        self._listener = Listener(self.address, authkey=self.authkey)
+        self._started = time.monotonic()
+        threading.Thread(
+            target=self._accept, name="uatu-coordinator", daemon=True
+        ).start()
+
+    def _accept(self):
+        connected = 0
+        while connected < self.world_size - 1:
+            try:
+                conn = self._listener.accept()
+            except (AuthenticationError, EOFError):  # Not a rank of this launch
+                continue
+            except OSError:  # Closed before every rank connected
+                return
+            connected += 1
+            threading.Thread(
+                target=self._receive, args=(conn,), name="uatu-rank", daemon=True
+            ).start()
+
+    def _receive(self, conn: Connection):
+        rank = None
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "hello":
+                    rank = message[1]
+                    with self._condition:
+                        self.connected.add(rank)
+                elif message[0] == "log":
+                    prefix = get_rank_prefix(rank)
+                    for step, metrics in message[1]:
+                        self.writer.add(
+                            step,
+                            {prefix + name: value for name, value in metrics.items()},
+                        )
+                elif message[0] == "done":
+                    with self._condition:
+                        self.results[rank] = message[1]
+                        self._condition.notify_all()
+                    return
+        except (EOFError, OSError):
+            with self._condition:
+                self.lost.add(rank)
+                self._condition.notify_all()
+        finally:
+            conn.close()
+
+    def gather(self, timeout: Optional[float] = RANK_TIMEOUT) -> List[int]:
+        # Waits for every other rank to finish or fail, returns the ranks
+        # without a result
+        ranks = set(range(1, self.world_size))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        connect_deadline = self._started + self.connect_timeout
+        with self._condition:
+            while True:
+                done = set(self.results) | self.lost
+                now = time.monotonic()
+                if ranks <= done or (
+                    now >= connect_deadline and self.connected <= done
+                ):
+                    break
+                if deadline is not None and now >= deadline:
+                    break
+                waits = [
+                    end - now
+                    for end in (deadline, connect_deadline)
+                    if end is not None and end > now
+                ]
+                self._condition.wait(min(waits) if waits else None)
+            return sorted(ranks - set(self.results))
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+
+def merge_rank_results(
+    result: RankResult, results: Dict[int, RankResult]
+) -> RankResult:
+    # Rank 0's result with the metrics and resources of every rank under
+    # "ranks.<i>" and the stacks of every rank under a "rank<i>" root frame
+    metrics, resources, samples = result
+    results = dict(sorted({0: result, **results}.items()))
+    metrics = dict(
+        metrics or {},
+        ranks={str(rank): other[0] or {} for rank, other in results.items()},
+    )
+    if resources is not None:
+        resources = dict(
+            resources,
+            ranks={
+                str(rank): other[1]
+                for rank, other in results.items()
+                if other[1] is not None
+            },
+        )
+    if samples is not None:
+        samples = Counter()
+        for rank, other in results.items():
+            for stack, count in (other[2] or {}).items():
+                samples[f"rank{rank};{stack}"] += count
+    return metrics, resources, samples
+
+
+class RankWorker(object):
+    # Rank i > 0 side: streams the points of run.log to the coordinator in
+    # batches, like MetricWriter buffers them, and sends its result at the
+    # end. Once the coordinator is unreachable everything is dropped.
+    def __init__(
+        self,
+        address: str,
+        rank: int,
+        buffer_size: int = BUFFER_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        authkey: Optional[bytes] = None,
+    ):
+        self.address = address
+        self.rank = rank
+        self.authkey = authkey
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.conn: Optional[Connection] = None
+        self._buffer: List[Tuple[int, dict]] = []
+        self._last_flush = time.monotonic()
+
+    def connect(self, timeout: float = CONNECT_TIMEOUT) -> bool:
+        # Rank 0 may not be listening yet, retries until `timeout`
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.conn = Client(self.address, authkey=self.authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+            except (AuthenticationError, EOFError):  # Another launch's socket
+                return False
+        return self._send(("hello", self.rank))
+
+    def log(self, step: int, **metrics):
+        metrics[TIME_SERIES] = time.time()
+        self._buffer.append((step, metrics))
+        if (
+            len(self._buffer) >= self.buffer_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if self._buffer:
+            self._send(("log", self._buffer))
+            self._buffer = []
+
+    def finish(self, result: RankResult) -> bool:
+        self.flush()
+        sent = self._send(("done", result))
+        self.close()
+        return sent
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _send(self, message: tuple) -> bool:
+        if self.conn is None:
+            return False
+        try:
+            self.conn.send(message)
+            return True
+        except OSError:
+            self.close()
+            return False
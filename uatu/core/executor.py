@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from collections import defaultdict, deque
+from os.path import abspath, exists, join
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from git import Repo
+from sqlalchemy.orm import Session
+from .orm import Experiment, ExperimentNode, File, Pipeline, PipelineFile, Record
+from .database import get_experiment
+from .directed_graph import DirectedGraph
+from .git import get_blob_hashes
+from .utils import get_fingerprint, get_relative_path
+
+CACHED = "cached"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+# Description of the experiments of steps, formatted like Run descriptions
+STEP_DESCRIPTION = "uatu pipeline run: {script}"
+
+
+class Step(NamedTuple):
+    inputs: List[str]
+    script: str
+    outputs: List[str]
+
+
+class StepResult(NamedTuple):
+    step: Step
+    status: str
+    experiment: Optional[Experiment] = None
+    returncode: Optional[int] = None
+    log_file: Optional[str] = None
+
+
+def is_script(file_path: str) -> bool:
+    return file_path.endswith(".py")
+
+
+def get_pipeline_steps(sess: Session, pipeline: Pipeline) -> List[Step]:
+    # Every script of a script-only stage is a step, fed by the data stage
+    # before it and writing the data stage after it. Several scripts in one
+    # stage (fan-out/fan-in) are independent steps.
+    rows = (
+        sess.query(PipelineFile.stage, File.path)
+        .join(File, PipelineFile.file_id == File.id)
+        .filter(PipelineFile.pipeline_id == pipeline.id)
+        .order_by(PipelineFile.stage, File.path)
+    )
+    stages = defaultdict(list)
+    for stage, path in rows:
+        stages[stage].append(path)
+    stages = [stages[stage] for stage in sorted(stages)]
+    script_stages = [all(is_script(path) for path in paths) for paths in stages]
+    script_stages.append(True)
+
+    steps = []
+    for i, paths in enumerate(stages):
+        if script_stages[i]:
+            inputs = stages[i - 1] if i > 0 and not script_stages[i - 1] else []
+            outputs = stages[i + 1] if not script_stages[i + 1] else []
+            steps.extend(Step(inputs, path, outputs) for path in paths)
+    return steps
+
+
+def get_memo_key(
+    repo: Repo,
+    script: str,
+    inputs: List[str],
+    outputs: List[str],
+    config: Optional[dict] = None,
+    hparams: Optional[dict] = None,
+) -> Optional[str]:
+    # Same script and input contents, outputs, config and hparams give the same
+    # key. Contents are hashed like git blobs so uncommitted edits count too.
+    blob_hashes = get_blob_hashes(repo, [script] + inputs)
+    if any(blob_hash is None for blob_hash in blob_hashes.values()):
+        return None
+    return get_fingerprint(
+        {
+            "script": blob_hashes[script],
+            "inputs": {
+                get_relative_path(path, repo.working_dir): blob_hashes[path]
+                for path in inputs
+            },
+            "outputs": sorted(
+                get_relative_path(path, repo.working_dir) for path in outputs
+            ),
+            "config": config or {},
+            "hparams": hparams or {},
+        }
+    )
+
+
+def find_memoized_experiment(sess: Session, memo_key: str) -> Optional[Experiment]:
+    return sess.query(Experiment).filter_by(memo_key=memo_key).first()
+
+
+def get_experiment_outputs(
+    sess: Session, experiment: Experiment, output_paths: List[str]
+) -> Dict[str, str]:
+    # Path -> commit id of the given files as recorded by the experiment
+    rows = (
+        sess.query(File.path, Record.commit_id)
+        .join(Record, Record.file_id == File.id)
+        .join(ExperimentNode, ExperimentNode.node_id == Record.id)
+        .filter(
+            ExperimentNode.experiment_id == experiment.id,
+            File.path.in_(output_paths),
+        )
+    )
+    return {path: commit_id for path, commit_id in rows}
+
+
+def restore_outputs(repo: Repo, outputs: Dict[str, str]) -> List[str]:
+    # Checks out recorded outputs whose working copy differs, one call per commit
+    if not outputs:
+        return []
+    current = get_blob_hashes(repo, outputs)
+    recorded = repo.git.rev_parse(
+        *[f"{commit_id}:{path}" for path, commit_id in outputs.items()]
+    ).split()
+    restored = defaultdict(list)
+    for (path, commit_id), blob_hash in zip(outputs.items(), recorded):
+        if current[path] != blob_hash:
+            restored[commit_id].append(path)
+    for commit_id, paths in restored.items():
+        repo.git.checkout(commit_id, "--", *paths)
+    return [path for paths in restored.values() for path in paths]
+
+
+def get_cached_experiment(
+    sess: Session, repo: Repo, step: Step, memo_key: Optional[str]
+) -> Optional[Experiment]:
+    # A memoized experiment of the step, with its outputs restored. Steps
+    # without outputs only cost the indexed memo key lookup.
+    if not memo_key:
+        return None
+    experiment = find_memoized_experiment(sess, memo_key)
+    if experiment and not step.outputs:
+        return experiment
+    if experiment:
+        outputs = get_experiment_outputs(sess, experiment, step.outputs)
+        if len(outputs) == len(step.outputs):
+            restore_outputs(repo, outputs)
+            return experiment
+    return None
+
+
+def read_result(result_file: str) -> Optional[dict]:
+    # What the Run of a script handed over, see run.RESULT_ENV
+    if not exists(result_file):
+        return None
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def record_step(
+    sess: Session,
+    repo: Repo,
+    step: Step,
+    memo_key: Optional[str],
+    config: Optional[dict] = None,
+    hparams: Optional[dict] = None,
+    result: Optional[dict] = None,
+) -> Experiment:
+    # Records what the step's Run handed over, under the files of the step and
+    # the memo key of the Run, or the bare step when it does not use Run
+    if result:
+        from .run import Run  # run.py imports this module
+
+        run = Run(step.inputs, step.outputs, result["config"], result["hparams"])
+        return run.save(
+            step.script,
+            result["metrics"],
+            result["description"],
+            result["series_dir"],
+            resources=result["resources"],
+            profile_file=result["profile_file"],
+            memo_key=result.get("memo_key") or memo_key,
+            sess=sess,
+            repo=repo,
+        )
+    return get_experiment(
+        sess,
+        repo,
+        description=STEP_DESCRIPTION.format(script=step.script),
+        file_lists=[
+            file_list
+            for file_list in (step.inputs, [step.script], step.outputs)
+            if file_list
+        ],
+        config=config,
+        hparams=hparams,
+        memo_key=memo_key,
+    )
+
+
+def get_step_graph(steps: List[Step]) -> DirectedGraph:
+    # Step i -> step j when j reads a file i writes
+    graph = DirectedGraph()
+    graph.add_nodes(range(len(steps)))
+    producers = defaultdict(list)
+    for i, step in enumerate(steps):
+        for output in step.outputs:
+            producers[output].append(i)
+    for j, step in enumerate(steps):
+        for input_ in step.inputs:
+            for i in producers[input_]:
+                if i != j:
+                    graph.add_arc(i, j)
+    cycle = graph.find_cycle()
+    if cycle:
+        scripts = " -> ".join(steps[i].script for i in cycle)
+        raise ValueError(f"Pipeline steps depend on each other: {scripts}")
+    return graph
+
+
+def get_log_file(log_dir: str, index: int, step: Step) -> str:
+    return join(log_dir, f"{index:02d}_{step.script.replace(os.sep, '_')}.log")
+
+
+def schedule_steps(
+    sess: Session,
+    repo: Repo,
+    steps: List[Step],
+    max_workers: int = 1,
+    log_dir: Optional[str] = None,
+    force: bool = False,
+    poll_interval: float = 0.05,
+) -> Iterator[StepResult]:
+    # Runs steps like make: a step starts once every step producing its inputs
+    # is done, at most `max_workers` scripts at a time, each writing to its own
+    # log file in `log_dir` (or the console). A step is reused instead when an
+    # experiment with the same memo key exists. A failed step only skips the
+    # steps downstream of it. Experiments are recorded in this process.
+    from .run import CACHE_ENV, DESCRIPTION_ENV, HPARAMS_ENV, RESULT_ENV
+
+    # Steps are keyed on the hparams given to every script, a Run keys its
+    # step on its own config and hparams too
+    hparams = json.loads(os.environ.get(HPARAMS_ENV) or "null")
+    graph = get_step_graph(steps)
+    waiting = {i: len(graph.predecessors(i)) for i in graph.nodes()}
+    ready = deque(i for i in graph.topological_order() if waiting[i] == 0)
+    running = dict()
+    skipped = set()
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    def finish(i):
+        for j in graph.successors(i):
+            if j in skipped:  # Downstream of another step that failed
+                continue
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                ready.append(j)
+
+    # Scripts using Run hand their result to this directory instead of
+    # recording a second experiment, and never wait on a prompt
+    result_dir = tempfile.mkdtemp(prefix="uatu-pipeline-")
+    try:
+        while ready or running:
+            while ready and len(running) < max_workers:
+                i = ready.popleft()
+                step = steps[i]
+                memo_key = get_memo_key(
+                    repo, step.script, step.inputs, step.outputs, hparams=hparams
+                )
+                experiment = (
+                    None if force else get_cached_experiment(sess, repo, step, memo_key)
+                )
+                if experiment:
+                    yield StepResult(step, CACHED, experiment)
+                    finish(i)
+                    continue
+                result_file = join(result_dir, f"{i}.json")
+                log_file = get_log_file(log_dir, i, step) if log_dir else None
+                output = open(log_file, "w") if log_file else None
+                env = dict(os.environ)
+                env.setdefault(DESCRIPTION_ENV, STEP_DESCRIPTION)
+                env[RESULT_ENV] = result_file
+                env.pop(CACHE_ENV, None)
+                if not force:
+                    env[CACHE_ENV] = abspath(sess.bind.url.database)
+                process = subprocess.Popen(
+                    [sys.executable, step.script],
+                    cwd=repo.working_dir,
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    stdout=output,
+                    stderr=subprocess.STDOUT if output else None,
+                )
+                running[i] = (process, memo_key, output, log_file, result_file)
+
+            finished = [
+                i for i, (process, *_) in running.items() if process.poll() is not None
+            ]
+            if not finished:
+                time.sleep(poll_interval)
+            for i in finished:
+                process, memo_key, output, log_file, result_file = running.pop(i)
+                if output:
+                    output.close()
+                result = read_result(result_file)
+                if process.returncode == 0 and result and "cached" in result:
+                    experiment = sess.query(Experiment).get(result["cached"])
+                    yield StepResult(steps[i], CACHED, experiment, 0, log_file)
+                    finish(i)
+                elif process.returncode == 0:
+                    experiment = record_step(
+                        sess, repo, steps[i], memo_key, hparams=hparams, result=result
+                    )
+                    yield StepResult(steps[i], DONE, experiment, 0, log_file)
+                    finish(i)
+                else:
+                    yield StepResult(
+                        steps[i], FAILED, None, process.returncode, log_file
+                    )
+                    for j in sorted(graph.descendants(i) - {i} - skipped):
+                        skipped.add(j)
+                        yield StepResult(steps[j], SKIPPED)
+    finally:
+        for process, _, output, *_ in running.values():
+            process.kill()
+            if output:
+                output.close()
+        shutil.rmtree(result_dir, ignore_errors=True)
+
+
+def run_pipelines(
+    sess: Session,
+    repo: Repo,
+    pipelines: List[Pipeline],
+    max_workers: int = 1,
+    log_dir: Optional[str] = None,
+    force: bool = False,
+) -> Iterator[StepResult]:
+    # Steps shared by several pipelines run once
+    steps = []
+    for pipeline in pipelines:
+        for step in get_pipeline_steps(sess, pipeline):
+            if step not in steps:
+                steps.append(step)
+    yield from schedule_steps(sess, repo, steps, max_workers, log_dir, force)
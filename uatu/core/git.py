@@ -1,40 +1,113 @@
-from typing import List, Union
+from __future__ import annotations  # GitPython is only imported to open a repo
+import os
+import json
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+)
 from os import getcwd
 from os.path import dirname, join, exists, getsize
-import git
-from git import Repo
-from git.refs.log import RefLog
-from .utils import get_relative_path
+from .utils import get_relative_path, dump_json
 import click
 
+if TYPE_CHECKING:
+    from git import Repo
+
 # TODO: review git functions
 
+GIT_STATE_FILE = join('.uatu', 'git_state.json')
+
+# working dir -> {'state': repo state, <query>: cached answer}
+_git_state: Dict[str, dict] = {}
+
+
 def get_repo(repo_dir: str = getcwd()) -> Repo:
+    # Repo() only reads .git, Repo.init() would spawn `git init` every time
+    from git import Repo
+    if exists(join(repo_dir, '.git')):
+        return Repo(repo_dir)
     return Repo.init(repo_dir)
 
 
+def get_repo_state(repo: Repo) -> list:
+    # Everything ls-files and the staged diff depend on: the index and HEAD.
+    # Read straight from .git so that checking the cache never runs git.
+    state = []
+    for path in ('index', 'HEAD', 'packed-refs'):
+        try:
+            stat = os.stat(join(repo.git_dir, path))
+            state.append([stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            state.append(None)
+    with open(join(repo.git_dir, 'HEAD')) as f:
+        head = f.read().strip()
+    state.append(head)
+    if head.startswith('ref: '):
+        ref_file = join(repo.git_dir, head[len('ref: '):])
+        if exists(ref_file):
+            with open(ref_file) as f:
+                state.append(f.read().strip())
+    return state
+
+
+def load_git_state(repo: Repo) -> dict:
+    if repo.working_dir not in _git_state:
+        cache = {}
+        cache_file = join(repo.working_dir, GIT_STATE_FILE)
+        if exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    cache = json.load(f)
+            except (ValueError, OSError):
+                pass
+        _git_state[repo.working_dir] = cache
+    return _git_state[repo.working_dir]
+
+
+def cached_git_query(repo: Repo, query: str, compute: Callable[[], Any]) -> Any:
+    state = get_repo_state(repo)
+    cache = load_git_state(repo)
+    if cache.get('state') != state:
+        cache = _git_state[repo.working_dir] = {'state': state}
+    if query not in cache:
+        cache[query] = compute()
+        cache_file = join(repo.working_dir, GIT_STATE_FILE)
+        if exists(dirname(cache_file)):
+            dump_json(cache, cache_file)
+    return cache[query]
+
+
 def get_tracked_files(repo: Repo) -> List[str]:
-    return repo.git.ls_files().split()
+    return cached_git_query(
+        repo, 'ls_files',
+        lambda: [path for path in repo.git.ls_files('-z').split('\0') if path],
+    )
+
+
+def get_staged_files(repo: Repo) -> Dict[str, str]:
+    # Staged changes (index vs HEAD) as {path: status letter}
+    def compute():
+        if get_head_commit(repo) is None:
+            return {path: 'A' for path in get_tracked_files(repo)}
+        output = repo.git.diff_index('--cached', '--name-status', '--no-renames',
+                                     '-z', 'HEAD')
+        entries = [entry for entry in output.split('\0') if entry]
+        return dict(zip(entries[1::2], entries[0::2]))
 
+    return cached_git_query(repo, 'staged', compute)
 
-def get_changed_files(repo: Repo) -> List[str]:
+
+def get_changed_files(repo: Repo, file_paths: Iterable[str] = ()) -> List[str]:
     # FIXME: reconsider what kind of files should be exposed
-    file_list = repo.git.status('-s').split('\n')
-    changed_files = []
-    for status_file in file_list:
-        status, path = status_file.split()
-        if status in ['MM', 'M', 'A']:
-            changed_files.append(path)
-    return changed_files
+    # Work tree changes are not covered by the index state, so this stays a
+    # live `git status`; pass file_paths to keep it limited to those paths.
+    return [
+        path for path, status in get_status(repo, file_paths).items()
+        if 'M' in status or 'A' in status
+    ]
 
 
 def need_commit(repo: Repo) -> bool:
-    file_list = repo.git.status('-s').split('\n')
-    for status_file in file_list:
-        status, _ = status_file.split()
-        if status == 'A':
-            return True
-    return False
+    return len(get_staged_files(repo)) > 0
 
 
 def create_ignore_file(repo_dir: str) -> str:
@@ -46,31 +119,175 @@ def create_ignore_file(repo_dir: str) -> str:
     return ignore_file
 
 
-def get_last_commit(repo: Repo, file_path: str='') -> Union[str, None]:
-    if file_path:
-        file_path = get_relative_path(file_path, repo.working_dir)
+LAST_COMMITS_FILE = join('.uatu', 'last_commits.json')
+
+# working dir -> (HEAD commit, {relative path: last commit touching it})
+_last_commits: Dict[str, Tuple[Optional[str], Dict[str, Optional[str]]]] = {}
+
+
+def get_head_commit(repo: Repo) -> Union[str, None]:
+    try:
+        return repo.head.commit.hexsha
+    except ValueError:
+        return None
+
+
+def walk_history(repo: Repo, revision: str) -> Iterator[Tuple[str, str]]:
+    # Streams (commit id, changed path) pairs, newest commits first. No pathspec
+    # is given on purpose: matching many pathspecs against every tree entry
+    # costs far more than listing the few files each commit touches.
+    process = repo.git.execute(
+        ['git', '-c', 'core.quotepath=off', 'log', '-c', '--name-only',
+         '--no-renames', '--format=%x00%H', revision],
+        as_process=True,
+    )
     try:
-        commit_id = str(next(repo.iter_commits(paths=file_path)))
-    except StopIteration:
         commit_id = None
-    return commit_id
+        for line in process.proc.stdout:
+            line = line.decode('utf-8').rstrip('\n')
+            if line.startswith('\x00'):
+                commit_id = line[1:]
+            elif line:
+                yield commit_id, line
+    finally:
+        process.proc.kill()
+        process.proc.wait()
 
 
-def add_file(repo: Repo, file_path: str, limited_size=1000000) -> bool:
-    file_path = get_relative_path(file_path, repo.working_dir)
-    changed_files = get_changed_files(repo)
-    if file_path in changed_files:
-        file_size = getsize(file_path)
-        if file_size >= limited_size:
-            repo.git.execute(['git', 'lfs', 'track', file_path])
-            repo.git.execute(['git', 'add', file_path])
-        else:
-            repo.git.execute(['git', 'add', file_path])
-        return True
-    else:
+def find_last_commits(repo: Repo, rel_paths: List[str], revision: str) -> Dict[str, Optional[str]]:
+    # A single history walk, stopped as soon as every path is resolved
+    last_commits = dict.fromkeys(rel_paths)
+    pending = set(rel_paths)
+    history = walk_history(repo, revision)
+    for commit_id, path in history:
+        if path in pending:
+            last_commits[path] = commit_id
+            pending.discard(path)
+            if not pending:
+                break
+    history.close()
+    return last_commits
+
+
+def load_last_commits(repo: Repo) -> Tuple[Optional[str], Dict[str, Optional[str]]]:
+    if repo.working_dir not in _last_commits:
+        cache_file = join(repo.working_dir, LAST_COMMITS_FILE)
+        head, cache = None, {}
+        if exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    head, cache = json.load(f)
+            except (ValueError, OSError):
+                pass
+        _last_commits[repo.working_dir] = (head, cache)
+    return _last_commits[repo.working_dir]
+
+
+def save_last_commits(repo: Repo, head: Optional[str], cache: Dict[str, Optional[str]]):
+    _last_commits[repo.working_dir] = (head, cache)
+    cache_file = join(repo.working_dir, LAST_COMMITS_FILE)
+    if exists(dirname(cache_file)):
+        dump_json([head, cache], cache_file)
+
+
+def is_ancestor(repo: Repo, ancestor: str, commit: str) -> bool:
+    # False as well when `ancestor` is gone, e.g. after a rebase and gc
+    from git.exc import GitCommandError
+    try:
+        return repo.is_ancestor(ancestor, commit)
+    except GitCommandError:
         return False
 
 
+def get_last_commits(repo: Repo, file_paths: Iterable[str]) -> Dict[str, Optional[str]]:
+    rel_paths = {
+        file_path: get_relative_path(file_path, repo.working_dir)
+        for file_path in file_paths
+    }
+    head = get_head_commit(repo)
+    cached_head, cache = load_last_commits(repo)
+    updated = cached_head != head
+    if updated:
+        if cached_head and head and is_ancestor(repo, cached_head, head):
+            # Only the commits since the cached HEAD can change the answers
+            changes = {}
+            for commit_id, path in walk_history(repo, f'{cached_head}..{head}'):
+                changes.setdefault(path, commit_id)
+            cache = {**cache, **changes}
+        else:
+            cache = {}
+
+    missing = sorted(set(rel_paths.values()) - set(cache))
+    if missing:
+        if head:
+            cache.update(find_last_commits(repo, missing, head))
+        else:
+            cache.update(dict.fromkeys(missing))
+    if updated or missing:
+        save_last_commits(repo, head, cache)
+    return {file_path: cache[rel_path] for file_path, rel_path in rel_paths.items()}
+
+
+def get_last_commit(repo: Repo, file_path: str='') -> Union[str, None]:
+    if not file_path:
+        return get_head_commit(repo)
+    return get_last_commits(repo, [file_path])[file_path]
+
+
+def get_status(repo: Repo, file_paths: Iterable[str] = ()) -> Dict[str, str]:
+    # Porcelain `XY` status codes of the given paths (the whole tree by default)
+    output = repo.git.status('--porcelain', '-z', '--no-renames',
+                             '--untracked-files=all', '--', *file_paths)
+    return {entry[3:]: entry[:2] for entry in output.split('\0') if entry}
+
+
+def get_blob_hashes(repo: Repo, file_paths: Iterable[str]) -> Dict[str, Optional[str]]:
+    # Blob ids the files would get if committed now (filters such as LFS applied),
+    # None for missing files
+    file_paths = list(file_paths)
+    existing = [
+        file_path for file_path in file_paths
+        if exists(join(repo.working_dir, get_relative_path(file_path, repo.working_dir)))
+    ]
+    blob_hashes = dict.fromkeys(file_paths)
+    if existing:
+        rel_paths = [get_relative_path(file_path, repo.working_dir) for file_path in existing]
+        output = repo.git.hash_object('--', *rel_paths)
+        blob_hashes.update(zip(existing, output.split()))
+    return blob_hashes
+
+
+def add_files(repo: Repo, file_paths: Iterable[str], limited_size=1000000) -> List[str]:
+    # Stages every new or modified file among file_paths with one status call,
+    # one `git lfs track` for the large ones and one `git add`.
+    rel_paths = sorted(set(
+        get_relative_path(file_path, repo.working_dir) for file_path in file_paths
+    ))
+    if not rel_paths:
+        return []
+    status = get_status(repo, rel_paths)
+    changed_files = [
+        rel_path for rel_path in rel_paths
+        if rel_path in status and status[rel_path] != '!!'
+    ]
+    # Deleted files are staged as deletions, they have no size
+    large_files = [
+        rel_path for rel_path in changed_files
+        if exists(join(repo.working_dir, rel_path))
+        and getsize(join(repo.working_dir, rel_path)) >= limited_size
+    ]
+    if large_files:
+        repo.git.execute(['git', 'lfs', 'track', '--', *large_files])
+        changed_files.append('.gitattributes')
+    if changed_files:
+        repo.git.execute(['git', 'add', '--', *changed_files])
+    return changed_files
+
+
+def add_file(repo: Repo, file_path: str, limited_size=1000000) -> bool:
+    return len(add_files(repo, [file_path], limited_size)) > 0
+
+
 def add_git_ignore(ignore_file: str, path: str):
     with open(ignore_file) as f:
         lines = [line.strip() for line in f]
@@ -102,8 +319,8 @@ def initialize_git(repo_dir: str = getcwd()) -> Repo:
     if not exists(attributes_file):
         f = open(attributes_file, 'w')
         f.close()
-    add_file(repo, ignore_file)
-    add_file(repo, attributes_file)
-    repo.commit('Initialize uatu')
+    staged_files = add_files(repo, [ignore_file, attributes_file])
+    if staged_files:
+        repo.git.commit('-m', 'Initialize uatu', '--', *staged_files)
 
     return repo
\ No newline at end of file
@@ -1,23 +1,22 @@
+from __future__ import annotations  # SQLAlchemy is only imported to create the db
 import os
 from os.path import join, exists
 from shutil import rmtree
-from typing import Union, Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Union, Optional
 import json
-from sqlalchemy import Column, String, Integer, PickleType, Text, ForeignKey, create_engine
-from sqlalchemy.orm import relationship, sessionmaker, Session
-from sqlalchemy.ext.declarative import declarative_base
-import yaml
 import click
 from .logger import get_logger
-from .database import initialize_db
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
 
 
 def check_uatu_initialized(dir_path: str = os.getcwd()) -> bool:
     uatu_dir = join(dir_path, '.uatu')
     if exists(uatu_dir):
         if exists(join(uatu_dir, 'config.yaml')):
-            with open(join(uatu_dir, 'config.yaml')) as f:
-                config = yaml.safe_load(f)
+            config = get_uatu_config(dir_path)
             for file_name, file_path in config.items():
                 if not exists(file_path):
                     click.echo(f'{file_name} not exists!')
@@ -40,6 +39,8 @@ def clean_uatu(dir_path=os.getcwd()):
 
 def initialize_uatu(dir_path: str = os.getcwd(),
                     user_config: Optional[dict] = None) -> Session:
+    import yaml
+    from .database import initialize_db
     clean_uatu(dir_path)
 
     uatu_dir = join(dir_path, '.uatu')
@@ -75,5 +76,22 @@ def initialize_uatu(dir_path: str = os.getcwd(),
 
 
 def get_uatu_config(dir_path: str = os.getcwd()) -> dict:
-    with open(join(dir_path, '.uatu', 'config.yaml')) as f:
+    # Parsed once per process and version of the config file
+    config_file = join(dir_path, '.uatu', 'config.yaml')
+    return dict(load_uatu_config(config_file, os.stat(config_file).st_mtime_ns))
+
+
+@lru_cache(maxsize=16)
+def load_uatu_config(config_file: str, mtime_ns: int) -> dict:
+    import yaml
+    with open(config_file) as f:
         return yaml.safe_load(f)
+
+
+def __getattr__(name: str):
+    # initialize_db used to be imported here, keep it importable without
+    # loading SQLAlchemy for every user of this module
+    if name == 'initialize_db':
+        from .database import initialize_db
+        return initialize_db
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,141 @@
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from os.path import basename, join
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # getrusage is not available on Windows
+    resource = None
+
+PROC_IO_FILE = "/proc/self/io"
+# Seconds between two stack samples of the profiler
+PROFILE_INTERVAL = 0.01
+
+
+def get_profile_file(experiment_dir: str, experiment_id: str) -> str:
+    return join(experiment_dir, f"{experiment_id}.folded")
+
+
+def get_peak_rss() -> Optional[int]:
+    # In bytes, getrusage reports kilobytes except on macOS
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_io_bytes() -> Tuple[Optional[int], Optional[int]]:
+    # Bytes read from and written to storage by this process, taken from /proc
+    # on Linux and estimated from block operations elsewhere
+    try:
+        with open(PROC_IO_FILE) as f:
+            counters = dict(line.split(":", 1) for line in f)
+        return int(counters["read_bytes"]), int(counters["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        pass
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+
+class ResourceMonitor(object):
+    # Wall time, CPU time and I/O between start() and stop(), the peak RSS of
+    # the process and the time spent in named sections. Only counters are read
+    # at the boundaries, nothing runs while the monitored code does.
+    def __init__(self):
+        self._sections: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self._start: Optional[Tuple[float, float]] = None
+        self._io: Tuple[Optional[int], Optional[int]] = (None, None)
+
+    def start(self):
+        self._io = get_io_bytes()
+        self._start = (time.perf_counter(), time.process_time())
+
+    @contextmanager
+    def section(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                totals = self._sections.setdefault(name, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+
+    def stop(self) -> dict:
+        wall_time = time.perf_counter() - self._start[0]
+        cpu_time = time.process_time() - self._start[1]
+        resources = {"wall_time": wall_time, "cpu_time": cpu_time}
+        peak_rss = get_peak_rss()
+        if peak_rss is not None:
+            resources["peak_rss"] = peak_rss
+        io_bytes = get_io_bytes()
+        for name, start, stop in zip(("read_bytes", "write_bytes"), self._io, io_bytes):
+            if start is not None and stop is not None:
+                resources[name] = stop - start
+        with self._lock:
+            if self._sections:
+                resources["sections"] = {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in self._sections.items()
+                }
+        return resources
+
+
+class SamplingProfiler(object):
+    # Samples the stack of one thread (the one creating the profiler by
+    # default) every `interval` seconds from a daemon thread. Stacks are dumped
+    # in the folded format read by flamegraph.pl and speedscope: one line per
+    # distinct stack, frames from the root joined by ";", then the sample count.
+    def __init__(
+        self, thread_id: Optional[int] = None, interval: float = PROFILE_INTERVAL
+    ):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._sample, name="uatu-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample(self):
+        labels = dict()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = (
+                        f"{code.co_name} "
+                        f"({basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def dump(self, file_path: str):
+        dump_folded(self.samples, file_path)
+
+
+def dump_folded(samples: Counter, file_path: str):
+    with open(file_path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
@@ -0,0 +1,273 @@
+import os
+import mmap
+import tempfile
+import struct
+from array import array
+from os.path import abspath, dirname, exists, join
+from typing import Optional, Tuple, Union
+from sqlalchemy import delete, func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from .orm import EdgeLog, File, Record, FILE_LEVEL, RECORD_LEVEL
+from .directed_graph import DirectedGraph, FrozenDirectedGraph
+from .database import BUSY_TIMEOUT
+
+# magic, generation, number of nodes, number of arcs, size of the id blob
+SNAPSHOT_MAGIC = b"UATULIN1"
+SNAPSHOT_HEADER = struct.Struct("<8sQQQQ")
+# Replaying this many deltas saves a new snapshot, which prunes them from the log
+SNAPSHOT_DELTAS = 1000
+# Past this many pending deltas the snapshot is rebuilt instead of patched
+MAX_SNAPSHOT_DELTAS = 10000
+
+LineageGraph = Union[DirectedGraph, FrozenDirectedGraph]
+
+
+def get_generation(sess: Session) -> int:
+    # The last generation handed out, which pruning edge_log does not reset
+    sequence = sess.execute(
+        text("SELECT seq FROM sqlite_sequence WHERE name = 'edge_log'")
+    ).scalar()
+    return sequence or 0
+
+
+def get_snapshot_path(sess: Session, level: str = RECORD_LEVEL) -> str:
+    # Kept next to the database, i.e. in `.uatu/` for a regular project
+    return join(dirname(abspath(sess.bind.url.database)), f"lineage_{level}.bin")
+
+
+def compress(num_nodes: int, starts: array, ends: array) -> Tuple[array, array]:
+    # Counting sort of the arcs by start node into CSR offsets/targets
+    offsets = array("Q", bytes(8 * (num_nodes + 1)))
+    for start in starts:
+        offsets[start + 1] += 1
+    for i in range(num_nodes):
+        offsets[i + 1] += offsets[i]
+    positions = array("Q", offsets[:-1])
+    targets = array("I", bytes(4 * len(ends)))
+    for start, end in zip(starts, ends):
+        targets[positions[start]] = end
+        positions[start] += 1
+    return offsets, targets
+
+
+def build_lineage_graph(
+    sess: Session, level: str = RECORD_LEVEL
+) -> Tuple[int, FrozenDirectedGraph]:
+    # The generation is read first: edges changed while reading are replayed
+    # again by update_lineage_graph, which is idempotent
+    generation = get_generation(sess)
+    node_class = File if level == FILE_LEVEL else Record
+    index = dict()
+    for (node_id,) in sess.query(node_class.id):
+        index.setdefault(node_id, len(index))
+    predecessors, successors = array("I"), array("I")
+    # Millions of rows: iterate the DBAPI cursor, skipping SQLAlchemy row objects
+    cursor = sess.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT predecessor_id, successor_id FROM edges WHERE level = ?", (level,)
+        )
+        for predecessor_id, successor_id in cursor:
+            predecessors.append(index.setdefault(predecessor_id, len(index)))
+            successors.append(index.setdefault(successor_id, len(index)))
+    finally:
+        cursor.close()
+    offsets, targets = compress(len(index), predecessors, successors)
+    reverse_offsets, sources = compress(len(index), successors, predecessors)
+    graph = FrozenDirectedGraph.from_csr(
+        list(index), offsets, targets, reverse_offsets, sources
+    )
+    return generation, graph
+
+
+def save_lineage_snapshot(file_path: str, generation: int, graph: FrozenDirectedGraph):
+    # Layout: header, offsets, reverse offsets (u64), targets, sources (u32), ids
+    id_blob = "\n".join(graph._nodes).encode()
+    # A private temp file per call, readers never see a partial snapshot
+    fd, temp_file = tempfile.mkstemp(
+        prefix=os.path.basename(file_path) + ".", dir=os.path.dirname(file_path)
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(
+                SNAPSHOT_HEADER.pack(
+                    SNAPSHOT_MAGIC,
+                    generation,
+                    len(graph._nodes),
+                    len(graph._targets),
+                    len(id_blob),
+                )
+            )
+            for values in (
+                graph._offsets,
+                graph._reverse_offsets,
+                graph._targets,
+                graph._sources,
+            ):
+                f.write(values)
+            f.write(id_blob)
+        os.replace(temp_file, file_path)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+
+def prune_edge_log(sess: Session, level: str, generation: int):
+    # Deltas up to a saved snapshot are never replayed again. Deleted on a
+    # connection of its own, outside the caller's transaction; when the
+    # database is busy they are left for the next snapshot.
+    with sess.bind.connect() as conn:
+        conn.execute(text("PRAGMA busy_timeout = 0"))
+        try:
+            with conn.begin():
+                conn.execute(
+                    delete(EdgeLog.__table__).where(
+                        EdgeLog.level == level, EdgeLog.generation <= generation
+                    )
+                )
+        except OperationalError:
+            pass
+        finally:
+            conn.execute(text(f"PRAGMA busy_timeout = {BUSY_TIMEOUT * 1000}"))
+
+
+def trim_edge_log(sess: Session):
+    # Bounds the log of projects that change edges far more often than they
+    # read lineage, at the cost of two indexed reads. Past MAX_SNAPSHOT_DELTAS
+    # pending deltas a snapshot is rebuilt rather than patched, so they are
+    # folded into a new snapshot, or dropped for a level without snapshot.
+    # The latest ones are kept there for a reader building it right now.
+    oldest = sess.query(func.min(EdgeLog.generation)).scalar()
+    generation = get_generation(sess)
+    if oldest is None or generation - oldest < 2 * MAX_SNAPSHOT_DELTAS:
+        return
+    for level in (FILE_LEVEL, RECORD_LEVEL):
+        if exists(get_snapshot_path(sess, level)):
+            save_lineage_graph(sess, *get_lineage_graph(sess, level), level)
+        else:
+            prune_edge_log(sess, level, generation - MAX_SNAPSHOT_DELTAS)
+
+
+def get_snapshot_generation(file_path: str) -> int:
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+    except OSError:
+        return 0
+    if len(header) < SNAPSHOT_HEADER.size:
+        return 0
+    magic, generation, *_ = SNAPSHOT_HEADER.unpack(header)
+    return generation if magic == SNAPSHOT_MAGIC else 0
+
+
+def load_lineage_snapshot(
+    file_path: str,
+) -> Optional[Tuple[int, FrozenDirectedGraph]]:
+    # Arrays stay memory-mapped, only the node ids are decoded
+    with open(file_path, "rb") as f:
+        try:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except ValueError:
+            return None
+    if len(buffer) < SNAPSHOT_HEADER.size:
+        return None
+    magic, generation, num_nodes, num_arcs, blob_size = SNAPSHOT_HEADER.unpack(
+        buffer[: SNAPSHOT_HEADER.size]
+    )
+    sizes = [8 * (num_nodes + 1)] * 2 + [4 * num_arcs] * 2 + [blob_size]
+    if magic != SNAPSHOT_MAGIC or len(buffer) != SNAPSHOT_HEADER.size + sum(sizes):
+        return None
+    sections, start = [], SNAPSHOT_HEADER.size
+    for size in sizes:
+        sections.append(buffer[start : start + size])
+        start += size
+    offsets, reverse_offsets = sections[0].cast("Q"), sections[1].cast("Q")
+    targets, sources = sections[2].cast("I"), sections[3].cast("I")
+    nodes = bytes(sections[4]).decode().split("\n") if num_nodes else []
+    graph = FrozenDirectedGraph.from_csr(
+        nodes, offsets, targets, reverse_offsets, sources
+    )
+    return generation, graph
+
+
+def get_lineage_graph(
+    sess: Session, level: str = RECORD_LEVEL
+) -> Tuple[int, LineageGraph]:
+    # Loads the snapshot of `.uatu/`, rebuilding it when missing or too stale,
+    # and brings it up to date with the logged edge changes. A new snapshot is
+    # saved, and the log pruned, once enough changes piled up.
+    snapshot_path = get_snapshot_path(sess, level)
+    snapshot = load_lineage_snapshot(snapshot_path) if exists(snapshot_path) else None
+    if snapshot:
+        generation, graph = snapshot
+        stale = sess.query(EdgeLog).filter(
+            EdgeLog.generation > generation, EdgeLog.level == level
+        )
+        num_deltas = stale.limit(MAX_SNAPSHOT_DELTAS + 1).count()
+        if num_deltas <= MAX_SNAPSHOT_DELTAS:
+            generation, graph = update_lineage_graph(sess, generation, graph, level)
+            if num_deltas >= SNAPSHOT_DELTAS:
+                graph = save_lineage_graph(sess, generation, graph, level)
+            return generation, graph
+    generation, graph = build_lineage_graph(sess, level)
+    save_lineage_snapshot(snapshot_path, generation, graph)
+    prune_edge_log(sess, level, generation)
+    return update_lineage_graph(sess, generation, graph, level)
+
+
+def save_lineage_graph(
+    sess: Session, generation: int, graph: LineageGraph, level: str = RECORD_LEVEL
+) -> LineageGraph:
+    # Folds the patches of a frozen graph into a new snapshot of `generation`,
+    # pruning the deltas it covers from the log
+    if isinstance(graph, FrozenDirectedGraph):
+        graph = graph.freeze()
+        save_lineage_snapshot(get_snapshot_path(sess, level), generation, graph)
+        prune_edge_log(sess, level, generation)
+    return graph
+
+
+def refresh_lineage_graph(
+    sess: Session, generation: int, graph: LineageGraph, level: str = RECORD_LEVEL
+) -> Tuple[int, LineageGraph]:
+    # update_lineage_graph for a graph kept in memory: once SNAPSHOT_DELTAS
+    # changes piled up on it since the snapshot, it is saved as the new one
+    # rather than patched ever further
+    generation, graph = update_lineage_graph(sess, generation, graph, level)
+    snapshot_generation = get_snapshot_generation(get_snapshot_path(sess, level))
+    if generation - snapshot_generation >= SNAPSHOT_DELTAS:
+        graph = save_lineage_graph(sess, generation, graph, level)
+    return generation, graph
+
+
+def update_lineage_graph(
+    sess: Session, generation: int, graph: LineageGraph, level: str = RECORD_LEVEL
+) -> Tuple[int, LineageGraph]:
+    # Applies the edge changes logged after `generation`. A frozen graph is
+    # patched, a DirectedGraph changed in place. Changes pruned by a newer
+    # snapshot can not be replayed, the graph is then loaded from it instead.
+    current = get_generation(sess)
+    deltas = (
+        sess.query(EdgeLog)
+        .filter(EdgeLog.generation > generation, EdgeLog.generation <= current)
+        .filter(EdgeLog.level == level)
+        .order_by(EdgeLog.generation)
+        .all()
+    )
+    # Snapshots are saved before the log is pruned, so checking after the query
+    # catches any pruning the query may have missed rows to
+    if get_snapshot_generation(get_snapshot_path(sess, level)) > generation:
+        return get_lineage_graph(sess, level)
+    changes = [
+        (delta.predecessor_id, delta.successor_id, delta.deleted) for delta in deltas
+    ]
+    if isinstance(graph, FrozenDirectedGraph):
+        return max(generation, current), graph.patch(changes)
+    for predecessor_id, successor_id, deleted in changes:
+        if not deleted:
+            graph.add_arc(predecessor_id, successor_id, True)
+        elif predecessor_id in graph and successor_id in graph:
+            if successor_id in graph.successors(predecessor_id):
+                graph.delete_arc(predecessor_id, successor_id)
+    return max(generation, current), graph
@@ -0,0 +1,232 @@
+import os
+import mmap
+import time
+import atexit
+import threading
+from array import array
+from bisect import bisect_left
+from os.path import exists, getsize, join
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, pure Python fallbacks are used without it
+    np = None
+
+# Flush after this many points or seconds, whichever comes first
+BUFFER_SIZE = 1000
+FLUSH_INTERVAL = 1.0
+# Every run.log call also records its wall-clock time under this name
+TIME_SERIES = "_time"
+STEP_SUFFIX, VALUE_SUFFIX = ".step", ".value"
+
+
+def get_series_dir(experiment_dir: str, experiment_id: str) -> str:
+    return join(experiment_dir, f"{experiment_id}.series")
+
+
+def get_series_files(series_dir: str, name: str) -> Tuple[str, str]:
+    base = join(series_dir, quote(name, safe=""))
+    return base + STEP_SUFFIX, base + VALUE_SUFFIX
+
+
+class MetricWriter(object):
+    # Columnar and append-only: every metric is a pair of files in `series_dir`
+    # holding its steps (int64) and values (float64) back to back in native
+    # byte order. Points are buffered in memory and appended by one write per
+    # file, so a crashed process loses at most the points since the last flush.
+    # Writers are thread-safe, other ranks' points are added from other threads.
+    def __init__(
+        self,
+        series_dir: str,
+        buffer_size: int = BUFFER_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.series_dir = series_dir
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffers: Dict[str, Tuple[array, array]] = {}
+        self._files: Dict[str, Tuple[BinaryIO, BinaryIO]] = {}
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def log(self, step: int, **metrics):
+        metrics[TIME_SERIES] = time.time()
+        self.add(step, metrics)
+
+    def add(self, step: int, metrics: Dict[str, float]):
+        # Appends the point as is, without adding its time
+        with self._lock:
+            for name, value in metrics.items():
+                buffer = self._buffers.get(name)
+                if buffer is None:
+                    buffer = self._buffers[name] = (array("q"), array("d"))
+                buffer[0].append(step)
+                buffer[1].append(value)
+            self._size += 1
+            if (
+                self._size >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._size:
+            return
+        if not self._files:
+            os.makedirs(self.series_dir, exist_ok=True)
+            atexit.register(self.close)
+        for name, (steps, values) in self._buffers.items():
+            if not steps:
+                continue
+            files = self._files.get(name)
+            if files is None:
+                files = self._files[name] = tuple(
+                    open(file_path, "ab", buffering=0)
+                    for file_path in get_series_files(self.series_dir, name)
+                )
+            files[0].write(steps)
+            files[1].write(values)
+            del steps[:], values[:]
+        self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            for files in self._files.values():
+                for f in files:
+                    f.close()
+            if self._files:
+                self._files = {}
+                atexit.unregister(self.close)
+
+
+def map_array(file_path: str, typecode: str) -> Sequence:
+    # Read-only typed view of a file, a torn trailing item is ignored
+    itemsize = array(typecode).itemsize
+    size = getsize(file_path) // itemsize * itemsize
+    if not size:
+        return memoryview(b"").cast(typecode)
+    with open(file_path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(buffer)[:size].cast(typecode)
+
+
+class MetricSeries(object):
+    # One metric of an experiment, memory-mapped so that slicing a step range
+    # only pages in the bytes of that range. Steps must not decrease.
+    def __init__(self, series_dir: str, name: str):
+        self.name = name
+        step_file, value_file = get_series_files(series_dir, name)
+        steps, values = map_array(step_file, "q"), map_array(value_file, "d")
+        # A crash between the two appends may leave one column longer
+        size = min(len(steps), len(values))
+        self.steps, self.values = steps[:size], values[:size]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def range(
+        self, start: Optional[int] = None, stop: Optional[int] = None
+    ) -> Tuple[Sequence, Sequence]:
+        # Points with start <= step < stop, as zero-copy views
+        i = 0 if start is None else bisect_left(self.steps, start)
+        j = len(self) if stop is None else bisect_left(self.steps, stop)
+        steps, values = self.steps[i:j], self.values[i:j]
+        if np is not None:
+            return np.frombuffer(steps, np.int64), np.frombuffer(values, np.float64)
+        return steps, values
+
+    def downsample(
+        self,
+        num_points: int,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        method: str = "lttb",
+    ):
+        # "lttb" keeps the visually relevant points, "minmax" returns the first
+        # step, minimum and maximum of `num_points` equally sized buckets
+        if method == "lttb":
+            return lttb(*self.range(start, stop), num_points)
+        if method == "minmax":
+            return minmax(*self.range(start, stop), num_points)
+        raise ValueError(f"Unknown downsampling method '{method}'")
+
+
+def open_series(series_dir: str) -> Dict[str, MetricSeries]:
+    if not exists(series_dir):
+        return {}
+    series = {}
+    for file_name in sorted(os.listdir(series_dir)):
+        if file_name.endswith(STEP_SUFFIX):
+            name = unquote(file_name[: -len(STEP_SUFFIX)])
+            series[name] = MetricSeries(series_dir, name)
+    return series
+
+
+def get_buckets(size: int, num_buckets: int) -> List[int]:
+    return [size * i // num_buckets for i in range(num_buckets + 1)]
+
+
+def minmax(steps: Sequence, values: Sequence, num_buckets: int):
+    if len(steps) <= num_buckets:
+        return steps, values, values
+    edges = get_buckets(len(steps), num_buckets)
+    starts = edges[:-1]
+    if np is not None and isinstance(values, np.ndarray):
+        return (
+            steps[starts],
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts),
+        )
+    return (
+        [steps[i] for i in starts],
+        [min(values[i:j]) for i, j in zip(starts, edges[1:])],
+        [max(values[i:j]) for i, j in zip(starts, edges[1:])],
+    )
+
+
+def lttb(steps: Sequence, values: Sequence, num_points: int):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, per
+    # bucket in between, the point forming the largest triangle with the point
+    # kept before it and the average of the next bucket
+    size = len(steps)
+    if num_points >= size or num_points < 3:
+        return steps, values
+    edges = [1 + i for i in get_buckets(size - 2, num_points - 2)] + [size]
+    numpy = np is not None and isinstance(values, np.ndarray)
+    if numpy:
+        xs = steps.astype(np.float64)
+        sums = np.add.reduceat(xs, edges[1:-1]), np.add.reduceat(values, edges[1:-1])
+        counts = np.diff(edges[1:])
+        avg_xs, avg_ys = sums[0] / counts, sums[1] / counts
+    selected = [0]
+    for bucket in range(num_points - 2):
+        i, j = edges[bucket], edges[bucket + 1]
+        ax, ay = steps[selected[-1]], values[selected[-1]]
+        if numpy:
+            avg_x, avg_y = avg_xs[bucket], avg_ys[bucket]
+            areas = np.abs(
+                (ax - avg_x) * (values[i:j] - ay) - (ax - xs[i:j]) * (avg_y - ay)
+            )
+            selected.append(i + int(areas.argmax()))
+            continue
+        k = edges[bucket + 2]
+        avg_x = sum(steps[j:k]) / (k - j)
+        avg_y = sum(values[j:k]) / (k - j)
+        areas = [
+            abs((ax - avg_x) * (values[m] - ay) - (ax - steps[m]) * (avg_y - ay))
+            for m in range(i, j)
+        ]
+        selected.append(i + areas.index(max(areas)))
+    selected.append(size - 1)
+    if numpy:
+        return steps[selected], values[selected]
+    return [steps[i] for i in selected], [values[i] for i in selected]
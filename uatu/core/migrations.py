@@ -0,0 +1,211 @@
+import json
+import sqlite3
+from typing import Callable, List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from .orm import Base, FILE_LEVEL, RECORD_LEVEL, VALUE_KINDS
+from .utils import get_fingerprint, flatten_dict, split_typed_value
+
+
+def get_schema_version(conn: Connection) -> int:
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def set_schema_version(conn: Connection, version: int):
+    conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def get_columns(conn: Connection, table: str) -> List[str]:
+    return [column["name"] for column in inspect(conn).get_columns(table)]
+
+
+def drop_columns(conn: Connection, table: str, columns: List[str]):
+    # ALTER TABLE ... DROP COLUMN needs SQLite 3.35, older libraries keep the
+    # legacy columns around, which is harmless since nothing maps them anymore.
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        return
+    existing = get_columns(conn, table)
+    for column in columns:
+        if column in existing:
+            conn.execute(text(f'ALTER TABLE "{table}" DROP COLUMN {column}'))
+
+
+# Version 0 -> 1: JSON `predecessor_ids`/`successor_ids` columns become `edges` rows
+def adjacency_to_edges(conn: Connection):
+    for table, level in (("files", FILE_LEVEL), ("Records", RECORD_LEVEL)):
+        columns = get_columns(conn, table)
+        if "successor_ids" not in columns or "predecessor_ids" not in columns:
+            continue
+        edges = []
+        rows = conn.execute(
+            text(f'SELECT id, predecessor_ids, successor_ids FROM "{table}"')
+        )
+        for node_id, predecessor_ids, successor_ids in rows:
+            for predecessor_id in json.loads(predecessor_ids or "[]"):
+                edges.append({"level": level, "pred": predecessor_id, "succ": node_id})
+            for successor_id in json.loads(successor_ids or "[]"):
+                edges.append({"level": level, "pred": node_id, "succ": successor_id})
+        if edges:
+            conn.execute(
+                text(
+                    "INSERT OR IGNORE INTO edges (level, predecessor_id, successor_id) "
+                    "VALUES (:level, :pred, :succ)"
+                ),
+                edges,
+            )
+        drop_columns(conn, table, ["predecessor_ids", "successor_ids"])
+
+
+# Version 1 -> 2: JSON `file_id_lists`/`node_id_lists` are mirrored into the
+# `pipeline_files`/`experiment_nodes` membership tables
+def id_lists_to_memberships(conn: Connection):
+    for table, column, membership, owner, member in (
+        ("pipelines", "file_id_lists", "pipeline_files", "pipeline_id", "file_id"),
+        (
+            "experiments",
+            "node_id_lists",
+            "experiment_nodes",
+            "experiment_id",
+            "node_id",
+        ),
+    ):
+        rows = []
+        for owner_id, id_lists in conn.execute(
+            text(f"SELECT id, {column} FROM {table}")
+        ):
+            for stage, id_list in enumerate(json.loads(id_lists or "[]")):
+                for member_id in set(id_list):
+                    rows.append(
+                        {"owner": owner_id, "stage": stage, "member": member_id}
+                    )
+        if rows:
+            conn.execute(
+                text(
+                    f"INSERT OR IGNORE INTO {membership} ({owner}, stage, {member}) "
+                    "VALUES (:owner, :stage, :member)"
+                ),
+                rows,
+            )
+
+
+# Version 2 -> 3: pipelines get a unique, indexed fingerprint of their stages
+def pipeline_fingerprints(conn: Connection):
+    if "fingerprint" not in get_columns(conn, "pipelines"):
+        conn.execute(text("ALTER TABLE pipelines ADD COLUMN fingerprint VARCHAR(64)"))
+    seen = set()
+    for pipeline_id, file_id_lists in conn.execute(
+        text("SELECT id, file_id_lists FROM pipelines")
+    ):
+        file_id_lists = [sorted(set(ids)) for ids in json.loads(file_id_lists or "[]")]
+        fingerprint = get_fingerprint(file_id_lists)
+        # Duplicated pipelines keep a NULL fingerprint rather than breaking uniqueness
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        conn.execute(
+            text("UPDATE pipelines SET fingerprint = :fingerprint WHERE id = :id"),
+            {"fingerprint": fingerprint, "id": pipeline_id},
+        )
+    conn.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_pipelines_fingerprint "
+            "ON pipelines (fingerprint)"
+        )
+    )
+
+
+# Version 3 -> 4: config/hparams/metrics blobs are flattened into `experiment_values`
+def experiment_values(conn: Connection):
+    rows = []
+    for experiment_id, *blobs in conn.execute(
+        text("SELECT id, config, hparams, metrics FROM experiments")
+    ):
+        for kind, blob in zip(VALUE_KINDS, blobs):
+            for key, value in flatten_dict(json.loads(blob or "{}")):
+                number, string = split_typed_value(value)
+                rows.append(
+                    {
+                        "experiment_id": experiment_id,
+                        "kind": kind,
+                        "key": key,
+                        "number": number,
+                        "string": string,
+                    }
+                )
+    if rows:
+        conn.execute(
+            text(
+                "INSERT OR IGNORE INTO experiment_values "
+                "(experiment_id, kind, key, number, string) "
+                "VALUES (:experiment_id, :kind, :key, :number, :string)"
+            ),
+            rows,
+        )
+
+
+# Version 4 -> 5: triggers record every change of `edges` in `edge_log`
+def edge_log_triggers(conn: Connection):
+    for event, row, deleted in (("INSERT", "NEW", 0), ("DELETE", "OLD", 1)):
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS edges_log_{event.lower()} "
+                f"AFTER {event} ON edges BEGIN "
+                "INSERT INTO edge_log (level, predecessor_id, successor_id, deleted) "
+                f"VALUES ({row}.level, {row}.predecessor_id, {row}.successor_id, "
+                f"{deleted}); END"
+            )
+        )
+
+
+# Version 5 -> 6: experiments get an indexed memoization key
+def experiment_memo_keys(conn: Connection):
+    if "memo_key" not in get_columns(conn, "experiments"):
+        conn.execute(text("ALTER TABLE experiments ADD COLUMN memo_key VARCHAR(64)"))
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_experiments_memo_key "
+            "ON experiments (memo_key)"
+        )
+    )
+
+
+# Version 6 -> 7: experiments get a `resources` blob next to their metrics
+def experiment_resources(conn: Connection):
+    if "resources" not in get_columns(conn, "experiments"):
+        conn.execute(
+            text("ALTER TABLE experiments ADD COLUMN resources TEXT DEFAULT '{}'")
+        )
+
+
+# MIGRATIONS[i] upgrades a database from schema version i to i + 1
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    adjacency_to_edges,
+    id_lists_to_memberships,
+    pipeline_fingerprints,
+    experiment_values,
+    edge_log_triggers,
+    experiment_memo_keys,
+    experiment_resources,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def upgrade(engine: Engine):
+    # Up-to-date databases skip the write lock and create_all's table checks
+    with engine.connect() as conn:
+        if get_schema_version(conn) == SCHEMA_VERSION:
+            return
+    with engine.begin() as conn:
+        # Serialise concurrent first connections to the same database
+        conn.execute(text("BEGIN IMMEDIATE"))
+        fresh = not conn.dialect.has_table(conn, "files")
+        Base.metadata.create_all(conn, checkfirst=True)
+        if fresh:
+            edge_log_triggers(conn)
+            set_schema_version(conn, SCHEMA_VERSION)
+            return
+        version = get_schema_version(conn)
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        if version < SCHEMA_VERSION:
+            set_schema_version(conn, SCHEMA_VERSION)
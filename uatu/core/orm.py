@@ -1,10 +1,62 @@
-from sqlalchemy import Column, String, Text, PickleType, ForeignKey
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    Integer,
+    String,
+    Text,
+    PickleType,
+    ForeignKey,
+    Index,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
+from typing import List
 import json
 
 Base = declarative_base()
 
+FILE_LEVEL = "file"
+RECORD_LEVEL = "record"
+
+VALUE_KINDS = ("config", "hparams", "metrics", "resources")
+
+
+class Edge(Base):  # type: ignore
+    __tablename__ = "edges"
+    __table_args__ = (
+        Index("ix_edges_successor", "level", "successor_id", "predecessor_id"),
+    )
+
+    level = Column(String(8), primary_key=True)
+    predecessor_id = Column(String(16), primary_key=True)
+    successor_id = Column(String(16), primary_key=True)
+
+    def __repr__(self):
+        return (
+            f"<Edge level={self.level}, predecessor_id={self.predecessor_id},"
+            f"successor_id={self.successor_id}>"
+        )
+
+
+class EdgeLog(Base):  # type: ignore
+    # Filled by triggers on `edges`, every insert or delete bumps the generation
+    __tablename__ = "edge_log"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    generation = Column(Integer, primary_key=True)
+    level = Column(String(8), nullable=False)
+    predecessor_id = Column(String(16), nullable=False)
+    successor_id = Column(String(16), nullable=False)
+    deleted = Column(Boolean, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<EdgeLog generation={self.generation}, level={self.level},"
+            f"predecessor_id={self.predecessor_id}, successor_id={self.successor_id},"
+            f"deleted={self.deleted}>"
+        )
+
 
 class File(Base):  # type: ignore
     __tablename__ = "files"
@@ -12,8 +64,24 @@ class File(Base):  # type: ignore
     id = Column(String(8), primary_key=True)
     path = Column(String(64), unique=True, index=True, nullable=False)
     records = relationship("Record", backref="file")
-    predecessor_ids = Column(Text, default="[]")
-    successor_ids = Column(Text, default="[]")
+    predecessor_edges = relationship(
+        "Edge",
+        primaryjoin=f"and_(File.id == foreign(Edge.successor_id), Edge.level == '{FILE_LEVEL}')",
+        viewonly=True,
+    )
+    successor_edges = relationship(
+        "Edge",
+        primaryjoin=f"and_(File.id == foreign(Edge.predecessor_id), Edge.level == '{FILE_LEVEL}')",
+        viewonly=True,
+    )
+
+    @property
+    def predecessor_ids(self) -> List[str]:
+        return sorted(edge.predecessor_id for edge in self.predecessor_edges)
+
+    @property
+    def successor_ids(self) -> List[str]:
+        return sorted(edge.successor_id for edge in self.successor_edges)
 
     def __repr__(self):
         return (
@@ -28,8 +96,24 @@ class Record(Base):  # type: ignore
     id = Column(String(16), primary_key=True)
     file_id = Column(String(8), ForeignKey("files.id"))
     commit_id = Column(String(40), nullable=False)
-    predecessor_ids = Column(Text, default="[]")
-    successor_ids = Column(Text, default="[]")
+    predecessor_edges = relationship(
+        "Edge",
+        primaryjoin=f"and_(Record.id == foreign(Edge.successor_id), Edge.level == '{RECORD_LEVEL}')",
+        viewonly=True,
+    )
+    successor_edges = relationship(
+        "Edge",
+        primaryjoin=f"and_(Record.id == foreign(Edge.predecessor_id), Edge.level == '{RECORD_LEVEL}')",
+        viewonly=True,
+    )
+
+    @property
+    def predecessor_ids(self) -> List[str]:
+        return sorted(edge.predecessor_id for edge in self.predecessor_edges)
+
+    @property
+    def successor_ids(self) -> List[str]:
+        return sorted(edge.successor_id for edge in self.successor_edges)
 
     def __repr__(self):
         return (
@@ -45,6 +129,7 @@ class Pipeline(Base):  # type: ignore
     id = Column(String(8), primary_key=True)
     description = Column(Text)
     file_id_lists = Column(Text, default="[]")
+    fingerprint = Column(String(64), unique=True, index=True)
     experiments = relationship("Experiment", backref="pipeline")
 
     def __repr__(self):
@@ -54,6 +139,21 @@ class Pipeline(Base):  # type: ignore
         )
 
 
+class PipelineFile(Base):  # type: ignore
+    __tablename__ = "pipeline_files"
+    __table_args__ = (Index("ix_pipeline_files_file", "file_id", "pipeline_id"),)
+
+    pipeline_id = Column(String(8), ForeignKey("pipelines.id"), primary_key=True)
+    stage = Column(Integer, primary_key=True)
+    file_id = Column(String(8), ForeignKey("files.id"), primary_key=True)
+
+    def __repr__(self):
+        return (
+            f"<PipelineFile pipeline_id={self.pipeline_id}, stage={self.stage},"
+            f"file_id={self.file_id}>"
+        )
+
+
 class Experiment(Base):  # type: ignore
     __tablename__ = "experiments"
 
@@ -64,6 +164,10 @@ class Experiment(Base):  # type: ignore
     config = Column(Text, default="{}")
     hparams = Column(Text, default="{}")
     metrics = Column(Text, default="{}")
+    # Wall/CPU time, peak RSS, I/O and timed sections, see instrument.ResourceMonitor
+    resources = Column(Text, default="{}")
+    # Hash of script/input contents, config and hparams, see executor.get_memo_key
+    memo_key = Column(String(64), index=True)
 
     def __repr__(self):
         return (
@@ -71,3 +175,44 @@ class Experiment(Base):  # type: ignore
             f"pipeline_id={self.pipeline_id}, node_id_lists={self.node_id_lists},"
             f"config={self.config}, hparams={self.hparams}, metrics={self.metrics}>"
         )
+
+
+class ExperimentNode(Base):  # type: ignore
+    __tablename__ = "experiment_nodes"
+    __table_args__ = (Index("ix_experiment_nodes_node", "node_id", "experiment_id"),)
+
+    experiment_id = Column(String(16), ForeignKey("experiments.id"), primary_key=True)
+    stage = Column(Integer, primary_key=True)
+    node_id = Column(String(16), ForeignKey("Records.id"), primary_key=True)
+
+    def __repr__(self):
+        return (
+            f"<ExperimentNode experiment_id={self.experiment_id}, stage={self.stage},"
+            f"node_id={self.node_id}>"
+        )
+
+
+class ExperimentValue(Base):  # type: ignore
+    __tablename__ = "experiment_values"
+    __table_args__ = (
+        Index("ix_experiment_values_number", "kind", "key", "number"),
+        Index("ix_experiment_values_string", "kind", "key", "string"),
+        # Clustered on the primary key so both indexes cover experiment_id
+        {"sqlite_with_rowid": False},
+    )
+
+    experiment_id = Column(String(16), ForeignKey("experiments.id"), primary_key=True)
+    kind = Column(String(8), primary_key=True)
+    key = Column(String(128), primary_key=True)
+    number = Column(Float)
+    string = Column(Text)
+
+    @property
+    def value(self):
+        return self.string if self.number is None else self.number
+
+    def __repr__(self):
+        return (
+            f"<ExperimentValue experiment_id={self.experiment_id}, kind={self.kind},"
+            f"key={self.key}, number={self.number}, string={self.string}>"
+        )
@@ -1,12 +1,99 @@
 import os
+import sys
+import copy
 import json
+import queue
+import atexit
+import threading
 import click
+from contextlib import nullcontext
+from datetime import datetime
 from inspect import getfile
-from typing import List, Optional
+from os.path import abspath, basename, dirname, exists
+from typing import Any, Callable, Counter, List, Optional, Tuple
 from functools import wraps
+from git import Repo
+from sqlalchemy.orm import Session
+from .orm import Experiment
 from .database import initialize_db, get_experiment
 from .init import initialize_uatu, get_uatu_config
 from .git import get_repo
+from .logger import get_logger
+from .metrics import MetricWriter, get_series_dir
+from .instrument import (
+    PROFILE_INTERVAL,
+    ResourceMonitor,
+    SamplingProfiler,
+    dump_folded,
+    get_profile_file,
+)
+from .distributed import (
+    RANK_TIMEOUT,
+    RankCoordinator,
+    RankWorker,
+    get_local_rank,
+    get_rank,
+    get_rank_address,
+    get_rank_authkey,
+    merge_rank_results,
+)
+from .executor import Step, get_cached_experiment, get_memo_key
+from .utils import dump_json, get_relative_path, id_generator
+
+# Description template used by batch jobs, e.g. "sweep {hparams[lr]}"
+DESCRIPTION_ENV = "UATU_DESCRIPTION"
+# Used when there is neither a description nor a terminal to ask for one
+DEFAULT_DESCRIPTION = "{script} at {time}"
+# Set by `uatu sweep`: JSON hparams of the trial, overriding those of Run, and
+# the file the trial's result goes to, the sweep records it. `uatu pipeline run`
+# sets the result file of its steps too
+HPARAMS_ENV = "UATU_HPARAMS"
+RESULT_ENV = "UATU_RESULT_FILE"
+# Set next to the result file unless the batch is forced: the database Run
+# looks up its memo key in, a hit is handed over instead of running
+CACHE_ENV = "UATU_CACHE_DATABASE"
+
+logger = get_logger()
+
+
+class Recorder(object):
+    # Saves experiments on a background thread. The thread is a daemon so it
+    # never keeps the process alive, pending saves are flushed at exit instead.
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._work, name="uatu-recorder", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, func: Callable, *args, **kwargs):
+        self._queue.put((func, args, kwargs))
+
+    def flush(self):
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception("Uatu failed to record the experiment")
+            finally:
+                self._queue.task_done()
+
+
+_recorder: Optional[Recorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> Recorder:
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = Recorder()
+    return _recorder
 
 
 class Run(object):
@@ -16,16 +103,91 @@ class Run(object):
         output_files: List[str] = [],
         config: Optional[dict] = None,
         hparams: Optional[dict] = None,
+        description: Optional[str] = None,
+        background: bool = False,
+        instrument: bool = False,
+        profile: bool = False,
+        profile_interval: float = PROFILE_INTERVAL,
+        rank_timeout: Optional[float] = RANK_TIMEOUT,
+        cache: bool = False,
     ):
-        self.description = click.prompt(
-            "Please describe this experiment carefully", type=str
-        )
+        # `description` may be a template with {script}, {time}, {config[...]}
+        # and {hparams[...]} fields, $UATU_DESCRIPTION is used when it is None.
+        # `instrument` stores the cost of the run as the experiment's resources,
+        # `profile` samples its stacks into a flamegraph file next to the series.
+        # Under a multi-process launcher only rank 0 records the experiment, the
+        # other ranks of its node stream to it and it waits `rank_timeout`
+        # seconds for them. Ranks on other nodes run without reporting.
+        # With `cache`, a single-process run whose script, input contents, config
+        # and hparams were already recorded returns the recorded metrics instead
+        # of running, with its output files restored. Under `uatu sweep` and
+        # `uatu pipeline run` the batch decides, the key is the same.
+        self.description = description
         self.input_files = input_files
         self.output_files = output_files
         self.config = config
         self.hparams = hparams
+        if os.environ.get(HPARAMS_ENV):
+            self.hparams = {**(hparams or {}), **json.loads(os.environ[HPARAMS_ENV])}
+        self.background = background
+        self.instrument = instrument
+        self.profile = profile
+        self.profile_interval = profile_interval
+        self.rank_timeout = rank_timeout
+        self.cache = cache
+        self._writer: Optional[MetricWriter] = None
+        self._monitor: Optional[ResourceMonitor] = None
+        self._worker: Optional[RankWorker] = None
+
+    def get_description(self, script_path: str) -> str:
+        template = self.description or os.environ.get(DESCRIPTION_ENV)
+        if template is None:
+            if sys.stdin.isatty():
+                return click.prompt(
+                    "Please describe this experiment carefully", type=str
+                )
+            template = DEFAULT_DESCRIPTION
+        return template.format(
+            script=basename(script_path),
+            time=datetime.now().isoformat(timespec="seconds"),
+            config=self.config or {},
+            hparams=self.hparams or {},
+        )
+
+    def _get_writer(self) -> MetricWriter:
+        # Buffered in experiment_dir, the file is named after the experiment on save
+        if self._writer is None:
+            series_dir = get_series_dir(
+                get_uatu_config()["experiment_dir"], f"run-{id_generator(salt='run')}"
+            )
+            self._writer = MetricWriter(series_dir)
+        return self._writer
+
+    def log(self, step: int, **metrics):
+        if self._worker is not None:
+            self._worker.log(step, **metrics)
+        else:
+            self._get_writer().log(step, **metrics)
 
-    def save(self, script_path, metrics: dict = {}):
+    def section(self, name: str):
+        # Times a block of the run, e.g. `with run.section("eval"):`, only
+        # recorded when `instrument` is set
+        if self._monitor is None:
+            return nullcontext()
+        return self._monitor.section(name)
+
+    def save(
+        self,
+        script_path,
+        metrics: dict = {},
+        description: Optional[str] = None,
+        series_dir: Optional[str] = None,
+        resources: Optional[dict] = None,
+        profile_file: Optional[str] = None,
+        memo_key: Optional[str] = None,
+        sess: Optional[Session] = None,
+        repo: Optional[Repo] = None,
+    ) -> Experiment:
         file_lists = []
         if len(self.input_files) > 0:
             file_lists.append(self.input_files)
@@ -33,26 +195,217 @@ class Run(object):
         if len(self.output_files) > 0:
             file_lists.append(self.output_files)
 
-        sess = initialize_db(get_uatu_config()["database_file"])
-        repo = get_repo()
-        get_experiment(
+        own_sess = sess is None
+        if own_sess:
+            sess = initialize_db(get_uatu_config()["database_file"])
+        repo = repo or get_repo()
+        experiment = get_experiment(
             sess=sess,
             repo=repo,
-            description=self.description,
+            description=description or self.get_description(script_path),
             file_lists=file_lists,
             config=self.config,
             hparams=self.hparams,
             metrics=metrics,
+            resources=resources,
+            memo_key=memo_key,
         )
+        if series_dir and exists(series_dir):
+            os.replace(series_dir, get_series_dir(dirname(series_dir), experiment.id))
+        if profile_file and exists(profile_file):
+            os.replace(
+                profile_file, get_profile_file(dirname(profile_file), experiment.id)
+            )
         sess.commit()
-        sess.close()
+        if own_sess:
+            sess.close()
+        return experiment
+
+    @staticmethod
+    def flush():
+        # Blocks until every experiment saved in the background is recorded
+        if _recorder is not None:
+            _recorder.flush()
+
+    def get_cached_experiment(
+        self, script_path: str, database_file: Optional[str]
+    ) -> Tuple[Optional[str], Optional[Experiment]]:
+        # Memo key of the run, on its config and hparams, and the experiment
+        # recorded under it in `database_file` with its outputs restored
+        repo = get_repo()
+
+        def relative(path):
+            return get_relative_path(abspath(path), repo.working_dir)
+
+        step = Step(
+            [relative(path) for path in self.input_files],
+            relative(script_path),
+            [relative(path) for path in self.output_files],
+        )
+        memo_key = get_memo_key(
+            repo, step.script, step.inputs, step.outputs, self.config, self.hparams
+        )
+        if memo_key is None or database_file is None:
+            return memo_key, None
+        sess = initialize_db(database_file)
+        try:
+            experiment = get_cached_experiment(sess, repo, step, memo_key)
+            if experiment is not None:
+                click.echo(f"Uatu reused experiment {experiment.id}", err=True)
+            return memo_key, experiment
+        finally:
+            sess.close()
+
+    def _measure(
+        self, func: Callable, *args, **kwargs
+    ) -> Tuple[Any, Optional[dict], Optional[Counter]]:
+        # Return value, resources and profile samples of func
+        profiler = None
+        if self.profile:
+            profiler = SamplingProfiler(interval=self.profile_interval)
+            profiler.start()
+        if self.instrument:
+            self._monitor = ResourceMonitor()
+            self._monitor.start()
+        try:
+            metrics = func(*args, **kwargs)
+        finally:
+            monitor, self._monitor = self._monitor, None
+            if profiler:
+                profiler.stop()
+        resources = monitor.stop() if monitor else None
+        return metrics, resources, profiler.samples if profiler else None
+
+    def _work(
+        self,
+        rank: int,
+        address: str,
+        authkey: bytes,
+        func: Callable,
+        *args,
+        **kwargs,
+    ):
+        # Ranks other than 0 send everything to rank 0 and record nothing
+        worker = RankWorker(address, rank, authkey=authkey)
+        worker.connect()
+        self._worker = worker
+        try:
+            result = self._measure(func, *args, **kwargs)
+        except BaseException:
+            worker.close()
+            raise
+        finally:
+            self._worker = None
+        if not worker.finish(result):
+            logger.warning(f"Uatu could not reach rank 0, rank {rank} is not recorded")
+        return result[0]
 
     def __call__(self, func):
         @wraps(func)
         def monitored_func(*args, **kwargs):
             func_file = getfile(func)
-            metrics = func(*args, **kwargs)
-            self.save(func_file, metrics)
-            return metrics
+            rank, world_size = get_rank()
+            memo_key = None
+            # Under a sweep or pipeline the key goes back with the result and
+            # the lookup is theirs to ask for
+            handing_over = bool(os.environ.get(RESULT_ENV))
+            if world_size == 1 and (self.cache or handing_over):
+                database_file = (
+                    os.environ.get(CACHE_ENV)
+                    if handing_over
+                    else get_uatu_config()["database_file"]
+                )
+                memo_key, experiment = self.get_cached_experiment(
+                    func_file, database_file
+                )
+                if experiment is not None:
+                    if handing_over:
+                        dump_json(
+                            {"memo_key": memo_key, "cached": experiment.id},
+                            os.environ[RESULT_ENV],
+                        )
+                    return json.loads(experiment.metrics)
+            coordinator = None
+            if world_size > 1:
+                local_rank = get_local_rank(rank, world_size)
+                if local_rank is None:  # Rank 0 runs on another node
+                    return func(*args, **kwargs)
+                rank, world_size = local_rank
+            if world_size > 1:
+                address = get_rank_address(
+                    abspath(get_uatu_config()["database_file"]), func_file
+                )
+                authkey = get_rank_authkey()
+                if rank > 0:
+                    return self._work(rank, address, authkey, func, *args, **kwargs)
+                coordinator = RankCoordinator(
+                    address, world_size, self._get_writer(), authkey
+                )
+                coordinator.start()
+            try:
+                # Asked before running, never after a long training job
+                description = self.get_description(func_file)
+                result = self._measure(func, *args, **kwargs)
+                returned = result[0]
+                if coordinator:
+                    lost = coordinator.gather(self.rank_timeout)
+                    if lost:
+                        logger.warning(f"Uatu got no result from ranks {lost}")
+                    result = merge_rank_results(result, coordinator.results)
+            finally:
+                if coordinator:
+                    coordinator.close()
+            metrics, resources, samples = result
+            profile_file = None
+            if samples is not None:
+                profile_file = get_profile_file(
+                    get_uatu_config()["experiment_dir"],
+                    f"run-{id_generator(salt='run')}",
+                )
+                dump_folded(samples, profile_file)
+            writer, self._writer = self._writer, None
+            series_dir = None
+            if writer:
+                writer.close()
+                series_dir = writer.series_dir
+            if os.environ.get(RESULT_ENV):
+                dump_json(
+                    {
+                        "script_path": abspath(func_file),
+                        "input_files": [abspath(path) for path in self.input_files],
+                        "output_files": [abspath(path) for path in self.output_files],
+                        "config": self.config,
+                        "hparams": self.hparams,
+                        "metrics": metrics,
+                        "resources": resources,
+                        "description": description,
+                        "series_dir": series_dir and abspath(series_dir),
+                        "profile_file": profile_file and abspath(profile_file),
+                        "memo_key": memo_key,
+                    },
+                    os.environ[RESULT_ENV],
+                )
+            elif self.background:
+                get_recorder().submit(
+                    self.save,
+                    func_file,
+                    copy.deepcopy(metrics),
+                    description,
+                    series_dir,
+                    resources=resources,
+                    profile_file=profile_file,
+                    memo_key=memo_key,
+                )
+            else:
+                self.save(
+                    func_file,
+                    metrics,
+                    description,
+                    series_dir,
+                    resources=resources,
+                    profile_file=profile_file,
+                    memo_key=memo_key,
+                )
+            return returned
 
-        return monitored_func
\ No newline at end of file
+        return monitored_func
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+import itertools
+import subprocess
+from collections import deque
+from os.path import abspath, join
+from typing import Any, Iterator, List, NamedTuple, Optional
+from git import Repo
+from sqlalchemy.orm import Session
+from .orm import Experiment
+from .executor import (
+    CACHED,
+    DONE,
+    FAILED,
+    find_memoized_experiment,
+    get_memo_key,
+    read_result,
+)
+from .run import CACHE_ENV, DESCRIPTION_ENV, HPARAMS_ENV, RESULT_ENV, Run
+
+GRID = "grid"
+RANDOM = "random"
+# Trials sampled by a random search without `num_trials`
+NUM_TRIALS = 10
+# Description of the experiments of trials, formatted like Run descriptions
+TRIAL_DESCRIPTION = "uatu sweep: {script} {hparams}"
+
+
+class Trial(NamedTuple):
+    index: int
+    hparams: dict
+    memo_key: str
+
+
+class TrialResult(NamedTuple):
+    trial: Trial
+    status: str
+    experiment: Optional[Experiment] = None
+    returncode: Optional[int] = None
+    log_file: Optional[str] = None
+
+
+def sample_value(rng: random.Random, name: str, values: Any) -> Any:
+    # A list is a choice, {min, max} a range (log-uniform with `log: true`,
+    # integer when both bounds are), anything else a fixed value
+    if isinstance(values, list):
+        return rng.choice(values)
+    if isinstance(values, dict):
+        if "min" not in values or "max" not in values:
+            raise ValueError(f"Range of '{name}' should have a min and a max")
+        low, high = values["min"], values["max"]
+        if values.get("log"):
+            return math.exp(rng.uniform(math.log(low), math.log(high)))
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+    return values
+
+
+def expand_sweep(spec: dict) -> List[dict]:
+    # Spec: {method: grid|random, parameters: {name: values}, num_trials, seed}.
+    # Random searches are seeded (0 by default) so a rerun yields the same trials.
+    method = spec.get("method", GRID)
+    parameters = spec.get("parameters") or {}
+    if method == GRID:
+        names, choices = [], []
+        for name, values in parameters.items():
+            if isinstance(values, dict):
+                raise ValueError(f"Grid search needs a list of values for '{name}'")
+            names.append(name)
+            choices.append(values if isinstance(values, list) else [values])
+        return [dict(zip(names, values)) for values in itertools.product(*choices)]
+    if method == RANDOM:
+        rng = random.Random(spec.get("seed", 0))
+        return [
+            {
+                name: sample_value(rng, name, values)
+                for name, values in parameters.items()
+            }
+            for _ in range(spec.get("num_trials", NUM_TRIALS))
+        ]
+    raise ValueError(f"Unknown sweep method '{method}', use '{GRID}' or '{RANDOM}'")
+
+
+def get_trial_log_file(log_dir: str, script: str, index: int) -> str:
+    return join(log_dir, f"sweep_{script.replace(os.sep, '_')}_{index:03d}.log")
+
+
+def record_trial(
+    sess: Session,
+    repo: Repo,
+    script: str,
+    inputs: List[str],
+    outputs: List[str],
+    trial: Trial,
+    result: Optional[dict],
+) -> Experiment:
+    # Records what the trial's Run handed over, under the memo key of the Run,
+    # or the bare trial when the script does not use Run
+    if result:
+        run = Run(
+            result["input_files"],
+            result["output_files"],
+            result["config"],
+            result["hparams"],
+        )
+        return run.save(
+            result["script_path"],
+            result["metrics"],
+            result["description"],
+            result["series_dir"],
+            resources=result["resources"],
+            profile_file=result["profile_file"],
+            memo_key=result.get("memo_key") or trial.memo_key,
+            sess=sess,
+            repo=repo,
+        )
+    run = Run(inputs, outputs, hparams=trial.hparams)
+    description = TRIAL_DESCRIPTION.format(script=script, hparams=trial.hparams)
+    return run.save(
+        script, {}, description, memo_key=trial.memo_key, sess=sess, repo=repo
+    )
+
+
+def run_sweep(
+    sess: Session,
+    repo: Repo,
+    script: str,
+    trials: List[dict],
+    inputs: List[str] = [],
+    outputs: List[str] = [],
+    max_workers: int = 1,
+    log_dir: Optional[str] = None,
+    force: bool = False,
+    poll_interval: float = 0.05,
+) -> Iterator[TrialResult]:
+    # Runs `script` once per hparams of `trials`, at most `max_workers` at a
+    # time. A trial is skipped when an experiment of the same script and input
+    # contents and hparams exists, so rerunning an interrupted sweep only runs
+    # the trials it did not finish, and a trial using Run is reused by its Run
+    # on its config too. Experiments are recorded in this process,
+    # one at a time, trials never commit concurrently.
+    pending = deque()
+    memo_keys = set()
+    for index, hparams in enumerate(trials):
+        memo_key = get_memo_key(repo, script, inputs, outputs, hparams=hparams)
+        if memo_key is None:
+            raise ValueError(f"Can not read {script} or its inputs {inputs}")
+        if memo_key in memo_keys:  # Same hparams drawn twice
+            continue
+        memo_keys.add(memo_key)
+        trial = Trial(index, hparams, memo_key)
+        experiment = None if force else find_memoized_experiment(sess, memo_key)
+        if experiment:
+            yield TrialResult(trial, CACHED, experiment)
+        else:
+            pending.append(trial)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    result_dir = tempfile.mkdtemp(prefix="uatu-sweep-")
+    running = dict()
+    try:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                trial = pending.popleft()
+                result_file = join(result_dir, f"{trial.index}.json")
+                log_file = (
+                    get_trial_log_file(log_dir, script, trial.index)
+                    if log_dir
+                    else None
+                )
+                output = open(log_file, "w") if log_file else None
+                env = dict(os.environ)
+                env.setdefault(DESCRIPTION_ENV, TRIAL_DESCRIPTION)
+                env[HPARAMS_ENV] = json.dumps(trial.hparams)
+                env[RESULT_ENV] = result_file
+                env.pop(CACHE_ENV, None)
+                if not force:
+                    env[CACHE_ENV] = abspath(sess.bind.url.database)
+                process = subprocess.Popen(
+                    [sys.executable, script],
+                    cwd=repo.working_dir,
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    stdout=output,
+                    stderr=subprocess.STDOUT if output else None,
+                )
+                running[trial.index] = (trial, process, output, log_file, result_file)
+
+            finished = [
+                index
+                for index, (_, process, *_) in running.items()
+                if process.poll() is not None
+            ]
+            if not finished:
+                time.sleep(poll_interval)
+            for index in finished:
+                trial, process, output, log_file, result_file = running.pop(index)
+                if output:
+                    output.close()
+                result = read_result(result_file)
+                if process.returncode == 0 and result and "cached" in result:
+                    experiment = sess.query(Experiment).get(result["cached"])
+                    yield TrialResult(trial, CACHED, experiment, 0, log_file)
+                elif process.returncode == 0:
+                    experiment = record_trial(
+                        sess, repo, script, inputs, outputs, trial, result
+                    )
+                    yield TrialResult(trial, DONE, experiment, 0, log_file)
+                else:
+                    yield TrialResult(trial, FAILED, None, process.returncode, log_file)
+    finally:
+        for _, process, output, *_ in running.values():
+            process.kill()
+            if output:
+                output.close()
+        shutil.rmtree(result_dir, ignore_errors=True)
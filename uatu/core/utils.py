@@ -1,6 +1,10 @@
 import hashlib
+import json
 import os
-from typing import Union
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Optional, Union, Sequence, Iterator, Tuple
 
 
 def id_generator(len: int = 8, salt: str = "test") -> str:
@@ -15,5 +19,80 @@ def get_relative_path(path: str, cwd: str = os.getcwd()) -> str:
         return os.path.relpath(path, cwd)
 
 
+def get_fingerprint(obj) -> str:
+    # Canonical content hash, independent of key order and JSON whitespace
+    canonical = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def flatten_dict(values: dict, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from flatten_dict(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def split_typed_value(value: Any) -> Tuple[Optional[float], Optional[str]]:
+    # Numbers (and booleans) go to the numeric column, anything else is text
+    if isinstance(value, (bool, int, float)):
+        return float(value), None
+    if isinstance(value, str):
+        return None, value
+    if value is None:
+        return None, None
+    return None, json.dumps(value)
+
+
+def dump_json(obj: Any, file_path: str):
+    # Write to a private temp file first so readers never see a partial file,
+    # one per call since threads of a process may write the same file
+    fd, temp_file = tempfile.mkstemp(
+        prefix=os.path.basename(file_path) + ".", dir=os.path.dirname(file_path) or "."
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f)
+        os.replace(temp_file, file_path)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+
+@contextmanager
+def file_lock(file_path: str) -> Iterator[None]:
+    # Held by one process (or open file) at a time, the OS releases it when
+    # its holder dies
+    with open(file_path, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
 def check_file_exists(file_path: str) -> bool:
     pass
+
+
+def chunks(items: Sequence, size: int = 500) -> Iterator[Sequence]:
+    # Keeps `IN (...)` clauses below SQLite's bound parameter limit
+    for start in range(0, len(items), size):
+        yield items[start : start + size]